@@ -3,16 +3,36 @@
 Usage:
   python app_cli.py --data ./DATA --players all
   python app_cli.py --data ./DATA --players player1,player2
+  python app_cli.py --data ./DATA --segment-engine reference   # 원본 세그먼트 엔진으로 비교
+  python app_cli.py --data ./DATA --workers 8   # 파일별 파싱/분할을 프로세스 풀로
+  python app_cli.py --data ./DATA --stream      # 파일 하나씩 처리 (메모리 상한 = 가장 큰 파일)
+  python app_cli.py --data ./DATA --profile out.json   # 단계별 시간/행 수/메모리 변화 기록
+  python app_cli.py --data ./DATA --incremental # 바뀐 플레이어/스테이지 행만 다시 계산 (변경 없으면 바로 종료)
+  python app_cli.py --data ./DATA/2025-11-01 --service   # 조회 서비스가 떠 있으면 그 결과 사용
+  python app_cli.py --data ./DATA/2025-11-01 --attach ./.logviz_shared   # 최신 공유 스냅샷이 있으면 파싱 없이 매핑
+  python app_cli.py --data ./DATA/2025-11-01 --map parts/2025-11-01.json.gz              # 날짜 폴더 -> 부분 집계
+  python app_cli.py --data ./DATA/2025-11-01 --map parts/11-01.s0.json.gz --shard 0/4    # 플레이어 파일 4등분 중 0번
+  python app_cli.py --reduce parts/*.json.gz --out ./outputs   # 부분 집계들을 합쳐 같은 출력 생성
+  python app_cli.py --compress-logs ./DATA/2025-10-31 --cache-dir ./.logviz_cache   # 다 쓴 날짜 폴더를 .csv.zst로 압축
+  python app_cli.py --data ./DATA/2025-11-01 --retention segments --memory   # raw를 버리고 그랩 순서만 보관
+  python app_cli.py --cache-compact        # 디스크 캐시 정리 후 종료
+  python app_cli.py --cache-invalidate     # 디스크 캐시 전체 무효화 후 종료
 Outputs CSVs to ./outputs/
 """
 import argparse
 from pathlib import Path
 import pandas as pd
-from src.cache_manager import CacheManager
+from src import archive, incremental, partials, profiler
+from src.query_service import DEFAULT_URL, QueryClient, ServiceUnavailable
+from src.cache_manager import RETENTION_MODES, CacheManager, result_stamp
+from src.shared_store import attach, snapshot_options
+from src.disk_cache import DiskCache
+from src.streaming import StreamingAggregator, iter_player_frames
+from src.segment_builder import SEGMENT_ENGINES
+from src.parser import filename_to_player_id, scan_logs
 from src.aggregator import (
-    global_stage_means,
     personal_stage_exit_counts,
-    earliest_3_distinct_grabs_for_stage_with_policy,
+    first_grab_top3_all,
 )
 
 def main():
@@ -20,38 +40,211 @@ def main():
     ap.add_argument("--data", default="./DATA")
     ap.add_argument("--players", default="all")
     ap.add_argument("--out", default="./outputs")
+    ap.add_argument("--segment-engine", default="vectorized", choices=SEGMENT_ENGINES)
+    ap.add_argument("--cache-dir", default="./.logviz_cache")
+    ap.add_argument("--no-cache", action="store_true", help="디스크 캐시를 사용하지 않음")
+    ap.add_argument("--cache-invalidate", action="store_true", help="디스크 캐시 전체 무효화 후 종료")
+    ap.add_argument("--cache-compact", action="store_true", help="낡은 캐시 항목/파일 정리 후 종료")
+    ap.add_argument("--workers", type=int, default=0, help="파싱/분할 프로세스 수 (0/1: 순차)")
+    ap.add_argument("--load-stats", action="store_true", help="파일별 파싱 속도(rows/sec) 출력")
+    ap.add_argument("--stream", action="store_true",
+                    help="파일을 하나씩 파싱/분할/누적하고 raw를 바로 버림 (출력은 같음)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="출력 폴더의 manifest와 입력 지문을 비교해 바뀐 플레이어/스테이지 행만 다시 계산")
+    ap.add_argument("--profile", metavar="OUT_JSON",
+                    help="파싱/분할/집계 단계별 시간, 행 수, 메모리 변화를 JSON으로 저장")
+    ap.add_argument("--service", nargs="?", const=DEFAULT_URL, metavar="URL",
+                    help=f"조회 서비스(기본 {DEFAULT_URL})가 같은 데이터/옵션으로 떠 있으면 그 결과를 사용")
+    ap.add_argument("--attach", metavar="SHARED_DIR",
+                    help="공유 스냅샷 폴더: 입력이 그대로인 스냅샷이 있으면 매핑해 사용, 없으면 직접 읽고 내보냄")
+    ap.add_argument("--map", metavar="PARTIAL",
+                    help="--data 폴더(또는 --shard 구간)를 부분 집계 파일로 저장 (.gz면 압축)")
+    ap.add_argument("--shard", metavar="I/N", type=partials.parse_shard,
+                    help="--map 대상: 파일 목록을 N개 연속 구간으로 나눈 I번째 (0부터)")
+    ap.add_argument("--reduce", nargs="+", metavar="PARTIAL",
+                    help="부분 집계 파일들을 합쳐 --out에 출력 (app_cli 기본 실행과 같은 CSV)")
+    ap.add_argument("--compress-logs", nargs="+", metavar="DATE_DIR",
+                    help="날짜 폴더의 평문 로그를 제자리에서 압축 후 종료 (디스크 캐시 항목은 압축본으로 옮김)")
+    ap.add_argument("--codec", default="zstd", choices=sorted(archive.CODECS),
+                    help="--compress-logs 압축 방식")
+    ap.add_argument("--min-age", type=float, default=3600, metavar="SECONDS",
+                    help="--compress-logs: 이 시간 안에 바뀐 파일(아직 쓰는 중일 수 있음)은 건너뜀")
+    ap.add_argument("--retention", default="full", choices=RETENTION_MODES,
+                    help="raw 보관 방식 (segments: 분할 후 raw 대신 세그먼트별 그랩 순서만 보관, 출력은 같음)")
+    ap.add_argument("--memory", action="store_true", help="보관 중인 raw/그랩 표/세그먼트 메모리 출력")
     args = ap.parse_args()
+    if args.incremental and args.stream:
+        ap.error("--incremental and --stream cannot be combined")
+    if args.map and args.reduce:
+        ap.error("--map and --reduce cannot be combined")
+    if args.shard and not args.map:
+        ap.error("--shard requires --map")
+    if args.attach and args.retention != "full":
+        ap.error("--attach requires --retention full")
 
-    cm = CacheManager(args.data)
-    cm.initial_load()
+    if args.compress_logs:
+        dc = None if args.no_cache else DiskCache(args.cache_dir)
+        for d in args.compress_logs:
+            r = archive.compress_folder(Path(d), codec=args.codec, min_age_seconds=args.min_age, disk_cache=dc)
+            ratio = r["bytes_before"] / r["bytes_after"] if r["bytes_after"] else 0
+            print(f"{d}: compressed {r['compressed']} files ({r['bytes_before']:,} -> {r['bytes_after']:,} bytes, "
+                  f"{ratio:.1f}x), skipped {r['skipped']}")
+        return
+
+    if args.cache_invalidate or args.cache_compact:
+        dc = DiskCache(args.cache_dir)
+        if args.cache_invalidate:
+            dc.invalidate()
+        dropped, removed = dc.compact()
+        print(f"Cache {args.cache_dir}: dropped {dropped} entries, removed {removed} files")
+        return
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    outdir = Path(args.out)
+    if args.profile:
+        profiler.enable()
+    if args.map:
+        run_map(args, cache_dir)
+    elif args.reduce:
+        agg = partials.reduce_partials([Path(p) for p in args.reduce])
+        write_outputs(outdir, agg.global_stage_means(), agg.personal_exit_counts(),
+                      agg.first_grab_top3())
+    elif args.incremental:
+        run_incremental(args, cache_dir, outdir)
+    elif args.stream:
+        run_stream(args, cache_dir, outdir)
+    else:
+        run_batch(args, cache_dir, outdir)
+    if args.profile:
+        profiler.dump(args.profile)
+        print(profiler.summary().to_string(index=False))
+        print(f"Profile saved to {args.profile}")
+
+def run_batch(args, cache_dir: str | None, outdir: Path):
+    """기본 경로: CacheManager로 전부 읽은 뒤 이어 붙인 세그먼트로 집계합니다."""
+    if args.service and run_via_service(args, outdir):
+        return
+    cm = None
+    if args.attach:
+        cm = attach(args.attach, args.data, snapshot_options("*.csv", True, args.segment_engine))
+        if cm is not None:
+            print(f"[shared] Attached {len(cm.seg_by_player)} players from {cm.dir}")
+    if cm is None:
+        cm = CacheManager(args.data, segment_engine=args.segment_engine, cache_dir=cache_dir,
+                          workers=args.workers, shared_dir=args.attach, retention=args.retention)
+        cm.initial_load()
+    if args.load_stats:
+        for path, st in sorted(cm.load_stats.items()):
+            mode = "fast" if st["fast_path"] else "general"
+            print(f"[parse] {path.name}: {st['rows']} rows in {st['seconds']:.3f}s "
+                  f"({st['rows_per_sec']:,.0f} rows/s, {mode})")
     players = cm.players() if args.players == "all" else args.players.split(",")
 
     segs = cm.all_segments()
     segs_sel = segs[segs["PlayerID"].isin(players)] if players else segs.iloc[0:0]
 
-    outdir = Path(args.out); outdir.mkdir(parents=True, exist_ok=True)
-
-    # 전역 평균
-    global_df = global_stage_means(segs_sel)
-    global_df.to_csv(outdir/"global_stage_means.csv", index=False, encoding="utf-8")
-
+    # 전역 평균 (플레이어별 부분 집계 병합)
+    global_df = cm.stage_store.global_stage_means(players)
     # 개인: 포기 합계
     personal_exit = personal_stage_exit_counts(segs_sel, players)
-    personal_exit.to_csv(outdir/"personal_exit_counts.csv", index=False, encoding="utf-8")
-
     # 스테이지별 First-Grab TOP3 (정책: earliest)
-    raw_all = cm.all_raw()
-    rows = []
-    for stg in sorted(segs_sel["stage"].dropna().unique().tolist()):
-        top3 = earliest_3_distinct_grabs_for_stage_with_policy(
-            raw_all, stage=stg, selected_players=players, policy="earliest", exclude_roots=True
-        )
-        if not top3.empty:
-            top3["stage"] = stg
-            rows.append(top3)
-    top_all = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=["rank","object_name","timestamp","dt_from_begin","PlayerID","stage"])
-    top_all.to_csv(outdir/"first_grab_top3_by_stage.csv", index=False, encoding="utf-8")
+    top_all = first_grab_top3_all(segs_sel, cm.grab_source(), players, policies=("earliest",))
+    write_outputs(outdir, global_df, personal_exit, top_all)
+    if args.memory:
+        mem = cm.memory_breakdown()
+        print(f"Memory [{mem['retention']}]: " + ", ".join(
+            f"{k} {format_bytes(mem[k])}" for k in ("raw", "grabs", "segments", "snapshots")))
 
+def format_bytes(n: int) -> str:
+    """바이트 수 -> 작은 값도 0으로 뭉개지지 않는 단위 (B / KB / MB)"""
+    if n < 2**10:
+        return f"{n} B"
+    if n < 2**20:
+        return f"{n / 2**10:.1f} KB"
+    return f"{n / 2**20:.2f} MB"
+
+def run_via_service(args, outdir: Path) -> bool:
+    """
+    --service: 서비스가 --data의 부모 폴더를 DATA 루트로, 같은 세그먼트 옵션으로 떠 있으면
+    --data 날짜 파티션을 서비스에 조회해 출력합니다. 쓸 수 없으면 False (직접 로딩으로 대체).
+    """
+    client = QueryClient(args.service)
+    data = Path(args.data).resolve()
+    try:
+        opts = client.status(timeout=1.0)["options"]
+    except ServiceUnavailable:
+        print(f"[service] {args.service} is not running; loading directly")
+        return False
+    if (opts["data_root"] != str(data.parent) or opts["file_pattern"] != "*.csv"
+            or opts["segment_engine"] != args.segment_engine or not opts["assume_orphan"]):
+        print(f"[service] {args.service} serves different data/options; loading directly")
+        return False
+    players = None if args.players == "all" else args.players.split(",")
+    try:
+        global_df = client.query(data.name, "global_stage_means", players)
+        personal_exit = client.query(data.name, "personal_exit_counts", players)
+        top_all = client.query(data.name, "first_grab_top3", players, policies=["earliest"])
+    except (ServiceUnavailable, LookupError, RuntimeError) as e:
+        print(f"[service] Query failed ({e}); loading directly")
+        return False
+    print(f"[service] Results for {data.name} from {args.service}")
+    write_outputs(outdir, global_df, personal_exit, top_all)
+    return True
+
+def run_stream(args, cache_dir: str | None, outdir: Path):
+    """--stream: 파일 단위 제너레이터 파이프라인. 한 번에 raw 하나만 메모리에 둡니다."""
+    wanted = None if args.players == "all" else set(args.players.split(","))
+    paths = (p for p in scan_logs(Path(args.data))
+             if wanted is None or filename_to_player_id(p) in wanted)
+    agg = StreamingAggregator()
+    frames = iter_player_frames(paths, segment_engine=args.segment_engine,
+                                disk_cache=DiskCache(cache_dir) if cache_dir else None)
+    for pid, raw, seg in frames:
+        agg.add(pid, raw, seg)
+        del raw, seg
+    write_outputs(outdir, agg.global_stage_means(), agg.personal_exit_counts(),
+                  agg.first_grab_top3())
+
+def run_map(args, cache_dir: str | None):
+    """--map: --stream과 같은 파일 단위 누적 후, 출력 대신 누적 상태를 부분 집계 파일로 저장합니다."""
+    wanted = None if args.players == "all" else set(args.players.split(","))
+    paths = partials.shard_paths(scan_logs(Path(args.data)), args.shard)
+    paths = [p for p in paths if wanted is None or filename_to_player_id(p) in wanted]
+    agg = StreamingAggregator()
+    frames = iter_player_frames(paths, segment_engine=args.segment_engine,
+                                disk_cache=DiskCache(cache_dir) if cache_dir else None)
+    for pid, raw, seg in frames:
+        agg.add(pid, raw, seg)
+        del raw, seg
+    partials.write_partial(Path(args.map), agg, Path(args.data), args.shard,
+                           partials.partial_options(args.players, args.segment_engine), len(paths))
+    print(f"Partial for {len(paths)} files saved to {args.map}")
+
+def run_incremental(args, cache_dir: str | None, outdir: Path):
+    """--incremental: manifest 기준으로 바뀐 입력이 없으면 바로 끝내고, 있으면 영향받는 행만 갱신합니다."""
+    paths = scan_logs(Path(args.data))  # CacheManager와 같은 순서
+    options = {"data": str(Path(args.data).resolve()), "players": args.players,
+               "segment_engine": args.segment_engine, "version": result_stamp(True)}
+    full, changed, files = incremental.plan(outdir, paths, options)
+    wanted = None if args.players == "all" else set(args.players.split(","))
+    affected = changed if wanted is None else changed & wanted
+    if full:
+        run_batch(args, cache_dir, outdir)
+    elif affected:
+        write_outputs(outdir, *incremental.recompute(
+            outdir, paths, wanted, affected, segment_engine=args.segment_engine,
+            disk_cache=DiskCache(cache_dir) if cache_dir else None))
+    else:
+        print(f"No input changes; outputs in {outdir} are up to date")
+    incremental.write_manifest(outdir, options, files)
+
+def write_outputs(outdir: Path, global_df: pd.DataFrame, personal_exit: pd.DataFrame,
+                  top_all: pd.DataFrame):
+    outdir.mkdir(parents=True, exist_ok=True)
+    global_df.to_csv(outdir/"global_stage_means.csv", index=False, encoding="utf-8")
+    personal_exit.to_csv(outdir/"personal_exit_counts.csv", index=False, encoding="utf-8")
+    top_all = top_all[["rank","object_name","timestamp","dt_from_begin","PlayerID","stage"]]
+    top_all.to_csv(outdir/"first_grab_top3_by_stage.csv", index=False, encoding="utf-8")
     print(f"Saved to {outdir}")
 
 if __name__ == "__main__":
@@ -0,0 +1,165 @@
+# bench.py
+"""
+Usage:
+  python bench.py generate --out ./bench_data --players 1000 --days 2 --events 1500
+  python bench.py run --players 200 --days 1                # 합성 데이터로 단계별 시간/처리량/메모리 측정
+  python bench.py run --players 200 --update-baseline       # 결과를 bench_baseline.json에 기준값으로 저장
+  python bench.py run --players 200 --threshold 0.25        # 기준값보다 25% 넘게 느린 단계가 있으면 exit 1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import pandas as pd
+from src.aggregator import global_stage_means
+from src.parser import load_csv, concat_frames
+from src.segment_builder import build_segments
+from src.synthetic import generate_dataset
+
+ROOT = Path(__file__).resolve().parent
+
+
+def _measure(fn, repeat: int) -> tuple[float, float, object]:
+    """(가장 빠른 실행 시간, tracemalloc 최대 메모리 MB, 마지막 결과). 메모리는 별도 1회 실행."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        out = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2**20, out
+
+
+def _run_cli(day_dirs: list[Path], extra: list[str]) -> tuple[float, float]:
+    """(걸린 시간, 자식 프로세스 최대 RSS MB). os.wait4가 없는 플랫폼(Windows)은 RSS가 nan."""
+    t0 = time.perf_counter()
+    peak = float("nan")
+    with tempfile.TemporaryDirectory() as out:
+        for d in day_dirs:
+            cmd = [sys.executable, str(ROOT / "app_cli.py"), "--data", str(d),
+                   "--out", out, "--no-cache", *extra]
+            if not hasattr(os, "wait4"):
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, cwd=ROOT)
+                continue
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, cwd=ROOT)
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd)
+            # ru_maxrss: Linux는 KB, macOS는 bytes
+            rss = usage.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+            peak = rss if peak != peak else max(peak, rss)
+    return time.perf_counter() - t0, peak
+
+
+def run_benchmarks(paths: list[Path], repeat: int = 3, cli: bool = True) -> dict[str, dict]:
+    """
+    단계별 결과 {stage: {seconds, items, per_sec, peak_mb}}.
+    parse/segment/aggregate는 프로세스 안에서(최대 메모리 = tracemalloc, Arrow 버퍼 제외),
+    cli/cli_stream은 app_cli.py를 날짜 폴더마다 실행합니다(최대 메모리 = 자식 최대 RSS).
+    """
+    results = {}
+    n_bytes = sum(p.stat().st_size for p in paths)
+
+    sec, peak, raws = _measure(lambda: [load_csv(p) for p in paths], repeat)
+    rows = sum(len(r) for r in raws)
+    results["parse"] = dict(seconds=sec, items=rows, per_sec=rows / sec, peak_mb=peak,
+                            mb_per_sec=n_bytes / 2**20 / sec)
+
+    sec, peak, segs = _measure(lambda: [build_segments(r) for r in raws], repeat)
+    results["segment"] = dict(seconds=sec, items=rows, per_sec=rows / sec, peak_mb=peak)
+
+    all_segs = concat_frames(segs)
+    sec, peak, _ = _measure(lambda: global_stage_means(all_segs), repeat)
+    results["aggregate"] = dict(seconds=sec, items=len(all_segs), per_sec=len(all_segs) / sec,
+                                peak_mb=peak)
+    del raws, segs, all_segs
+
+    if cli:
+        day_dirs = sorted({p.parent for p in paths})
+        for name, extra in (("cli", []), ("cli_stream", ["--stream"])):
+            runs = [_run_cli(day_dirs, extra) for _ in range(repeat)]
+            sec, peak = min(r[0] for r in runs), max(r[1] for r in runs)
+            results[name] = dict(seconds=sec, items=rows, per_sec=rows / sec, peak_mb=peak)
+    return results
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """기준값 대비 seconds가 (1 + threshold)배를 넘은 단계 이름 목록"""
+    return [stage for stage, r in results.items()
+            if stage in baseline and r["seconds"] > baseline[stage]["seconds"] * (1 + threshold)]
+
+
+def _print_table(results: dict[str, dict], baseline: dict[str, dict], regressed: list[str]):
+    rows = []
+    for stage, r in results.items():
+        base = baseline.get(stage, {}).get("seconds")
+        rows.append({
+            "stage": stage,
+            "seconds": round(r["seconds"], 4),
+            "items/s": f"{r['per_sec']:,.0f}",
+            "peak_mb": round(r["peak_mb"], 1),
+            "baseline_s": round(base, 4) if base else None,
+            "change": f"{r['seconds'] / base - 1:+.1%}" if base else "",
+            "flag": "REGRESSION" if stage in regressed else "",
+        })
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("generate", "run"):
+        p = sub.add_parser(name)
+        p.add_argument("--players", type=int, default=13)
+        p.add_argument("--days", type=int, default=1)
+        p.add_argument("--events", type=int, default=1500, help="파일당 대략적인 행 수")
+        p.add_argument("--seed", type=int, default=0)
+    gen, run = sub.choices["generate"], sub.choices["run"]
+    gen.add_argument("--out", default="./bench_data")
+    run.add_argument("--data", default="./bench_data", help="합성 데이터 위치 (없으면 생성)")
+    run.add_argument("--repeat", type=int, default=3, help="단계별 반복 횟수 (최솟값 사용)")
+    run.add_argument("--no-cli", action="store_true", help="app_cli.py 종단 측정 생략")
+    run.add_argument("--baseline", default="./bench_baseline.json")
+    run.add_argument("--update-baseline", action="store_true")
+    run.add_argument("--threshold", type=float, default=0.2, help="회귀로 볼 느려짐 비율")
+    args = ap.parse_args()
+
+    workload = dict(players=args.players, days=args.days, events=args.events, seed=args.seed)
+    if args.cmd == "generate":
+        paths = generate_dataset(Path(args.out), **workload)
+        print(f"Generated {len(paths)} files in {args.out}")
+        return
+
+    # 워크로드마다 폴더를 나눠 app_cli.py가 다른 크기의 데이터를 함께 읽지 않게 함
+    key = "p{players}_d{days}_e{events}_s{seed}".format(**workload)
+    paths = generate_dataset(Path(args.data) / key, **workload)
+    results = run_benchmarks(paths, repeat=args.repeat, cli=not args.no_cli)
+
+    baseline_path = Path(args.baseline)
+    baselines = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    baseline = baselines.get(key, {})
+    regressed = compare(results, baseline, args.threshold)
+    print(f"[bench] {key}: {len(paths)} files, {results['parse']['items']:,} rows")
+    _print_table(results, baseline, regressed)
+
+    if args.update_baseline:
+        baselines[key] = results
+        baseline_path.write_text(json.dumps(baselines, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Baseline saved to {baseline_path} ({key})")
+    elif regressed:
+        print(f"[bench] Regression (> {args.threshold:.0%} slower): {', '.join(regressed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
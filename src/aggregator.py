@@ -1,16 +1,19 @@
 from __future__ import annotations
+from collections.abc import Mapping
 import pandas as pd
 import numpy as np
+from .event_index import EventIndex
+from .grab_table import GrabTable
+from .parser import EVENT_CODES, event_codes
 from .segment_builder import build_segments
+from .segment_metrics import mean_metrics, means_columns
+from .sketches import DEFAULT_QUANTILES, SKETCH_COLUMNS, quantile_label
+from .profiler import profiled
 
+@profiled("aggregate.global_stage_means", rows=0)
 def global_stage_means(segs: pd.DataFrame) -> pd.DataFrame:
     if segs is None or segs.empty:
-        return pd.DataFrame(columns=[
-            "stage","n_players_used","mean_stage_play_time","mean_clear_time",
-            "mean_first_clear_star",
-            "mean_retry","mean_cam_total","mean_cam_move","mean_cam_rotate","mean_cam_pan",
-            "mean_grab_pair","mean_pushpull"
-        ])
+        return pd.DataFrame(columns=means_columns())
     g = {}
     g["n_players_used"]       = segs.groupby("stage")["PlayerID"].nunique()
     g["mean_stage_play_time"] = segs.groupby("stage")["stage_play_time"].mean(numeric_only=True)
@@ -25,18 +28,15 @@ def global_stage_means(segs: pd.DataFrame) -> pd.DataFrame:
     else:
         g["mean_first_clear_star"] = pd.Series(dtype=float)
 
-    g["mean_retry"]           = segs.groupby("stage")["retry_cnt"].mean(numeric_only=True)
-    g["mean_cam_move"]        = segs.groupby("stage")["cam_move_cnt"].mean(numeric_only=True)
-    g["mean_cam_rotate"]      = segs.groupby("stage")["cam_rotate_cnt"].mean(numeric_only=True)
-    g["mean_cam_pan"]         = segs.groupby("stage")["cam_pan_cnt"].mean(numeric_only=True)
-    g["mean_cam_total"]       = segs.groupby("stage")["cam_total_cnt"].mean(numeric_only=True)
-    g["mean_grab_pair"]       = segs.groupby("stage")["grab_pair_cnt"].mean(numeric_only=True)
-    g["mean_pushpull"]        = segs.groupby("stage")["pushpull_cnt"].mean(numeric_only=True)
+    # 등록된 지표 평균 (segment_metrics 등록표 순서)
+    for m in mean_metrics():
+        g[m.mean] = segs.groupby("stage")[m.column].mean(numeric_only=True)
 
     out = pd.concat(g, axis=1).reset_index()
     out.columns.name = None
     return out
 
+@profiled("aggregate.global_stage_exit_counts", rows=0)
 def global_stage_exit_counts(segs: pd.DataFrame, selected_players: list[str] | None) -> pd.DataFrame:
     if segs is None or segs.empty:
         return pd.DataFrame(columns=["stage","exit_sum"])
@@ -48,6 +48,7 @@ def global_stage_exit_counts(segs: pd.DataFrame, selected_players: list[str] | N
     out["exit_sum"] = out["exit_sum"].fillna(0).astype(int)
     return out
 
+@profiled("aggregate.personal_stage_exit_counts", rows=0)
 def personal_stage_exit_counts(segs: pd.DataFrame, selected_players: list[str] | None) -> pd.DataFrame:
     if segs is None or segs.empty:
         return pd.DataFrame(columns=["PlayerID","stage","exit_sum"])
@@ -59,6 +60,26 @@ def personal_stage_exit_counts(segs: pd.DataFrame, selected_players: list[str] |
     out["exit_sum"] = out["exit_sum"].fillna(0).astype(int)
     return out
 
+@profiled("aggregate.global_stage_quantiles", rows=0)
+def global_stage_quantiles(segs: pd.DataFrame,
+                           quantiles: tuple[float, ...] = DEFAULT_QUANTILES) -> pd.DataFrame:
+    """
+    스테이지별 SKETCH_COLUMNS 정확한 분위수 (검증용). 정렬된 값 중 floor(q*(n-1))번째
+    (interpolation="lower")라 StageAggregateStore.global_stage_quantiles 근사와 같은 기준입니다.
+    """
+    cols = ["stage"] + [quantile_label(c, q) for c in SKETCH_COLUMNS for q in quantiles]
+    df = segs[segs["stage"].notna()] if not segs.empty else segs
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    g = df.groupby("stage", sort=True)
+    out = pd.DataFrame({"stage": g.size().index.to_numpy(dtype=object)})
+    for c in SKETCH_COLUMNS:
+        values = df[c].astype(float).groupby(df["stage"], sort=True)
+        for q in quantiles:
+            out[quantile_label(c, q)] = values.quantile(q, interpolation="lower").to_numpy()
+    return out[cols]
+
+@profiled("aggregate.earliest_3_distinct_grabs_for_stage_with_policy", rows=0)
 def earliest_3_distinct_grabs_for_stage_with_policy(
     raw_all: pd.DataFrame,
     stage: str,
@@ -83,7 +104,7 @@ def earliest_3_distinct_grabs_for_stage_with_policy(
     pid = seg["PlayerID"]; t0 = seg["t_begin"]; t1 = seg["t_end"]
 
     win = df[(df["PlayerID"] == pid) & (df["timestamp"] >= t0) & (df["timestamp"] <= t1)].copy()
-    grabs = win[win["event"] == "InputGrab"].copy()
+    grabs = win[event_codes(win) == EVENT_CODES["InputGrab"]].copy()
     if exclude_roots:
         grabs = grabs[grabs["value"].astype(str).str.strip().str.lower() != "root"]
     if grabs.empty:
@@ -114,6 +135,108 @@ def _pick_segment_by_policy(segs: pd.DataFrame, policy: str) -> dict:
         seg = s.iloc[s["t_end"].values.argmax()]
     return seg.to_dict()
 
+FIRST_GRAB_POLICIES = ("earliest", "latest", "shortest_clear")
+TOP3_COLUMNS = ["policy","stage","rank","object_name","timestamp","dt_from_begin","PlayerID"]
+
+@profiled("aggregate.first_grab_top3_all", rows=0)
+def first_grab_top3_all(
+    segs: pd.DataFrame,
+    raw: GrabTable | EventIndex | Mapping[str, pd.DataFrame] | pd.DataFrame,
+    selected_players: list[str] | None = None,
+    policies: tuple[str, ...] = FIRST_GRAB_POLICIES,
+    exclude_roots: bool = True,
+) -> pd.DataFrame:
+    """
+    모든 스테이지 × 정책의 First-Grab TOP3를 한 번에 계산합니다.
+
+    earliest_3_distinct_grabs_for_stage_with_policy와 같은 규칙이지만
+    raw를 다시 분할하지 않고 이미 만든 세그먼트(CacheManager.seg_by_player를 이은 것)를 사용하며,
+    플레이어별 InputGrab 이벤트를 한 번만 뽑아 선택된 시도의 [t_begin, t_end] 구간을 이진 탐색으로 자릅니다.
+    raw는 EventIndex(InputGrab 행 위치를 색인에서 바로 꺼냄), {PlayerID: raw 프레임},
+    PlayerID 컬럼이 있는 raw 전체 프레임, 또는 GrabTable(segments 보관 모드, 세그먼트별 그랩 순서만 보관).
+    반환 컬럼: policy, stage, rank, object_name, timestamp, dt_from_begin, PlayerID
+    """
+    if segs is None or segs.empty:
+        return pd.DataFrame(columns=TOP3_COLUMNS)
+    s = segs[segs["t_end"].notna()]
+    if selected_players:
+        s = s[s["PlayerID"].isin(selected_players)]
+    if s.empty:
+        return pd.DataFrame(columns=TOP3_COLUMNS)
+    s = s.sort_values(["t_end","t_begin"], kind="mergesort")
+
+    picks = pd.concat([_pick_segments_by_policy(s, policy).sort_values("stage", kind="mergesort")
+                       .assign(policy=policy) for policy in policies], ignore_index=True)
+
+    if isinstance(raw, GrabTable):
+        return _top3_from_grab_table(picks, raw, exclude_roots)
+    grabs_by_player: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    rows = []
+    for pick in picks.itertuples(index=False):
+        pid = pick.PlayerID
+        if pid not in grabs_by_player:
+            grabs_by_player[pid] = _player_grabs(raw, pid, exclude_roots)
+        ts, names = grabs_by_player[pid]
+        t0 = np.datetime64(pick.t_begin, "ns")
+        lo = np.searchsorted(ts, t0, side="left")
+        hi = np.searchsorted(ts, np.datetime64(pick.t_end, "ns"), side="right")
+        seen = set()
+        for i in range(lo, hi):
+            if names[i] in seen:
+                continue
+            seen.add(names[i])
+            rows.append((pick.policy, pick.stage, len(seen), names[i], ts[i],
+                         (ts[i] - t0).astype(np.int64) / 1e9, pid))
+            if len(seen) == 3:
+                break
+    if not rows:
+        return pd.DataFrame(columns=TOP3_COLUMNS)
+    return pd.DataFrame(rows, columns=TOP3_COLUMNS)
+
+def _top3_from_grab_table(picks: pd.DataFrame, grabs: GrabTable, exclude_roots: bool) -> pd.DataFrame:
+    """first_grab_top3_all의 GrabTable 경로: 고른 세그먼트의 그랩 순서에서 앞 3개 (timestamp = t_begin + 오프셋)"""
+    rows = []
+    for pick in picks.itertuples(index=False):
+        names, offsets = grabs.sequence(pick.PlayerID, pick.t_begin, pick.t_end, exclude_roots)
+        t0 = np.datetime64(pick.t_begin, "ns")
+        for rank, (name, off) in enumerate(zip(names[:3], offsets[:3]), start=1):
+            rows.append((pick.policy, pick.stage, rank, name, t0 + np.timedelta64(int(off), "ns"),
+                         off / 1e9, pick.PlayerID))
+    if not rows:
+        return pd.DataFrame(columns=TOP3_COLUMNS)
+    return pd.DataFrame(rows, columns=TOP3_COLUMNS)
+
+def _pick_segments_by_policy(s: pd.DataFrame, policy: str) -> pd.DataFrame:
+    """
+    _pick_segment_by_policy의 스테이지별 일괄 버전. s는 t_end가 있는 세그먼트를
+    ["t_end","t_begin"]로 안정 정렬한 것이어야 하며, 동률은 s 순서상 먼저인 시도를 고릅니다.
+    """
+    if policy == "earliest":
+        return s.groupby("stage", sort=True).head(1)
+    latest = s[s["t_end"] == s.groupby("stage")["t_end"].transform("max")].groupby("stage").head(1)
+    if policy != "shortest_clear":
+        return latest
+    cleared = s[(s["cleared"] == True) & s["clear_time"].notna()]
+    cleared = cleared.assign(_ct=cleared["clear_time"].astype(float)).sort_values("_ct", kind="mergesort")
+    best = cleared.groupby("stage").head(1).drop(columns="_ct")
+    return pd.concat([best, latest[~latest["stage"].isin(best["stage"])]])
+
+def _player_grabs(raw: EventIndex | Mapping[str, pd.DataFrame] | pd.DataFrame, pid: str,
+                  exclude_roots: bool) -> tuple[np.ndarray, np.ndarray]:
+    """플레이어의 InputGrab 이벤트 (timestamp 정렬된 시각 배열, 오브젝트명 배열)"""
+    if isinstance(raw, EventIndex):
+        grabs = raw.events(pid, event_types=["InputGrab"])
+    else:
+        df = raw.get(pid) if isinstance(raw, Mapping) else raw[raw["PlayerID"] == pid]
+        if df is None or df.empty:
+            return np.array([], dtype="datetime64[ns]"), np.array([], dtype=object)
+        grabs = df[event_codes(df) == EVENT_CODES["InputGrab"]]
+    if exclude_roots:
+        grabs = grabs[grabs["value"].astype(str).str.strip().str.lower() != "root"]
+    grabs = grabs.sort_values("timestamp", kind="mergesort")
+    return grabs["timestamp"].to_numpy(dtype="datetime64[ns]"), grabs["value"].to_numpy(dtype=object)
+
+@profiled("aggregate.personal_first_clear_stars", rows=0)
 def personal_first_clear_stars(segs: pd.DataFrame, selected_players: list[str] | None) -> pd.DataFrame:
     """각 플레이어의 스테이지별 첫 클리어 시 받은 별"""
     if segs is None or segs.empty:
@@ -0,0 +1,81 @@
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+import pyarrow as pa
+from .disk_cache import DiskCache
+from .parser import COMPRESSED_SUFFIXES, compression_of
+
+# app_cli --compress-logs: 다 쓴 날짜 폴더의 플레이어 로그를 제자리에서 .csv.zst(.csv.gz)로 압축합니다.
+# 로그는 같은 이벤트/메시지가 반복되어 10~20배 줄어들고, 읽는 쪽(parser.load_csv)은 스트림으로 풀며 파싱합니다.
+# 디스크 캐시 항목은 압축본으로 옮기므로(DiskCache.move) 다시 파싱하지 않습니다.
+CODECS = {codec: suffix for suffix, codec in COMPRESSED_SUFFIXES.items()}
+_CHUNK = 1 << 20
+
+
+def _stream_digest(stream) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    while chunk := stream.read(_CHUNK):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def compress_file(path: Path, codec: str = "zstd", disk_cache: DiskCache | None = None) -> Path | None:
+    """
+    path를 path + 압축 확장자로 압축하고 원본을 지웁니다. 임시 파일에 쓴 뒤 풀어서 원본과 내용이
+    같은지 확인하고, 그동안 원본이 바뀌었으면(아직 쓰는 중) 아무것도 바꾸지 않고 None을 돌려줍니다.
+    mtime은 원본 값을 유지합니다.
+    """
+    path = Path(path)
+    dst = path.with_name(path.name + CODECS[codec])
+    tmp = dst.with_name(dst.name + ".tmp")
+    before = path.stat()
+    try:
+        with open(path, "rb") as src, pa.output_stream(str(tmp), compression=codec) as out:
+            h = hashlib.blake2b(digest_size=16)
+            while chunk := src.read(_CHUNK):
+                h.update(chunk)
+                out.write(chunk)
+        with pa.input_stream(str(tmp), compression=codec) as f:
+            same = _stream_digest(f) == h.hexdigest()
+        after = path.stat()
+        if not same or (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            tmp.unlink(missing_ok=True)
+            return None
+        shutil.copystat(path, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if disk_cache is not None:
+        disk_cache.move(path, dst)
+    path.unlink()
+    return dst
+
+
+def compress_folder(data_dir: Path, pattern: str = "*.csv", codec: str = "zstd",
+                    min_age_seconds: float = 3600, disk_cache: DiskCache | None = None) -> dict:
+    """
+    data_dir에서 pattern에 맞는 평문 로그 중 min_age_seconds 넘게 바뀌지 않은 파일을 압축합니다.
+    Returns: {"compressed", "skipped", "bytes_before", "bytes_after"}
+    """
+    report = {"compressed": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+    now = time.time()
+    for path in sorted(Path(data_dir).glob(pattern)):
+        if compression_of(path) is not None:
+            continue
+        st = path.stat()
+        if now - st.st_mtime < min_age_seconds:
+            report["skipped"] += 1
+            continue
+        dst = compress_file(path, codec, disk_cache)
+        if dst is None:
+            print(f"[archive] Skip {path.name}: changed while compressing")
+            report["skipped"] += 1
+            continue
+        report["compressed"] += 1
+        report["bytes_before"] += st.st_size
+        report["bytes_after"] += dst.stat().st_size
+    return report
@@ -1,67 +1,649 @@
 from __future__ import annotations
-from pathlib import Path
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePath
+import numpy as np
 import pandas as pd
-from .parser import load_csv, filename_to_player_id
-from .segment_builder import build_segments as build_stage_segments
+from .parser import (load_csv, load_csv_bytes, read_complete_lines, filename_to_player_id,
+                     player_column, concat_frames, compression_of, log_patterns, scan_logs, empty_raw)
+from .segment_builder import build_segments_with_tail, segment_columns
+from .disk_cache import DiskCache
+from .event_index import EventIndex, PlayerEventIndex
+from .grab_table import GrabTable
+from .stage_store import StageAggregateStore
+from . import profiler
+from .profiler import profiled
+
+# 파일 재작성 감지용으로 보관하는 앞부분 바이트 수와 이어 읽을 위치 바로 앞 바이트 수
+_HEAD_SIG_BYTES = 4096
+_EDGE_SIG_BYTES = 256
+# generation 발급기. 프로세스 안 모든 CacheManager가 공유하므로 파티션을 내렸다 다시 올려도
+# 이전 내용의 generation 값이 재사용되지 않음 (외부 캐시 키로 안전)
+_GENERATIONS = itertools.count(1)
+# raw 보관 방식: full = 플레이어 raw 전체 보관,
+# segments = 세그먼트를 만든 뒤 raw는 버리고 세그먼트별 그랩 순서 표(GrabTable)만 보관 (raw는 요청할 때 다시 읽음)
+RETENTION_MODES = ("full", "segments")
+
+
+def cache_variant(assume_orphan: bool) -> str:
+    """디스크 캐시 항목 구분자 (분할 옵션)"""
+    return f"o{int(assume_orphan)}"
+
+
+def result_stamp(assume_orphan: bool) -> str:
+    """
+    파싱/분할 결과의 버전 도장 (파서/분할기/지표 버전 + 분할 옵션).
+    디스크 캐시 항목, 공유 스냅샷, --incremental manifest, --map 부분 집계가 모두 이 값으로 호환 여부를 봅니다.
+    """
+    return DiskCache.version_stamp(cache_variant(assume_orphan))
+
+
+def _freeze(df: pd.DataFrame) -> pd.DataFrame:
+    """공유 스냅샷의 블록 배열을 쓰기 금지로 만듭니다 (제자리 수정 시 ValueError)."""
+    for arr in getattr(df._mgr, "arrays", ()):
+        # datetime/categorical 블록은 내부 ndarray(_ndarray/_codes)를 잠급니다
+        for base in (arr, getattr(arr, "_ndarray", None), getattr(arr, "_codes", None)):
+            if isinstance(base, np.ndarray):
+                base.flags.writeable = False
+    return df
+
+
+def _settled(st, settle_seconds: float) -> bool:
+    """마지막 수정 후 settle_seconds 이상 지나 쓰기가 끝난 것으로 볼 수 있는지"""
+    return time.time() - st.st_mtime >= settle_seconds
+
+
+def _parse_file(path: Path, assume_orphan: bool, segment_engine: str, incremental: bool,
+                settle_seconds: float = 0.5) -> dict:
+    """
+    파일 하나를 파싱/분할합니다. 다른 파일과 독립적인 순수 CPU 작업이라
+    프로세스 풀 워커에서도 그대로 실행됩니다.
+    incremental이면 줄바꿈 없는 마지막 줄은 파일이 settle_seconds 동안 그대로일 때만 읽습니다.
+    """
+    pid = filename_to_player_id(path)
+    st = path.stat()
+    stats: dict = {}
+    res = {"path": path, "pid": pid, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "stats": stats}
+    # 압축 파일은 다 쓴 보관본이라 꼬리 이어 읽기 대상이 아님
+    if incremental and compression_of(path) is None:
+        data, offset = read_complete_lines(path, final=_settled(st, settle_seconds))
+        df = load_csv_bytes(data, pid, stats=stats)
+        # 디스크 캐시 지문은 실제 파일 크기(미완성 마지막 줄 포함)로 남기고, 파싱한 끝은 offset으로 따로 보관
+        # (stat 뒤에 파일이 자라 offset이 더 크면 파싱한 바이트까지를 지문으로 씀).
+        # offset < size인 항목은 DiskCache가 부분 항목으로 보고 incremental 로더에만 돌려줌
+        res.update(size=max(st.st_size, offset), offset=offset,
+                   head=data[:_HEAD_SIG_BYTES], edge=data[-_EDGE_SIG_BYTES:])
+    else:
+        df = load_csv(path, stats=stats)
+    df["PlayerID"] = player_column(pid, len(df))  # 안전 주입
+    seg, tail_row, n_final = build_segments_with_tail(
+        df, assume_orphan_grab_counts_as_one=assume_orphan, engine=segment_engine)
+    res.update(raw=df, seg=seg, tail_row=tail_row, n_final=n_final)
+    return res
+
+
+def parse_file(path: Path, assume_orphan: bool = True, segment_engine: str = "vectorized",
+               disk_cache: DiskCache | None = None) -> dict:
+    """
+    CacheManager 없이 파일 하나를 파싱/분할합니다 (스트리밍/부분 재계산용).
+    disk_cache가 있으면 결과를 cache_variant(assume_orphan) 항목으로 저장합니다.
+    Returns: {"pid", "raw", "seg", "size", "mtime_ns", ...}
+    """
+    res = _parse_file(Path(path), assume_orphan, segment_engine, incremental=False)
+    if disk_cache is not None:
+        disk_cache.put(path, res["raw"], res["seg"], cache_variant(assume_orphan),
+                       size=res["size"], mtime_ns=res["mtime_ns"])
+    return res
+
+
+def _parse_file_profiled(path: Path, assume_orphan: bool, segment_engine: str,
+                         incremental: bool, settle_seconds: float = 0.5) -> dict:
+    """프로세스 풀 워커용 _parse_file. 워커에서 모은 프로파일 기록을 res["profile"]로 돌려줍니다."""
+    profiler.enable()
+    profiler.reset()
+    res = _parse_file(path, assume_orphan, segment_engine, incremental, settle_seconds)
+    res["profile"] = profiler.records()
+    return res
 
 class CacheManager:
     def __init__(self, data_dir: str, file_pattern: str = "*.csv",
-                 assume_orphan_grab_counts_as_one: bool = True):
+                 assume_orphan_grab_counts_as_one: bool = True,
+                 segment_engine: str = "vectorized",
+                 incremental: bool = False,
+                 cache_dir: str | DiskCache | None = None,
+                 workers: int = 0,
+                 parallel_min_files: int = 4,
+                 shared_dir: str | None = None,
+                 retention: str = "full",
+                 settle_seconds: float = 0.5):
+        if retention not in RETENTION_MODES:
+            raise ValueError(f"Unknown retention mode: {retention} (expected one of {RETENTION_MODES})")
+        if shared_dir and retention != "full":
+            raise ValueError("shared_dir requires retention='full' (shared snapshots carry raw frames)")
         self.data_dir = Path(data_dir)
         self.pattern = file_pattern
         self.assume_orphan = assume_orphan_grab_counts_as_one
+        self.segment_engine = segment_engine
+        # incremental=True: mtime이 바뀌면 새로 붙은 줄만 파싱해 이어 붙임
+        self.incremental = incremental
+        # incremental: 줄바꿈 없는 마지막 줄은 mtime이 이 시간 동안 그대로면 다 쓴 줄로 보고 읽음
+        self.settle_seconds = settle_seconds
         self._file_mtime: dict[Path, float] = {}
+        # 파일별 마지막으로 반영(또는 실패)할 때 본 [size, mtime_ns] (공유 manifest의 inputs)
+        self._file_stat: dict[Path, list[int]] = {}
+        # 파일별 꼬리 상태: offset, header, head, edge, tail_row, n_final (+ segments 모드는 raw_start)
+        self._tail: dict[Path, dict] = {}
+        # segments 모드 + incremental: 플레이어별로 다음 이어 읽기에 필요한 raw 꼬리
+        # (열린 세그먼트 시작 행과 같은 시각의 행부터, 전체 raw 기준 위치는 꼬리 상태의 raw_start)
+        self._tail_raw: dict[str, pd.DataFrame] = {}
+        # cache_dir: 파싱/분할 결과를 Feather로 보관하는 디스크 캐시 (None이면 사용 안 함)
+        # DiskCache 인스턴스를 넘기면 여러 CacheManager가 한 인덱스를 공유
+        if isinstance(cache_dir, DiskCache):
+            self.disk_cache = cache_dir
+        else:
+            self.disk_cache = DiskCache(cache_dir) if cache_dir else None
+        self._file_hash: dict[Path, str] = {}
+        # workers > 1: 다시 파싱할 파일이 parallel_min_files개 이상이면 프로세스 풀 사용
+        self.workers = workers
+        self.parallel_min_files = parallel_min_files
+        # 마지막 로딩에서 실패한 파일 -> 오류 메시지
+        self.errors: dict[Path, str] = {}
+        # 파일별 마지막 파싱 통계: rows, seconds, rows_per_sec, fast_path
+        self.load_stats: dict[Path, dict] = {}
         self.raw_by_player: dict[str, pd.DataFrame] = {}
         self.seg_by_player: dict[str, pd.DataFrame] = {}
+        # 플레이어별 스테이지 부분 집계 (seg_by_player와 함께 갱신)
+        self.stage_store = StageAggregateStore()
+        # 플레이어별 raw 색인 (시각 이진 탐색 + 이벤트 코드별 행 위치, raw와 함께 갱신)
+        self.event_index = EventIndex()
+        # retention="segments"면 raw_by_player/event_index는 비어 있고 grab_table만 채움
+        self.retention = retention
+        self.grab_table = GrabTable()
+        # 파일 감시 스레드와 읽기 쪽이 동시에 접근하므로 갱신/조회를 직렬화
+        self._lock = threading.RLock()
+        # 내용이 바뀔 때마다 새 값(_GENERATIONS). 스냅샷 메모와 외부 캐시 키로 사용
+        self.generation = 0
+        # 이름 -> (generation, 이어 붙인 프레임, 메모리 바이트)
+        self._snapshots: dict[str, tuple[int, pd.DataFrame, int]] = {}
+        self._memory: tuple[int, dict[str, dict[str, int]]] | None = None
+        # 플레이어별 마지막으로 바뀐 generation (공유 스냅샷에서 안 바뀐 플레이어 파일 재사용)
+        self.player_generation: dict[str, int] = {}
+        # shared_dir: 내용이 바뀔 때마다 Arrow IPC 스냅샷으로 내보내 다른 프로세스가 매핑해 읽게 함
+        if shared_dir:
+            from .shared_store import SharedStoreWriter  # shared_store가 이 모듈을 import하므로 여기서
+            self.shared = SharedStoreWriter(shared_dir, self.data_dir)
+        else:
+            self.shared = None
+
+    def _cache_variant(self) -> str:
+        return cache_variant(self.assume_orphan)
 
     def _scan_files(self) -> list[Path]:
-        return list(self.data_dir.glob(self.pattern))
+        return scan_logs(self.data_dir, self.pattern)
+
+    def owned_path(self, path: str | Path) -> Path | None:
+        """
+        path가 이 캐시의 data_dir/pattern에 해당하면 _scan_files()와 같은 형태의 경로를,
+        아니면 None을 반환합니다. (watcher 이벤트 경로 정규화용)
+        """
+        try:
+            rel = Path(path).resolve().relative_to(self.data_dir.resolve())
+        except ValueError:
+            return None
+        if (len(rel.parts) != len(PurePath(self.pattern).parts)
+                or not any(rel.match(p) for p in log_patterns(self.pattern))):
+            return None
+        return self.data_dir / rel
 
-    def initial_load(self):
-        for p in self._scan_files():
-            self._maybe_load(p)
+    @profiled("cache.initial_load")
+    def initial_load(self, workers: int | None = None):
+        with self._lock:
+            self._load_many(self._scan_files(), workers)
+            self._publish()
 
+    @profiled("cache.load", detail=lambda self, path: Path(path).name)
     def _maybe_load(self, path: Path):
-        try:
-            mtime = path.stat().st_mtime
-        except FileNotFoundError:
-            return
-        prev = self._file_mtime.get(path)
-        if prev is None or mtime > prev:
-            df = load_csv(path)
-            pid = filename_to_player_id(path)
-            df["PlayerID"] = pid  # 안전 주입
-            self.raw_by_player[pid] = df
-            seg = build_stage_segments(df, assume_orphan_grab_counts_as_one=self.assume_orphan)
-            self.seg_by_player[pid] = seg
+        with self._lock:
+            self._load_many([path], workers=0)
+            self._publish()
+
+    @profiled("cache.reload_paths", rows=1)
+    def reload_paths(self, paths: list[str | Path], workers: int | None = None):
+        """
+        지정한 파일만 다시 확인합니다. 사라진 파일은 제거합니다.
+        디렉터리 전체를 glob/stat 하는 refresh()와 달리 바뀐 파일만 건드립니다.
+        """
+        owned = {p for p in (self.owned_path(x) for x in paths) if p is not None}
+        with self._lock:
+            self._load_many(sorted(p for p in owned if p.is_file()), workers)
+            for p in owned:
+                if not p.exists():
+                    self._forget(p)
+            self._publish()
+
+    def _load_many(self, paths: list[Path], workers: int | None = None):
+        """
+        바뀐 파일만 다시 읽습니다. touch/꼬리 추가/디스크 캐시 적중은 여기서 바로 처리하고,
+        전체 파싱이 필요한 파일만 모아 (가능하면) 프로세스 풀로 넘깁니다.
+        파일별 오류는 보고만 하고 나머지 파일 로딩은 계속합니다.
+        """
+        workers = self.workers if workers is None else workers
+        before = set(self.seg_by_player)
+        pending: list[tuple[Path, float]] = []
+        for path in paths:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            mtime = st.st_mtime
+            prev = self._file_mtime.get(path)
+            # mtime이 그대로여도 미뤄 둔 마지막 줄이 이제 다 쓴 줄이면 이어 읽음
+            settling = self._unread_final_line(path, st)
+            if prev is not None and mtime <= prev and not settling:
+                continue
+            self._file_stat[path] = [st.st_size, st.st_mtime_ns]
+            try:
+                if prev is not None and not settling and self._unchanged_on_disk(path):
+                    pass  # touch만 된 파일: 다시 파싱/분할하지 않음
+                elif self.incremental and path in self._tail and self._append_tail(path):
+                    pass
+                elif self.disk_cache is not None and self._load_cached(path):
+                    pass
+                else:
+                    pending.append((path, mtime))
+                    continue
+            except Exception as e:
+                self._report_error(path, e)
+                continue
             self._file_mtime[path] = mtime
 
-    def refresh(self):
-        current = set(self._scan_files())
-        known = set(self._file_mtime.keys())
-        for p in current:
-            self._maybe_load(p)
-        for p in list(known - current):
-            pid = filename_to_player_id(p)
-            self._file_mtime.pop(p, None)
-            self.raw_by_player.pop(pid, None)
-            self.seg_by_player.pop(pid, None)
+        if not pending:
+            return
+        args = (self.assume_orphan, self.segment_engine, self.incremental, self.settle_seconds)
+        if workers > 1 and len(pending) >= self.parallel_min_files:
+            # 프로파일링 중이면 워커 기록도 받아 합침
+            parse = _parse_file_profiled if profiler.is_enabled() else _parse_file
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as ex:
+                futures = [ex.submit(parse, p, *args) for p, _ in pending]
+                # 결과는 제출 순서대로 반영 (순차 로딩과 같은 플레이어 순서 유지)
+                for (path, mtime), fut in zip(pending, futures):
+                    try:
+                        self._install(fut.result())
+                    except Exception as e:
+                        self._report_error(path, e)
+                        continue
+                    self._file_mtime[path] = mtime
+        else:
+            for path, mtime in pending:
+                try:
+                    self._install(_parse_file(path, *args))
+                except Exception as e:
+                    self._report_error(path, e)
+                    continue
+                self._file_mtime[path] = mtime
+        self._keep_scan_order(paths, before)
+
+    def _keep_scan_order(self, paths: list[Path], before: set[str]):
+        """
+        이번에 새로 들어온 플레이어를 paths 순서로 맞춥니다. 디스크 캐시 적중분이 파싱분보다
+        먼저 설치되므로, 그대로 두면 캐시 상태에 따라 플레이어 순서(=평균 합산 순서)가 달라집니다.
+        """
+        rank = {filename_to_player_id(p): i for i, p in enumerate(paths)}
+        new = [pid for pid in self.seg_by_player if pid not in before]
+        want = sorted(new, key=lambda pid: rank.get(pid, len(rank)))
+        if new == want:
+            return
+        for pid in want:
+            if pid in self.raw_by_player:
+                self.raw_by_player[pid] = self.raw_by_player.pop(pid)
+            self.seg_by_player[pid] = self.seg_by_player.pop(pid)
+        self.stage_store.move_to_end(want)
+
+    def _report_error(self, path: Path, e: Exception):
+        print(f"[cache] Skip {path.name}: {e}")
+        self.errors[path] = str(e)
+
+    def _unchanged_on_disk(self, path: Path) -> bool:
+        if self.disk_cache is None or path not in self._file_hash:
+            return False
+        entry = self.disk_cache.lookup(path, self._cache_variant(), partial_ok=self.incremental)
+        return entry is not None and entry["hash"] == self._file_hash[path]
+
+    def _unread_final_line(self, path: Path, st) -> bool:
+        """꼬리 이어 읽기 중인 파일의 줄바꿈 없는 마지막 줄이 아직 안 읽혔고, 이제 다 쓴 것으로 볼 수 있는지"""
+        state = self._tail.get(path)
+        return (state is not None and state["offset"] < st.st_size
+                and _settled(st, self.settle_seconds))
+
+    def _install(self, res: dict):
+        """_parse_file 결과를 반영합니다."""
+        path, pid = res["path"], res["pid"]
+        profiler.extend(res.pop("profile", ()))
+        self._set_player(pid, res["raw"], res["seg"])
+        self.errors.pop(path, None)
+        self.load_stats[path] = res["stats"]
+        if "offset" in res:
+            self._set_tail(path, res["head"], res["edge"], res["offset"], res["tail_row"], res["n_final"])
+            self._keep_tail_raw(path, pid, res["raw"])
+        if self.disk_cache is not None:
+            meta = ({k: res[k] for k in ("offset", "tail_row", "n_final")}
+                    if "offset" in res else {})
+            entry = self.disk_cache.put(path, res["raw"], res["seg"], self._cache_variant(),
+                                        size=res["size"], mtime_ns=res["mtime_ns"], meta=meta,
+                                        sketches=self.stage_store.stage_sketches([pid]))
+            self._file_hash[path] = entry["hash"]
+
+    @profiled("cache.disk_hit", detail=lambda self, path: Path(path).name)
+    def _load_cached(self, path: Path) -> bool:
+        # 부분 항목(마지막 줄 미포함)은 꼬리 상태로 이어 읽을 수 있는 incremental 로더만 씀
+        hit = self.disk_cache.get(path, self._cache_variant(), partial_ok=self.incremental)
+        if hit is None:
+            return False
+        raw, seg, entry = hit
+        self._set_player(filename_to_player_id(path), raw, seg)
+        self._file_hash[path] = entry["hash"]
+        meta = entry.get("meta", {})
+        if self.incremental and "offset" in meta:
+            offset = meta["offset"]
+            with open(path, "rb") as f:
+                head = f.read(min(offset, _HEAD_SIG_BYTES))
+                f.seek(max(offset - _EDGE_SIG_BYTES, 0))
+                edge = f.read(min(offset, _EDGE_SIG_BYTES))
+            self._set_tail(path, head, edge, offset, meta["tail_row"], meta["n_final"])
+            self._keep_tail_raw(path, filename_to_player_id(path), raw)
+            if self._unread_final_line(path, path.stat()):
+                return self._append_tail(path)
+        return True
+
+    def _set_player(self, pid: str, raw: pd.DataFrame, seg: pd.DataFrame,
+                    appended: tuple[int, pd.DataFrame] | None = None):
+        """
+        appended=(이전 확정 세그먼트 수, 새 줄): 꼬리 이어 붙이기 결과. full 모드는 raw가 기존 raw 뒤에
+        새 줄을 붙인 전체라 색인에 새 줄만 더하고, segments 모드는 raw가 꼬리 부분뿐입니다.
+        """
+        if self.retention == "full":
+            self.raw_by_player[pid] = raw
+            if appended is not None:
+                self.event_index.extend(pid, raw)
+            else:
+                self.event_index.update(pid, raw)
+        elif appended is not None:
+            self.grab_table.extend(pid, raw, seg, *appended)
+        else:
+            self.grab_table.update(pid, raw, seg)
+        self.seg_by_player[pid] = seg
+        self.stage_store.update(pid, seg)
+        self.generation = next(_GENERATIONS)
+        self.player_generation[pid] = self.generation
+
+    def _set_tail(self, path: Path, head: bytes, edge: bytes, offset: int, tail_row: int, n_final: int):
+        self._tail[path] = {
+            "offset": offset,
+            "header": head[:head.find(b"\n") + 1],
+            "head": head,
+            "edge": edge,
+            "tail_row": tail_row,
+            "n_final": n_final,
+        }
+
+    def _keep_tail_raw(self, path: Path, pid: str, raw: pd.DataFrame, base: int = 0):
+        """
+        segments 모드: raw(전체 raw의 base행부터) 중 다음 이어 읽기에 필요한 행만 남깁니다.
+        열린 세그먼트 시작 행과 같은 시각의 행부터 남겨 그 창의 그랩을 다시 만들 수 있고,
+        열린 세그먼트가 없으면 시간 순서 확인용으로 마지막 시각의 행만 남습니다.
+        """
+        if self.retention == "full":
+            return
+        state = self._tail[path]
+        ts = raw["timestamp"].to_numpy(dtype="datetime64[ns]")
+        start = 0
+        if len(ts):
+            start = int(np.searchsorted(ts, ts[min(state["tail_row"] - base, len(ts) - 1)], side="left"))
+        self._tail_raw[pid] = raw.iloc[start:].copy()  # 복사해 전체 raw 버퍼를 놓아줌
+        state["raw_start"] = base + start
+
+    @staticmethod
+    def _advance_tail(state: dict, data: bytes, offset: int):
+        """이어 읽은 data만큼 offset과 재작성 감지용 앞부분/끝부분 바이트를 늘립니다."""
+        if len(state["head"]) < _HEAD_SIG_BYTES:
+            state["head"] = (state["head"] + data)[:_HEAD_SIG_BYTES]
+            state["header"] = state["head"][:state["head"].find(b"\n") + 1]
+        state["edge"] = (state["edge"] + data)[-_EDGE_SIG_BYTES:]
+        state["offset"] = offset
+
+    @profiled("cache.append_tail", detail=lambda self, path: Path(path).name)
+    def _append_tail(self, path: Path) -> bool:
+        """
+        새로 붙은 줄만 파싱해 raw/seg를 확장합니다. 파일이 줄었거나, 앞부분 또는
+        이어 읽을 위치 바로 앞 바이트가 바뀌었거나, 시간 순서가 어긋나면 False(전체 재로딩).
+        """
+        state = self._tail[path]
+        with open(path, "rb") as f:
+            head = f.read(len(state["head"]))
+            f.seek(state["offset"] - len(state["edge"]))
+            edge = f.read(len(state["edge"]))
+            size = f.seek(0, 2)
+            final = _settled(os.fstat(f.fileno()), self.settle_seconds)
+        if (size < state["offset"] or head != state["head"] or edge != state["edge"]
+                or not state["header"]):
+            return False
+        data, offset = read_complete_lines(path, state["offset"], final=final)
+        if not data:
+            return True
+
+        pid = filename_to_player_id(path)
+        stats: dict = {}
+        new = load_csv_bytes(state["header"] + data, pid, stats=stats)
+        self.load_stats[path] = stats
+        if self.retention == "full":
+            old, base = self.raw_by_player.get(pid), 0
+        else:
+            old, base = self._tail_raw.get(pid), state.get("raw_start", 0)
+        if old is None or new["timestamp"].isna().any():
+            return False
+        if new.empty:  # 새 줄이 모두 잘못된 형식
+            self._advance_tail(state, data, offset)
+            return True
+        if not old.empty:
+            last = old["timestamp"].iloc[-1]
+            if pd.isna(last) or new["timestamp"].iloc[0] < last:
+                return False
+
+        raw = concat_frames([old, new])
+        tail_seg, tail_row, n_final = build_segments_with_tail(
+            raw.iloc[state["tail_row"] - base:], assume_orphan_grab_counts_as_one=self.assume_orphan,
+            engine=self.segment_engine)
+        old_seg = self.seg_by_player[pid].iloc[:state["n_final"]]
+        parts = [s for s in (old_seg, tail_seg) if not s.empty]
+        seg = pd.concat(parts, ignore_index=True) if parts else tail_seg
+        self._set_player(pid, raw, seg, appended=(state["n_final"], new))
+        self._file_hash.pop(path, None)  # 디스크 캐시 항목은 더 이상 현재 내용이 아님
+        self._advance_tail(state, data, offset)
+        state["tail_row"] += tail_row
+        state["n_final"] += n_final
+        self._keep_tail_raw(path, pid, raw, base)
+        return True
+
+    @profiled("cache.refresh")
+    def refresh(self, workers: int | None = None):
+        with self._lock:
+            current = self._scan_files()
+            known = set(self._file_mtime.keys())
+            self._load_many(current, workers)
+            for p in list(known - set(current)):
+                self._forget(p)
+            self._publish()
+
+    @profiled("cache.publish")
+    def _publish(self):
+        """shared_dir이 있고 마지막으로 내보낸 뒤 내용이 바뀌었으면 공유 스냅샷을 갱신합니다."""
+        if self.shared is None or self.shared.published == self.generation:
+            return
+        try:
+            self.shared.publish(self)
+        except OSError as e:  # 공유 폴더 문제로 로딩 자체가 실패하지는 않게
+            print(f"[shared] Publish failed for {self.data_dir}: {e}")
+
+    def _forget(self, p: Path):
+        pid = filename_to_player_id(p)
+        self._tail.pop(p, None)
+        self._file_hash.pop(p, None)
+        self._file_stat.pop(p, None)
+        self.errors.pop(p, None)
+        self.load_stats.pop(p, None)
+        known = self._file_mtime.pop(p, None) is not None
+        if any(filename_to_player_id(q) == pid for q in self._file_mtime):
+            return  # 같은 플레이어의 다른 파일(압축본 등)이 남아 있음
+        if known or pid in self.seg_by_player:
+            self.generation = next(_GENERATIONS)
+        self.raw_by_player.pop(pid, None)
+        self.seg_by_player.pop(pid, None)
+        self.player_generation.pop(pid, None)
+        self.stage_store.remove(pid)
+        self.event_index.remove(pid)
+        self.grab_table.remove(pid)
+        self._tail_raw.pop(pid, None)
+
+    def _snapshot(self, name: str, build) -> pd.DataFrame:
+        with self._lock:
+            hit = self._snapshots.get(name)
+            if hit is not None and hit[0] == self.generation:
+                return hit[1]
+            df = build()
+            # 쓰기 금지된 object 컬럼은 memory_usage(deep=True)가 실패하므로 잠그기 전에 잰다
+            nbytes = int(df.memory_usage(deep=True).sum())
+            self._snapshots[name] = (self.generation, _freeze(df), nbytes)
+            return df
 
     def all_segments(self) -> pd.DataFrame:
+        """
+        전체 세그먼트를 이어 붙인 프레임. generation이 같으면 같은 객체를 그대로 돌려주므로
+        읽기 전용으로 다뤄야 합니다(수정이 필요하면 .copy()).
+        """
+        return self._snapshot("segments", self._all_segments)
+
+    @profiled("concat.segments")
+    def _all_segments(self) -> pd.DataFrame:
         if not self.seg_by_player:
-            return pd.DataFrame(columns=[
-                "PlayerID","stage","t_begin","t_end","cleared",
-                "clear_time","total_time","retry_cnt","exit_cnt",
-                "first_star","final_star",
-                "cam_move_cnt","cam_rotate_cnt","cam_pan_cnt","cam_total_cnt",
-                "grab_pair_cnt","pushpull_cnt","first_grab_object",
-            ])
+            return pd.DataFrame(columns=segment_columns())
         return pd.concat(self.seg_by_player.values(), ignore_index=True)
 
     def all_raw(self) -> pd.DataFrame:
+        """
+        전체 raw를 이어 붙인 프레임 (all_segments와 같은 방식으로 generation별 메모, 읽기 전용).
+        segments 보관 모드에서는 매번 load_raw()로 다시 읽어 이어 붙이고 메모하지 않습니다.
+        """
+        if self.retention != "full":
+            with self._lock:
+                pids = list(self.seg_by_player)
+            frames = [self.load_raw(pid) for pid in pids]
+            return concat_frames(frames) if frames else self._all_raw()
+        return self._snapshot("raw", self._all_raw)
+
+    @profiled("concat.raw")
+    def _all_raw(self) -> pd.DataFrame:
         if not self.raw_by_player:
-            return pd.DataFrame(columns=["timestamp","event","level","key","value","PlayerID"])
-        return pd.concat(self.raw_by_player.values(), ignore_index=True)
+            return empty_raw()
+        return concat_frames(list(self.raw_by_player.values()))
+
+    def _player_memory(self, pid: str) -> dict[str, int]:
+        raw = self.raw_by_player.get(pid, self._tail_raw.get(pid))
+        grabs = self.grab_table.get(pid)
+        return {"raw": 0 if raw is None else int(raw.memory_usage(deep=True).sum()),
+                "grabs": 0 if grabs is None else int(grabs.memory_usage(deep=True).sum()),
+                "segments": int(self.seg_by_player[pid].memory_usage(deep=True).sum())}
+
+    def memory_usage(self) -> dict[str, int]:
+        """
+        플레이어별로 보관 중인 프레임(raw 또는 그랩 순서 표 + 세그먼트)의 대략적인 메모리(바이트).
+        generation별로 메모합니다.
+        """
+        return {pid: sum(parts.values()) for pid, parts in self._memory_parts().items()}
+
+    def _memory_parts(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            if self._memory is not None and self._memory[0] == self.generation:
+                return self._memory[1]
+            parts = {pid: self._player_memory(pid) for pid in self.seg_by_player}
+            self._memory = (self.generation, parts)
+            return parts
+
+    def memory_breakdown(self) -> dict:
+        """보관 방식과 종류별 메모리(바이트): raw, grabs(그랩 순서 표), segments, snapshots(메모된 이어 붙인 프레임)"""
+        with self._lock:
+            out = {"retention": self.retention, "raw": 0, "grabs": 0, "segments": 0, "snapshots": 0}
+            for parts in self._memory_parts().values():
+                for k, v in parts.items():
+                    out[k] += v
+            out["snapshots"] = sum(hit[2] for hit in self._snapshots.values())
+            return out
+
+    def memory_bytes(self) -> int:
+        """플레이어 프레임과 메모된 스냅샷(all_segments/all_raw)을 합친 대략적인 메모리(바이트)"""
+        with self._lock:
+            total = sum(self.memory_usage().values())
+            for name in ("segments", "raw"):
+                hit = self._snapshots.get(name)
+                if hit is not None:
+                    total += hit[2]
+            return total
 
     def players(self) -> list[str]:
-        return sorted(self.raw_by_player.keys())
+        with self._lock:
+            return sorted(self.seg_by_player.keys())
+
+    def input_stats(self) -> dict[str, list[int]]:
+        """
+        반영한 입력 파일 이름 -> 읽을 때 본 [size, mtime_ns] (shared_store.input_stats와 같은 모양).
+        로딩 뒤에 바뀐 파일이 있으면 현재 디스크 값과 달라지므로 스냅샷 최신 여부 확인에 씁니다.
+        """
+        with self._lock:
+            return {p.relative_to(self.data_dir).as_posix(): list(v) for p, v in self._file_stat.items()}
+
+    def tail_offsets(self) -> dict[str, int]:
+        """incremental 모드에서 파일 이름 -> 파싱을 마친 바이트 위치"""
+        with self._lock:
+            return {p.relative_to(self.data_dir).as_posix(): t["offset"] for p, t in self._tail.items()}
+
+    def grab_source(self) -> EventIndex | GrabTable:
+        """first_grab_top3_all에 넘길 그랩 출처 (full: raw 색인, segments: 그랩 순서 표)"""
+        return self.event_index if self.retention == "full" else self.grab_table
+
+    def _path_of(self, pid: str) -> Path | None:
+        return next((p for p in self._file_mtime if filename_to_player_id(p) == pid), None)
+
+    @profiled("cache.load_raw", detail=lambda self, pid: pid)
+    def load_raw(self, pid: str) -> pd.DataFrame:
+        """
+        플레이어 raw 전체. full 모드는 보관 중인 프레임을, segments 모드는 디스크 캐시(없으면 원본 파일)에서
+        다시 읽은 프레임을 돌려주며 보관하지 않습니다. 없는 플레이어면 KeyError.
+        """
+        with self._lock:
+            if self.retention == "full":
+                return self.raw_by_player[pid]
+            path = self._path_of(pid)
+        if path is None:
+            raise KeyError(pid)
+        if self.disk_cache is not None:
+            hit = self.disk_cache.get(path, self._cache_variant())
+            if hit is not None:
+                return hit[0]
+        df = load_csv(path)
+        df["PlayerID"] = player_column(pid, len(df))
+        return df
+
+    def events(self, player: str, t0=None, t1=None, event_types: list[str] | None = None) -> pd.DataFrame:
+        """
+        플레이어의 [t0, t1] 구간(양끝 포함) raw 행을 색인으로 꺼냅니다 (전체 스캔 없음).
+        event_types가 없으면 복사 없는 슬라이스이므로 읽기 전용으로 다뤄야 합니다.
+        segments 보관 모드에서는 그 플레이어 raw를 load_raw()로 다시 읽어 조회합니다.
+        """
+        if self.retention != "full":
+            if player not in self.seg_by_player:
+                return empty_raw()
+            return PlayerEventIndex(self.load_raw(player)).events(t0, t1, event_types)
+        with self._lock:
+            return self.event_index.events(player, t0, t1, event_types)
@@ -0,0 +1,324 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+import pyarrow.feather as feather
+from .parser import PARSER_VERSION, PATTERNS_DIGEST
+from .segment_builder import SEGMENTER_VERSION
+from .segment_metrics import metrics_digest
+from .sketches import QuantileSketch, decode_sketches, encode_sketches, segment_sketches
+from .profiler import profiled
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_NAME = "index.json"
+LOCK_NAME = "index.lock"
+_HASH_CHUNK = 1 << 20
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """프로세스 간 배타 잠금 (POSIX는 flock, Windows는 msvcrt.locking)"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_digest(path: Path, size: int | None = None) -> str:
+    """파일 내용 해시 (size가 주어지면 앞 size 바이트만)"""
+    h = hashlib.blake2b(digest_size=16)
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(_HASH_CHUNK if remaining is None else min(_HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    파일별 정규화 raw 프레임과 세그먼트 프레임을 Feather(Arrow IPC)로 보관하는 사이드카 캐시.
+    세그먼트로 만든 스테이지별 분위수 스케치도 같은 지문의 JSON으로 함께 보관해, 여러 날짜 분위수를
+    세그먼트를 읽지 않고 답할 수 있게 합니다(get_sketches).
+
+    항목은 (경로, 크기, mtime, 내용 해시, 파서/세그먼트 버전 + 옵션)으로 식별합니다.
+    - 크기/mtime이 같으면 해시 없이 적중
+    - mtime만 바뀌고 내용 해시가 같으면(touch) 적중으로 보고 mtime만 갱신
+    - 읽기는 memory_map으로 수행
+    - incremental 로딩이 줄바꿈 없는 마지막 줄을 빼고 만든 항목(meta offset < size)은 부분 항목이라
+      partial_ok=True로 묻는 쪽(꼬리 이어 읽기로 나머지를 채우는 로더)에만 돌려줌
+    여러 CacheManager(날짜 파티션)가 한 인스턴스를 공유할 수 있도록 인덱스 접근은 잠금으로 직렬화합니다.
+    같은 폴더를 쓰는 다른 프로세스와는 잠금 파일(index.lock)로 직렬화하고, 인덱스를 고칠 때마다
+    디스크의 최신 인덱스를 다시 읽어 자기 변경만 얹어 저장하므로 서로의 항목을 덮어쓰지 않습니다.
+    """
+
+    def __init__(self, cache_dir: str | Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.cache_dir / INDEX_NAME
+        self._lock_path = self.cache_dir / LOCK_NAME
+        # 마지막으로 읽은(또는 쓴) 인덱스 파일의 mtime_ns (다른 프로세스가 바꿨는지 확인용)
+        self._index_mtime: int | None = None
+        self._index: dict[str, dict] = self._read_index()
+        self._lock = threading.RLock()
+
+    # ---------- 인덱스 ----------
+    def _index_stamp(self) -> int | None:
+        try:
+            return self._index_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_index(self) -> dict[str, dict]:
+        self._index_mtime = self._index_stamp()
+        try:
+            return json.loads(self._index_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _reload_if_changed(self):
+        """다른 프로세스가 인덱스를 바꿨으면 다시 읽습니다 (조회용, 잠금 파일 없이)."""
+        if self._index_stamp() != self._index_mtime:
+            self._index = self._read_index()
+
+    def _write_index(self):
+        # 고정된 임시 이름은 프로세스끼리 경합하므로 매번 고유한 이름으로 쓰고 바꿔 넣음
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.cache_dir,
+                                         prefix="index-", suffix=".tmp", delete=False) as tmp:
+            json.dump(self._index, tmp, ensure_ascii=False, indent=1)
+        try:
+            os.replace(tmp.name, self._index_path)
+        except OSError:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+        self._index_mtime = self._index_stamp()
+
+    @contextmanager
+    def _updating(self):
+        """
+        다른 프로세스와 잠근 채 디스크의 최신 인덱스를 다시 읽고, 블록 안에서 고친 self._index를 저장합니다.
+        (시작할 때 읽은 사본을 통째로 쓰면 그 사이 다른 프로세스가 넣은 항목이 사라짐)
+        """
+        with self._lock, _file_lock(self._lock_path):
+            self._index = self._read_index()
+            yield self._index
+            self._write_index()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return str(Path(path).resolve())
+
+    @staticmethod
+    def _is_partial(entry: dict) -> bool:
+        return entry.get("meta", {}).get("offset", entry["size"]) < entry["size"]
+
+    @staticmethod
+    def version_stamp(variant: str = "") -> str:
+        return (f"p{PARSER_VERSION}-{PATTERNS_DIGEST}.s{SEGMENTER_VERSION}-{metrics_digest()}"
+                + (f".{variant}" if variant else ""))
+
+    # ---------- 조회/저장 ----------
+    def lookup(self, path: Path, variant: str = "", partial_ok: bool = False) -> dict | None:
+        """유효한 항목이면 인덱스 항목을, 아니면 None을 반환합니다 (부분 항목은 partial_ok일 때만)."""
+        with self._lock:
+            self._reload_if_changed()
+            entry = self._index.get(self._key(path))
+            if entry is None or entry.get("version") != self.version_stamp(variant):
+                return None
+            if not partial_ok and self._is_partial(entry):
+                return None
+            try:
+                st = Path(path).stat()
+            except FileNotFoundError:
+                return None
+            if st.st_size != entry["size"]:
+                return None
+            if st.st_mtime_ns != entry["mtime_ns"]:
+                if file_digest(path) != entry["hash"]:
+                    return None
+                # 내용은 그대로, touch만 됨
+                with self._updating() as index:
+                    current = index.get(self._key(path))
+                    if current is not None and current["hash"] == entry["hash"]:
+                        current["mtime_ns"] = st.st_mtime_ns
+                        entry = current
+                    else:
+                        entry = dict(entry, mtime_ns=st.st_mtime_ns)
+            if not all((self.cache_dir / entry[k]).exists() for k in ("raw", "seg")):
+                return None
+            return entry
+
+    def load(self, entry: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+        raw = feather.read_table(self.cache_dir / entry["raw"], memory_map=True).to_pandas()
+        seg = feather.read_table(self.cache_dir / entry["seg"], memory_map=True).to_pandas()
+        return raw, seg
+
+    @profiled("cache.disk_read", detail=lambda self, path, *a, **k: Path(path).name)
+    def get(self, path: Path, variant: str = "",
+            partial_ok: bool = False) -> tuple[pd.DataFrame, pd.DataFrame, dict] | None:
+        entry = self.lookup(path, variant, partial_ok)
+        if entry is None:
+            return None
+        try:
+            raw, seg = self.load(entry)
+        except Exception as e:
+            print(f"[disk_cache] Drop broken entry for {Path(path).name}: {e}")
+            self.invalidate(path)
+            return None
+        return raw, seg, entry
+
+    @profiled("cache.disk_read", detail=lambda self, path, *a, **k: Path(path).name)
+    def get_segments(self, path: Path, variant: str = "") -> pd.DataFrame | None:
+        """get()과 같지만 세그먼트 프레임만 읽습니다 (raw가 필요 없는 집계용)."""
+        entry = self.lookup(path, variant)
+        if entry is None:
+            return None
+        try:
+            return feather.read_table(self.cache_dir / entry["seg"], memory_map=True).to_pandas()
+        except Exception as e:
+            print(f"[disk_cache] Drop broken entry for {Path(path).name}: {e}")
+            self.invalidate(path)
+            return None
+
+    @profiled("cache.disk_read", detail=lambda self, path, *a, **k: Path(path).name)
+    def get_sketches(self, path: Path, variant: str = "") -> dict[str, dict[str, QuantileSketch]] | None:
+        """
+        파일의 {컬럼: {스테이지: 스케치}}만 읽습니다 (세그먼트/raw는 읽지 않음).
+        항목이 없거나 스케치를 저장하기 전에 만든 항목이면 None.
+        """
+        entry = self.lookup(path, variant)
+        if entry is None or "sketch" not in entry:
+            return None
+        try:
+            return decode_sketches(json.loads((self.cache_dir / entry["sketch"]).read_text(encoding="utf-8")))
+        except (OSError, ValueError) as e:
+            print(f"[disk_cache] Drop broken entry for {Path(path).name}: {e}")
+            self.invalidate(path)
+            return None
+
+    @profiled("cache.disk_write", rows=2, detail=lambda self, path, *a, **k: Path(path).name)
+    def put(self, path: Path, raw: pd.DataFrame, seg: pd.DataFrame,
+            variant: str = "", size: int | None = None, mtime_ns: int | None = None,
+            meta: dict | None = None,
+            sketches: dict[str, dict[str, QuantileSketch]] | None = None) -> dict:
+        """
+        파싱/분할 결과를 저장합니다. size/mtime_ns는 파싱 직전에 잰 값을 넘겨야
+        파싱 중에 파일이 자라도 내용 해시가 저장된 프레임과 어긋나지 않습니다.
+        sketches가 없으면 seg에서 만듭니다 (이미 만든 값이 있으면 넘겨서 다시 계산하지 않게).
+        """
+        path = Path(path)
+        if size is None or mtime_ns is None:
+            st = path.stat()
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        digest = file_digest(path, size)
+        stem = hashlib.blake2b(self._key(path).encode("utf-8"), digest_size=8).hexdigest()
+        names = {k: f"{stem}-{digest[:16]}.{k}.feather" for k in ("raw", "seg")}
+        feather.write_feather(raw.reset_index(drop=True), self.cache_dir / names["raw"],
+                              compression="uncompressed")
+        feather.write_feather(seg.reset_index(drop=True), self.cache_dir / names["seg"],
+                              compression="uncompressed")
+        names["sketch"] = f"{stem}-{digest[:16]}.sketch.json"
+        doc = encode_sketches(segment_sketches(seg) if sketches is None else sketches)
+        (self.cache_dir / names["sketch"]).write_text(json.dumps(doc), encoding="utf-8")
+        entry = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "hash": digest,
+            "version": self.version_stamp(variant),
+            **names,
+            "meta": meta or {},
+        }
+        with self._updating() as index:
+            index[self._key(path)] = entry
+        return entry
+
+    # ---------- 유지보수 ----------
+    def move(self, old: Path, new: Path) -> bool:
+        """
+        old 항목을 같은 내용을 담은 new(압축본 등)의 항목으로 옮깁니다. 저장된 프레임은 그대로 쓰고
+        크기/mtime/해시만 new 기준으로 바꿉니다. old 항목이 없거나 old 파일과 맞지 않으면 False.
+        """
+        with self._updating() as index:
+            entry = index.get(self._key(old))
+            if entry is None or self._is_partial(entry):  # 부분 항목은 압축본 내용과 다름
+                return False
+            try:
+                st = Path(old).stat()
+            except FileNotFoundError:
+                return False
+            if st.st_size != entry["size"] or (st.st_mtime_ns != entry["mtime_ns"]
+                                               and file_digest(old) != entry["hash"]):
+                return False
+            nst = Path(new).stat()
+            index.pop(self._key(old))
+            # 꼬리 이어 읽기 상태(meta)는 원본 바이트 오프셋이라 버림
+            index[self._key(new)] = dict(entry, size=nst.st_size, mtime_ns=nst.st_mtime_ns,
+                                         hash=file_digest(new), meta={})
+            return True
+
+    def invalidate(self, path: Path | None = None):
+        """path 항목(없으면 전체)을 인덱스에서 지웁니다. 파일 정리는 compact()가 합니다."""
+        with self._updating() as index:
+            if path is None:
+                index.clear()
+            else:
+                index.pop(self._key(path), None)
+
+    def compact(self, grace_seconds: float = 600.0) -> tuple[int, int]:
+        """
+        원본이 사라졌거나 파서/세그먼트 버전·크기가 맞지 않는 항목과,
+        어떤 항목도 참조하지 않는 데이터 파일을 지웁니다.
+        데이터 파일은 grace_seconds보다 오래된 것만 지웁니다 (다른 프로세스가 막 쓰고
+        아직 인덱스에 올리지 않은 파일을 지우지 않게).
+        Returns: (지운 항목 수, 지운 파일 수)
+        """
+        with self._updating() as index:
+            stamp = self.version_stamp()
+            dropped = 0
+            for key, entry in list(index.items()):
+                p = Path(key)
+                version = entry.get("version", "")
+                if (not p.exists() or not (version == stamp or version.startswith(stamp + "."))
+                        or p.stat().st_size != entry.get("size")):
+                    index.pop(key)
+                    dropped += 1
+            live = {entry[k] for entry in index.values()
+                    for k in ("raw", "seg", "sketch") if k in entry}
+
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for f in [*self.cache_dir.glob("*.feather"), *self.cache_dir.glob("*.sketch.json"),
+                  *self.cache_dir.glob("index-*.tmp")]:
+            try:
+                if f.name in live or f.stat().st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            f.unlink(missing_ok=True)
+            removed += 1
+        return dropped, removed
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from collections.abc import Iterable, Iterator, Mapping
+import numpy as np
+import pandas as pd
+from .parser import EVENT_CODES, empty_raw, event_codes
+
+# raw 이벤트 색인. 플레이어 raw는 timestamp 순으로 정렬되어 있으므로
+#   - 시각 구간은 timestamp 배열 이진 탐색으로 행 범위 [i, j)를 구하고 (iloc 슬라이스 = 복사 없음)
+#   - 이벤트 종류는 코드별 행 위치 목록(posting list) 안에서 다시 이진 탐색해 그 범위의 행만 고릅니다.
+# 조회 비용이 전체 행 수가 아니라 log(행 수) + 결과 행 수에 비례합니다.
+
+
+def _to_ns(t) -> np.datetime64 | None:
+    if t is None or (isinstance(t, str) and not t):
+        return None
+    if isinstance(t, pd.Timestamp):  # 세그먼트 t_begin/t_end (변환 비용이 조회보다 크지 않게)
+        return t.to_datetime64().astype("datetime64[ns]")
+    return np.datetime64(pd.Timestamp(t), "ns")
+
+
+def _postings(codes: np.ndarray, base: int = 0) -> dict[int, np.ndarray]:
+    """이벤트 코드 -> 행 위치(base부터, 오름차순)"""
+    # 안정 정렬이라 코드별 위치가 행 순서(=시각 순)를 유지
+    order = np.argsort(codes, kind="stable")
+    order = order.astype(np.int32) if base + len(order) < 2**31 else order
+    if base:
+        order += base
+    found, starts = np.unique(codes[order - base], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    return {int(c): order[s:e] for c, s, e in zip(found, starts, ends)}
+
+
+class PlayerEventIndex:
+    """플레이어 raw 하나의 색인: 시각 배열 + 이벤트 코드 -> 행 위치(오름차순)"""
+
+    __slots__ = ("raw", "ts", "postings")
+
+    def __init__(self, raw: pd.DataFrame, postings: dict[int, np.ndarray] | None = None):
+        self.raw = raw
+        # datetime64[ns] 컬럼은 복사 없이 같은 버퍼를 가리킴
+        self.ts = raw["timestamp"].to_numpy(dtype="datetime64[ns]")
+        self.postings = _postings(np.asarray(event_codes(raw))) if postings is None else postings
+
+    def extended(self, raw: pd.DataFrame) -> PlayerEventIndex:
+        """
+        raw가 이 색인의 raw 뒤에 (시각이 같거나 늦은) 행을 이어 붙인 프레임일 때의 색인.
+        새 행만 정렬해 코드별 위치 목록 뒤에 붙이므로 기존 행을 다시 정렬하지 않습니다.
+        """
+        n = len(self.ts)
+        postings = dict(self.postings)
+        for c, p in _postings(np.asarray(event_codes(raw.iloc[n:])), base=n).items():
+            old = postings.get(c)
+            postings[c] = p if old is None else np.concatenate([old, p])
+        return PlayerEventIndex(raw, postings)
+
+    def span(self, t0=None, t1=None) -> tuple[int, int]:
+        """[t0, t1] (양끝 포함) 구간의 행 범위 [i, j)"""
+        lo, hi = _to_ns(t0), _to_ns(t1)
+        i = int(np.searchsorted(self.ts, lo, side="left")) if lo is not None else 0
+        j = int(np.searchsorted(self.ts, hi, side="right")) if hi is not None else len(self.ts)
+        return i, max(i, j)
+
+    def positions(self, i: int, j: int, codes: Iterable[int]) -> np.ndarray:
+        """행 범위 [i, j) 안에서 codes 이벤트의 행 위치 (오름차순)"""
+        parts = []
+        for c in dict.fromkeys(codes):
+            p = self.postings.get(c)
+            if p is None:
+                continue
+            parts.append(p[np.searchsorted(p, i, side="left"):np.searchsorted(p, j, side="left")])
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts), kind="stable")
+
+    def events(self, t0=None, t1=None, event_types: Iterable[str] | None = None) -> pd.DataFrame:
+        """
+        [t0, t1] 구간의 행. event_types가 없으면 raw의 iloc 슬라이스(복사 없음, 읽기 전용으로 다룰 것),
+        있으면 고른 행만 꺼낸 프레임입니다. event_types는 정규 이벤트 이름(EVENT_CODES) 또는 원문 event 문자열.
+        """
+        i, j = self.span(t0, t1)
+        if event_types is None:
+            return self.raw.iloc[i:j]
+        names = list(event_types)
+        pos = self.positions(i, j, [EVENT_CODES[e] for e in names if e in EVENT_CODES])
+        literal = [e for e in names if e not in EVENT_CODES]
+        if literal:  # 정규 이벤트가 아닌 원문 문자열은 구간 안에서만 비교
+            window = self.raw["event"].iloc[i:j].astype(str).isin(literal).to_numpy()
+            pos = np.union1d(pos, np.flatnonzero(window) + i)
+        return self.raw.iloc[pos]
+
+
+class EventIndex(Mapping):
+    """
+    PlayerID -> PlayerEventIndex. CacheManager는 플레이어가 바뀔 때마다 update()로 미리 만들고,
+    매핑된 공유 스냅샷처럼 raw를 나중에 여는 곳은 source(PlayerID -> raw)를 넘겨 처음 조회될 때 만듭니다.
+    """
+
+    def __init__(self, source: Mapping[str, pd.DataFrame] | None = None):
+        self._source = source
+        self._index: dict[str, PlayerEventIndex] = {}
+
+    def update(self, pid: str, raw: pd.DataFrame):
+        self._index[pid] = PlayerEventIndex(raw)
+
+    def extend(self, pid: str, raw: pd.DataFrame):
+        """꼬리 이어 붙이기(CacheManager._append_tail)용 갱신: raw는 기존 raw 뒤에 새 줄만 붙인 프레임"""
+        old = self._index.get(pid)
+        self._index[pid] = PlayerEventIndex(raw) if old is None else old.extended(raw)
+
+    def remove(self, pid: str):
+        self._index.pop(pid, None)
+
+    def __getitem__(self, pid: str) -> PlayerEventIndex:
+        idx = self._index.get(pid)
+        if idx is None:
+            if self._source is None or pid not in self._source:
+                raise KeyError(pid)
+            idx = self._index[pid] = PlayerEventIndex(self._source[pid])
+        return idx
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._source if self._source is not None else self._index)
+
+    def __len__(self) -> int:
+        return len(self._source if self._source is not None else self._index)
+
+    def events(self, player: str, t0=None, t1=None,
+               event_types: Iterable[str] | None = None) -> pd.DataFrame:
+        """플레이어 하나의 [t0, t1] 구간 이벤트 (없는 플레이어면 빈 프레임)"""
+        if player not in self:
+            return empty_raw()
+        return self[player].events(t0, t1, event_types)
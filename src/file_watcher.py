@@ -1,9 +1,131 @@
 from __future__ import annotations
+import threading
 import time
+from pathlib import Path
 from .cache_manager import CacheManager
 
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog 미설치 환경에서는 polling만 사용
+    FileSystemEventHandler = object
+    Observer = None
+
 def poll_watch(cache: CacheManager, interval: float = 2.0):
-    """Simple polling watcher. Replace with watchdog if needed."""
+    """Simple polling watcher. Fallback for filesystems without inotify support."""
     while True:
         cache.refresh()
         time.sleep(interval)
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher: "DebouncedWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        if event.is_directory:
+            # 새 날짜 폴더가 통째로 복사/이동된 경우: 감시 등록 전에 생긴 파일도 확인
+            if event.event_type in ("created", "moved"):
+                root = Path(paths[-1] or paths[0])
+                self.watcher.enqueue(p for p in root.rglob("*") if p.is_file())
+            return
+        self.watcher.enqueue(p for p in paths if p)
+
+
+class DebouncedWatcher:
+    """
+    watchdog(inotify 등) 이벤트로 data_dir 아래(새 하위 폴더 포함)를 감시합니다.
+    같은 파일에 몰린 쓰기는 마지막 이벤트 후 debounce_ms 동안 조용해지면
+    cache.reload_paths()로 한 번만 다시 읽습니다.
+    """
+
+    def __init__(self, cache: CacheManager, debounce_ms: int = 500, root: str | Path | None = None):
+        if Observer is None:
+            raise RuntimeError("watchdog is not installed")
+        self.cache = cache
+        self.debounce = debounce_ms / 1000.0
+        self.root = Path(root) if root is not None else cache.data_dir
+        self._pending: dict[Path, float] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._observer = Observer()
+        self._flusher = threading.Thread(target=self._flush_loop, name="log-watch-flush", daemon=True)
+
+    def start(self) -> "DebouncedWatcher":
+        self._observer.schedule(_Handler(self), str(self.root), recursive=True)
+        self._observer.start()  # inotify 미지원/한도 초과면 OSError
+        self._flusher.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._observer.stop()
+        self._observer.join()
+        self._flusher.join()
+
+    def enqueue(self, paths):
+        now = time.monotonic()
+        with self._cond:
+            for p in paths:
+                self._pending[Path(p)] = now
+            self._cond.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    ready = [p for p, t in self._pending.items() if now - t >= self.debounce]
+                    if ready:
+                        break
+                    waits = [self.debounce - (now - t) for t in self._pending.values()]
+                    self._cond.wait(timeout=min(waits) if waits else None)
+                if self._stopped:
+                    return
+                for p in ready:
+                    del self._pending[p]
+            try:
+                self.cache.reload_paths(ready)
+            except Exception as e:
+                print(f"[watcher] Reload failed: {e}")
+
+
+class PollingWatcher:
+    """poll_watch를 백그라운드 스레드로 돌리는 대체 감시자."""
+
+    def __init__(self, cache: CacheManager, interval: float = 2.0):
+        self.cache = cache
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="log-watch-poll", daemon=True)
+
+    def start(self) -> "PollingWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.cache.refresh()
+            except Exception as e:
+                print(f"[watcher] Refresh failed: {e}")
+
+
+def start_watcher(cache: CacheManager, debounce_ms: int = 500, interval: float = 2.0,
+                  root: str | Path | None = None):
+    """이벤트 기반 감시를 시작하고, 불가능하면 polling 감시로 대체합니다."""
+    try:
+        return DebouncedWatcher(cache, debounce_ms, root).start()
+    except (RuntimeError, OSError) as e:
+        print(f"[watcher] Event watching unavailable ({e}); falling back to polling")
+        return PollingWatcher(cache, interval).start()
@@ -0,0 +1,135 @@
+from __future__ import annotations
+from collections.abc import Iterator, Mapping
+import numpy as np
+import pandas as pd
+from .parser import EVENT_CODES, event_codes
+
+# segments 보관 모드(CacheManager retention="segments")에서 raw 대신 남기는 그랩 순서 표.
+# First-Grab TOP3는 세그먼트 [t_begin, t_end] 안의 InputGrab만 보므로, 세그먼트마다 처음 잡은 순서대로의
+# 서로 다른 오브젝트(이름, 세그먼트 시작부터의 오프셋, 순번)만 남겨도 raw로 계산한 것과 같은 결과가 나옵니다.
+# root 제외 여부는 조회할 때 고르므로 root도 그대로 남깁니다.
+GRAB_COLUMNS = ["t_begin", "t_end", "grab_order", "object_name", "offset"]
+
+
+def _empty_table() -> pd.DataFrame:
+    return pd.DataFrame({"t_begin": pd.Series(dtype="datetime64[ns]"),
+                         "t_end": pd.Series(dtype="datetime64[ns]"),
+                         "grab_order": pd.Series(dtype=np.int32),
+                         "object_name": pd.Series(dtype="category"),
+                         "offset": pd.Series(dtype="timedelta64[ns]")})
+
+
+def _grabs(raw: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """raw의 InputGrab 행 (시각 배열, 오브젝트명 배열), 시각 순"""
+    grabs = raw[event_codes(raw) == EVENT_CODES["InputGrab"]].sort_values("timestamp", kind="mergesort")
+    return grabs["timestamp"].to_numpy(dtype="datetime64[ns]"), grabs["value"].to_numpy(dtype=object)
+
+
+def _window_rows(ts: np.ndarray, names: np.ndarray, windows, seen: dict | None = None) -> pd.DataFrame:
+    """
+    창 [t0, t1]마다 처음 잡은 순서대로의 서로 다른 오브젝트 행.
+    seen: 창 -> 이미 표에 있는 오브젝트 집합 (있으면 그 뒤 순번으로 새 오브젝트만 덧붙임)
+    """
+    t_begin, t_end, order, objects, offsets = [], [], [], [], []
+    for t0, t1 in windows:
+        lo = np.searchsorted(ts, t0, side="left")
+        hi = np.searchsorted(ts, t1, side="right")
+        have = set() if seen is None else seen.get((t0, t1), set())
+        n = len(have)
+        for i in range(lo, hi):
+            if names[i] in have:
+                continue
+            have = have | {names[i]}
+            n += 1
+            t_begin.append(t0)
+            t_end.append(t1)
+            order.append(n)
+            objects.append(names[i])
+            offsets.append(ts[i] - t0)
+    if not order:
+        return _empty_table()
+    return pd.DataFrame({"t_begin": np.array(t_begin, dtype="datetime64[ns]"),
+                         "t_end": np.array(t_end, dtype="datetime64[ns]"),
+                         "grab_order": np.array(order, dtype=np.int32),
+                         "object_name": pd.Categorical(objects),
+                         "offset": np.array(offsets, dtype="timedelta64[ns]")})
+
+
+def _windows(seg: pd.DataFrame) -> list[tuple[np.datetime64, np.datetime64]]:
+    w = seg.loc[seg["t_begin"].notna() & seg["t_end"].notna(), ["t_begin", "t_end"]].drop_duplicates()
+    return list(zip(w["t_begin"].to_numpy(dtype="datetime64[ns]"), w["t_end"].to_numpy(dtype="datetime64[ns]")))
+
+
+def build_grab_table(raw: pd.DataFrame, seg: pd.DataFrame) -> pd.DataFrame:
+    """플레이어 한 명의 raw/세그먼트 -> 세그먼트 창별 서로 다른 그랩 오브젝트 (처음 잡은 순)"""
+    if raw.empty or seg.empty:
+        return _empty_table()
+    return _window_rows(*_grabs(raw), _windows(seg))
+
+
+class GrabTable(Mapping):
+    """PlayerID -> 그랩 순서 표 (build_grab_table). first_grab_top3_all에 raw 대신 넘길 수 있습니다."""
+
+    def __init__(self):
+        self._tables: dict[str, pd.DataFrame] = {}
+
+    def update(self, pid: str, raw: pd.DataFrame, seg: pd.DataFrame):
+        self._tables[pid] = build_grab_table(raw, seg)
+
+    def extend(self, pid: str, raw: pd.DataFrame, seg: pd.DataFrame, n_final: int, new: pd.DataFrame):
+        """
+        꼬리 이어 붙이기(CacheManager._append_tail)용 갱신. seg[:n_final]은 이전부터 확정된 세그먼트라
+        그 창의 기존 행은 두고 새 줄(new)의 그랩만 뒤 순번으로 덧붙이고(새 줄은 기존 줄보다 늦음),
+        나머지 창은 raw(열린 꼬리 시작 시각부터 남긴 행 + new)로 다시 만듭니다.
+        """
+        old = self._tables.get(pid)
+        if old is None:
+            self.update(pid, raw, seg)
+            return
+        final = _windows(seg.iloc[:n_final])
+        keys = list(zip(old["t_begin"].to_numpy(dtype="datetime64[ns]"),
+                        old["t_end"].to_numpy(dtype="datetime64[ns]")))
+        final_set = set(final)
+        kept = old[np.fromiter((k in final_set for k in keys), dtype=bool, count=len(keys))]
+        seen: dict = {}
+        for k, name in zip(keys, old["object_name"].to_numpy(dtype=object)):
+            if k in final_set:
+                seen.setdefault(k, set()).add(name)
+        ts, names = _grabs(new)
+        late = [w for w in final if len(ts) and w[1] >= ts[0]]  # 새 줄과 시각이 겹치는 확정 창
+        fresh = [w for w in _windows(seg.iloc[n_final:]) if w not in final_set]
+        parts = [kept, _window_rows(ts, names, late, seen), _window_rows(*_grabs(raw), fresh)]
+        parts = [p for p in parts if not p.empty]
+        if not parts:
+            self._tables[pid] = _empty_table()
+            return
+        table = pd.concat(parts, ignore_index=True)
+        table["object_name"] = table["object_name"].astype(object).astype("category")
+        self._tables[pid] = table
+
+    def remove(self, pid: str):
+        self._tables.pop(pid, None)
+
+    def __getitem__(self, pid: str) -> pd.DataFrame:
+        return self._tables[pid]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._tables)
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def sequence(self, pid: str, t_begin, t_end, exclude_roots: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """세그먼트 [t_begin, t_end]에서 처음 잡은 순서대로의 (오브젝트명 배열, 오프셋 ns 배열)"""
+        table = self._tables.get(pid)
+        if table is None or table.empty:
+            return np.array([], dtype=object), np.array([], dtype=np.int64)
+        hit = ((table["t_begin"].to_numpy() == np.datetime64(t_begin, "ns"))
+               & (table["t_end"].to_numpy() == np.datetime64(t_end, "ns")))
+        rows = table[hit]
+        if exclude_roots:
+            rows = rows[rows["object_name"].astype(str).str.strip().str.lower() != "root"]
+        return rows["object_name"].to_numpy(dtype=object), rows["offset"].to_numpy().astype(np.int64)
+
+    def memory_bytes(self) -> int:
+        return sum(int(t.memory_usage(deep=True).sum()) for t in self._tables.values())
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import io
+import json
+import os
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+import pandas as pd
+from .aggregator import first_grab_top3_all, personal_stage_exit_counts
+from .cache_manager import cache_variant, parse_file
+from .disk_cache import DiskCache, file_digest
+from .parser import filename_to_player_id
+from .stage_store import StageAggregateStore
+
+# app_cli --incremental: 출력 폴더에 입력 파일 지문(manifest)을 남기고,
+# 다음 실행에서는 바뀐 플레이어와 그 플레이어가 나온 스테이지의 행만 다시 계산합니다.
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+OUTPUT_FILES = ("global_stage_means.csv", "personal_exit_counts.csv", "first_grab_top3_by_stage.csv")
+
+
+def read_manifest(outdir: Path) -> dict | None:
+    try:
+        return json.loads((Path(outdir) / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_manifest(outdir: Path, options: dict, files: dict[str, dict]):
+    path = Path(outdir) / MANIFEST_NAME
+    tmp = path.with_suffix(".tmp")
+    doc = {"version": MANIFEST_VERSION, "options": options, "files": files}
+    tmp.write_text(json.dumps(doc, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def fingerprint(paths: list[Path], previous: dict[str, dict]) -> dict[str, dict]:
+    """
+    경로 -> {player, size, mtime_ns, hash}. 크기/mtime이 이전과 같으면 해시를 다시 계산하지 않습니다
+    (DiskCache와 같은 규칙).
+    """
+    files = {}
+    for path in paths:
+        st = path.stat()
+        key = str(path.resolve())
+        prev = previous.get(key)
+        if prev is not None and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            digest = prev["hash"]
+        else:
+            digest = file_digest(path)
+        files[key] = {"player": filename_to_player_id(path), "size": st.st_size,
+                      "mtime_ns": st.st_mtime_ns, "hash": digest}
+    return files
+
+
+def changed_players(old: dict[str, dict], new: dict[str, dict]) -> set[str]:
+    """추가/삭제/내용이 바뀐 파일의 PlayerID (touch만 된 파일은 제외)"""
+    changed = {e["player"] for k, e in new.items()
+               if k not in old or old[k]["hash"] != e["hash"]}
+    changed |= {e["player"] for k, e in old.items() if k not in new}
+    return changed
+
+
+def plan(outdir: Path, paths: list[Path], options: dict) -> tuple[bool, set[str], dict[str, dict]]:
+    """
+    (전체 재계산 필요 여부, 바뀐 플레이어, 현재 입력 지문).
+    manifest가 없거나 옵션/버전이 다르거나 출력 파일이 빠졌으면 전체 재계산입니다.
+    """
+    man = read_manifest(outdir)
+    usable = (man is not None and man.get("version") == MANIFEST_VERSION
+              and man.get("options") == options
+              and all((Path(outdir) / name).exists() for name in OUTPUT_FILES))
+    old = man["files"] if usable else {}
+    files = fingerprint(paths, old)
+    if not usable:
+        return True, set(), files
+    return False, changed_players(old, files), files
+
+
+class _LazyRaw(Mapping):
+    """PlayerID -> raw 프레임. TOP3 대상으로 뽑힌 플레이어의 raw만 처음 조회될 때 읽습니다."""
+
+    def __init__(self, paths: dict[str, Path], load):
+        self._paths = paths
+        self._load = load
+        self._frames: dict[str, pd.DataFrame] = {}
+
+    def __getitem__(self, pid: str) -> pd.DataFrame:
+        if pid not in self._frames:
+            self._frames[pid] = self._load(self._paths[pid])
+        return self._frames[pid]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+def _as_text(df: pd.DataFrame) -> pd.DataFrame:
+    """to_csv가 쓰는 그대로의 문자열 프레임 (기존 출력 행과 합쳐도 바이트가 같게)"""
+    buf = io.StringIO()
+    df.to_csv(buf, index=False)
+    buf.seek(0)
+    return pd.read_csv(buf, dtype=str, keep_default_na=False)
+
+
+def _read_text(path: Path) -> pd.DataFrame:
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8")
+
+
+def _merge(kept: pd.DataFrame, new: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    frames = [f for f in (kept, new) if not f.empty]
+    if not frames:
+        return new
+    cols = list(frames[-1].columns)
+    out = pd.concat([f[cols] for f in frames], ignore_index=True)
+    return out.sort_values(by, kind="mergesort", ignore_index=True)
+
+
+def recompute(outdir: Path, paths: list[Path], selected: set[str] | None, affected: set[str],
+              disk_cache: DiskCache | None = None, assume_orphan: bool = True,
+              segment_engine: str = "vectorized") -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    기존 출력에서 affected 플레이어의 행과, 그 플레이어가 (이전/현재) 나온 스테이지의 행만
+    다시 계산해 (global_means, personal_exit, top3)를 문자열 프레임으로 돌려줍니다.
+
+    영향받는 스테이지의 평균/TOP3는 모든 플레이어의 세그먼트가 필요하므로 세그먼트는
+    전부 읽되(디스크 캐시 적중 시 seg Feather만), raw는 TOP3로 뽑힌 플레이어 것만 읽습니다.
+    플레이어 순서는 CacheManager와 같은 glob 순서라 결과가 전체 재계산과 같습니다.
+    """
+    outdir = Path(outdir)
+    variant = cache_variant(assume_orphan)
+
+    def parse(path: Path) -> dict:
+        return parse_file(path, assume_orphan, segment_engine, disk_cache)
+
+    def load_raw(path: Path) -> pd.DataFrame:
+        hit = disk_cache.get(path, variant) if disk_cache is not None else None
+        return hit[0] if hit is not None else parse(path)["raw"]
+
+    segs_by_player: dict[str, pd.DataFrame] = {}
+    paths_by_player: dict[str, Path] = {}
+    for path in paths:
+        pid = filename_to_player_id(path)
+        if selected is not None and pid not in selected:
+            continue
+        try:
+            seg = disk_cache.get_segments(path, variant) if disk_cache is not None else None
+            if seg is None:
+                seg = parse(path)["seg"]
+        except Exception as e:
+            print(f"[incremental] Skip {path.name}: {e}")
+            continue
+        segs_by_player[pid] = seg
+        paths_by_player[pid] = path
+
+    old_means = _read_text(outdir / OUTPUT_FILES[0])
+    old_exits = _read_text(outdir / OUTPUT_FILES[1])
+    old_top3 = _read_text(outdir / OUTPUT_FILES[2])
+
+    stages = set(old_exits.loc[old_exits["PlayerID"].isin(affected), "stage"])
+    for pid in affected & segs_by_player.keys():
+        stages |= set(segs_by_player[pid]["stage"].dropna())
+
+    store = StageAggregateStore()
+    for pid, seg in segs_by_player.items():
+        store.update(pid, seg[seg["stage"].isin(stages)])
+    means = store.global_stage_means(list(segs_by_player))
+
+    if segs_by_player:
+        segs = pd.concat(segs_by_player.values(), ignore_index=True)
+    else:
+        segs = pd.DataFrame(columns=["PlayerID", "stage", "t_begin", "t_end"])
+    exits = personal_stage_exit_counts(segs[segs["PlayerID"].isin(affected)], sorted(affected))
+    top3 = first_grab_top3_all(segs[segs["stage"].isin(stages)],
+                               _LazyRaw(paths_by_player, load_raw), None, policies=("earliest",))
+
+    means = _merge(old_means[~old_means["stage"].isin(stages)], _as_text(means), ["stage"])
+    exits = _merge(old_exits[~old_exits["PlayerID"].isin(affected)], _as_text(exits),
+                   ["PlayerID", "stage"])
+    top3 = _merge(old_top3[~old_top3["stage"].isin(stages)],
+                  _as_text(top3.reindex(columns=old_top3.columns)), ["stage"])
+    print(f"[incremental] Recomputed {len(affected)} players, {len(stages)} stages")
+    return means, exits, top3
@@ -1,8 +1,52 @@
 # src/parser.py
 from __future__ import annotations
-from pathlib import Path
+import functools
+import hashlib
+import io
+import re
+import time
+from pathlib import Path, PurePath
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from .profiler import profiled
+
+# 파싱 결과 형식이 바뀌면 올린다 (디스크 캐시 무효화용)
+PARSER_VERSION = 3
+
+# 안정적인 이벤트 코드 표: 파일/프로세스/디스크 캐시와 무관하게 고정.
+# 표에 없는 이벤트는 EV_OTHER. 새 이벤트는 끝에만 추가한다.
+EV_OTHER = 0
+EVENT_CODES: dict[str, int] = {name: code for code, name in enumerate([
+    "StageBegin", "StageClear", "StageExit", "StageRetry", "StageStar",
+    "InputGrab", "InputGrabBreak", "InputPushPull",
+    "CameraZoom", "CameraRotate", "CameraPanning",
+    "SeesawTilt", "OrbitOrthoProxy", "BlockToBomb",
+    "SequentialBombInit", "StageConfigSetup", "MissingManager", "MissingReference",
+    # 아래는 MESSAGE_PATTERNS로 분류되는 자유 문장 메시지의 정규 이벤트
+    "BombDetect", "BombExplode", "BombCreate", "BombCollision",
+    "ClimaxExplodeMode", "ClimaxExplode", "ClimaxRequest", "ClimaxRequestSkipped",
+    "BombAlreadyExploded", "ClimaxInactive",
+], start=1)}
+
+# 오브젝트 이름이 섞인 한국어 자유 문장 이벤트 -> (정규 이벤트, 오브젝트 id).
+# 위에서부터 처음 맞는 패턴을 쓰고, 오브젝트 id는 이름 그룹 obj로 뽑는다.
+# 표를 바꾸면 PATTERNS_DIGEST가 바뀌어 디스크 캐시가 자동으로 무효화된다.
+MESSAGE_PATTERNS: list[tuple[str, str]] = [
+    ("BombDetect",           r"^폭탄 (?P<obj>.+?)을\(를\) 감지했습니다\.$"),
+    ("BombExplode",          r"^\[BombManager\] 폭탄 (?P<obj>.+?)이\(가\) 폭발했습니다\.$"),
+    ("BombCreate",           r"^\[BombManager\] 폭탄 (?P<obj>.+?)이\(가\) 생성되었습니다\.$"),
+    ("BombCollision",        r"^충돌 감지: (?P<obj>.+?) 즉시 폭발 처리 \(\w+ 모드\)$"),
+    ("ClimaxExplodeMode",    r"^\[ClimaxController\] 폭발 처리 모드: \w+ for (?P<obj>.+)$"),
+    ("ClimaxExplode",        r"^\[ClimaxController\] 폭탄 폭발: (?P<obj>.+?) at "),
+    ("ClimaxRequest",        r"^\[climax\]폭발 요청 폭발 진행$"),
+    ("ClimaxRequestSkipped", r"^\[climax\]폭발 요청된 폭탄이 null이거나 이미 폭발했습니다\.$"),
+    ("BombAlreadyExploded",  r"^(?P<obj>.+?)은\(는\) 이미 폭발했습니다\. 무시합니다\.$"),
+    ("ClimaxInactive",       r"^\[클라이맥스컨트롤러\] (?P<obj>.+?)이\(가\) 비활성화 상태입니다\.$"),
+]
+PATTERNS_DIGEST = hashlib.blake2b(repr(MESSAGE_PATTERNS).encode("utf-8"), digest_size=4).hexdigest()
+_COMPILED_PATTERNS = [(EVENT_CODES[name], re.compile(rx)) for name, rx in MESSAGE_PATTERNS]
 
 HEADER_ALIASES = {
     "Timestamp": ["Timestamp", "Time", "시간", "타임스탬프", "ts", "date", "datetime"],
@@ -12,8 +56,64 @@ HEADER_ALIASES = {
     "Value":     ["Value", "값", "데이터", "파라미터"],
 }
 
+# Unity 로그 고정 형식: 이 헤더면 Arrow 빠른 경로로 읽는다
+FAST_HEADER = ("LogType", "Timestamp", "Key", "Value")
+# pandas read_csv 기본 결측 문자열과 동일하게 맞춤
+_NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+              "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+              "n/a", "nan", "null"]
+
+# 압축 로그: 확장자 -> pyarrow 코덱. 임시 파일 없이 읽으면서 풉니다 (Player_1_20251101.csv.zst 등).
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+_HEADER_CHUNK = 1 << 16
+
+def compression_of(path: Path) -> str | None:
+    """압축 로그면 코덱 이름, 아니면 None"""
+    return COMPRESSED_SUFFIXES.get(Path(path).suffix)
+
 def filename_to_player_id(path: Path) -> str:
-    return Path(path).stem
+    path = Path(path)
+    if path.suffix in COMPRESSED_SUFFIXES:
+        path = path.with_suffix("")
+    return path.stem
+
+def open_log(path: Path):
+    """로그 파일을 바이너리 스트림으로 엽니다. 압축 파일은 읽는 만큼만 풀립니다."""
+    return pa.input_stream(str(path), compression=compression_of(path))
+
+def log_patterns(pattern: str) -> list[str]:
+    """"*.csv" -> ["*.csv", "*.csv.gz", "*.csv.zst"] (이미 압축 확장자로 끝나면 그대로)"""
+    if PurePath(pattern).suffix in COMPRESSED_SUFFIXES:
+        return [pattern]
+    return [pattern] + [pattern + suffix for suffix in COMPRESSED_SUFFIXES]
+
+def scan_logs(data_dir: Path, pattern: str = "*.csv") -> list[Path]:
+    """
+    pattern과 그 압축 변형에 맞는 파일 (평문 먼저, 각 패턴 안은 glob 순서).
+    압축하는 도중이라 같은 플레이어 파일이 둘 있으면 먼저 나온 것만 씁니다.
+    """
+    data_dir = Path(data_dir)
+    seen: set[str] = set()
+    paths = []
+    for pat in log_patterns(pattern):
+        for p in data_dir.glob(pat):
+            pid = filename_to_player_id(p)
+            if pid not in seen:
+                seen.add(pid)
+                paths.append(p)
+    return paths
+
+def read_header_line(path: Path) -> bytes:
+    """첫 줄(줄바꿈 포함). 압축 파일은 첫 블록만 풉니다."""
+    with open_log(path) as f:
+        buf = b""
+        while b"\n" not in buf:
+            chunk = f.read(_HEADER_CHUNK)
+            if not chunk:
+                break
+            buf += chunk
+    cut = buf.find(b"\n")
+    return buf if cut < 0 else buf[:cut + 1]
 
 def _find_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
     lowers = {c.lower(): c for c in df.columns}
@@ -24,6 +124,7 @@ def _find_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
             return lowers[name.lower()]
     return None
 
+@profiled("parse.timestamp", rows=0)
 def _coerce_timestamp(series: pd.Series) -> pd.Series:
     ts = pd.to_datetime(series, errors="coerce")
     if ts.isna().all():
@@ -60,9 +161,12 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     else:
         dfn["Timestamp"] = _coerce_timestamp(dfn["Timestamp"])
 
-    # 3) 문자열 정리
+    # 3) 문자열 정리 + 사전 인코딩(category)
     for col in ["Event", "Level", "Key", "Value"]:
         dfn[col] = dfn[col].astype(str).str.strip().str.strip('"').str.strip("'")
+    for col in dfn.columns:
+        if dfn[col].dtype == object:
+            dfn[col] = dfn[col].astype("category")
 
     # 4) 소문자 표준으로 최종 리네이밍 (PlayerID는 나중에 주입)
     dfn = dfn.rename(columns={
@@ -73,32 +177,232 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
         "Value": "value",
     })
 
+    dfn["event_code"], dfn["event_obj"] = classify_events(dfn["event"])
+
     dfn.sort_values(["timestamp"], inplace=True, kind="mergesort")
     dfn.reset_index(drop=True, inplace=True)
     return dfn
 
-def load_csv(path: Path, player_id: str | None = None) -> pd.DataFrame:
-    path = Path(path)
+@functools.lru_cache(maxsize=65536)
+def classify_message(text: str) -> tuple[int, str | None]:
+    """이벤트 문자열 하나 -> (이벤트 코드, 오브젝트 id). 최근 문자열 65536개까지 결과를 재사용."""
+    code = EVENT_CODES.get(text)
+    if code is not None:
+        return code, None
+    for code, rx in _COMPILED_PATTERNS:
+        m = rx.match(text)
+        if m:
+            return code, m.groupdict().get("obj")
+    return EV_OTHER, None
+
+def classify_events(events: pd.Series) -> tuple[np.ndarray, pd.Categorical]:
+    """
+    event 컬럼 -> (EVENT_CODES 정수 배열, 오브젝트 id category).
+    정규식은 카테고리(고유 문자열)에만 적용하고 결과를 사전 코드로 행에 펼칩니다.
+    """
+    cat = events if isinstance(events.dtype, pd.CategoricalDtype) else events.astype("category")
+    results = [classify_message(str(c).strip()) for c in cat.cat.categories]
+    objs: dict[str, int] = {}
+    for _, obj in results:
+        if obj is not None:
+            objs.setdefault(obj, len(objs))
+    # 마지막 = 결측(code -1)
+    code_table = np.array([code for code, _ in results] + [EV_OTHER], dtype=np.int16)
+    obj_table = np.array([objs[obj] if obj is not None else -1 for _, obj in results] + [-1],
+                         dtype=np.int32)
+    codes = cat.cat.codes.to_numpy()
+    return code_table[codes], pd.Categorical.from_codes(obj_table[codes], categories=list(objs))
+
+def encode_events(events: pd.Series) -> np.ndarray:
+    """event 컬럼 -> EVENT_CODES 정수 배열 (문자열 비교는 고유값에서만)"""
+    return classify_events(events)[0]
+
+def event_codes(df: pd.DataFrame) -> np.ndarray:
+    """df의 이벤트 코드 (event_code 컬럼이 없으면 event에서 계산)"""
+    if "event_code" in df.columns:
+        return df["event_code"].to_numpy()
+    return encode_events(df["event"])
+
+def player_column(player_id: str, n: int) -> pd.Categorical:
+    """n행짜리 PlayerID 컬럼 (단일 카테고리)"""
+    return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=[player_id])
+
+def concat_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    pd.concat과 같지만, 카테고리가 서로 다른 category 컬럼을 object로 풀지 않고
+    카테고리 합집합으로 맞춘 뒤 이어 붙입니다.
+    """
+    frames = [f for f in frames if f is not None]
+    if len(frames) > 1:
+        cols = [c for c in frames[0].columns
+                if all(c in f.columns and isinstance(f[c].dtype, pd.CategoricalDtype) for f in frames)]
+        if cols:
+            frames = [f.copy(deep=False) for f in frames]
+            for c in cols:
+                cats = pd.Index(np.concatenate([f[c].cat.categories.to_numpy() for f in frames])).unique()
+                for f in frames:
+                    f[c] = f[c].cat.set_categories(cats)
+    return pd.concat(frames, ignore_index=True)
+
+def _clean_categories(s: pd.Series) -> pd.Series:
+    """astype(str) + strip 정리를 카테고리(고유값)에만 적용합니다."""
+    if s.isna().any():
+        s = s.cat.add_categories(["nan"]).fillna("nan")
+    cats = s.cat.categories.astype(str)
+    cleaned = cats.str.strip().str.strip('"').str.strip("'")
+    if cleaned.equals(cats):
+        return s
+    if cleaned.is_unique:
+        return s.cat.rename_categories(cleaned)
+    return pd.Series(np.asarray(cleaned)[s.cat.codes.to_numpy()], index=s.index).astype("category")
+
+def _is_fast_header(header_line: bytes) -> bool:
+    line = header_line.lstrip(b"\xef\xbb\xbf").rstrip(b"\r\n")
+    return tuple(line.decode("utf-8", errors="replace").split(",")) == FAST_HEADER
+
+def _valid_utf8(buf: pa.Buffer) -> bool:
+    """buf 전체가 올바른 UTF-8인지 (문자열로 디코딩/복사하지 않고 Arrow로 검사)"""
+    offsets = pa.py_buffer(np.array([0, buf.size], dtype=np.int64))
+    try:
+        pa.Array.from_buffers(pa.large_string(), 1, [None, offsets, buf]).validate(full=True)
+    except pa.ArrowInvalid:
+        return False
+    return True
+
+def _read_fast(buf: pa.Buffer) -> pd.DataFrame | None:
+    """
+    FAST_HEADER 형식 전용 Arrow CSV 경로. 타입을 명시하고(문자열은 사전 인코딩,
+    Timestamp는 ISO-8601) 멀티스레드로 읽습니다. 일반 경로와 결과가 달라질 수 있는
+    입력(필드 수 부족, 잘못된 UTF-8, 파싱 불가 타임스탬프)이면 None을 반환합니다.
+    UTF-8은 미리 검사합니다 (잘못된 바이트가 필드 수 부족 행에 있으면 Arrow가 on_invalid에 넘길
+    행 텍스트를 디코딩하다 실패해 "Exception ignored" 경고를 찍으므로).
+    """
+    if not _valid_utf8(buf):
+        return None
+    short_rows = []
+
+    def on_invalid(row):
+        if row.actual_columns < row.expected_columns:
+            short_rows.append(row.number)  # pandas는 부족한 필드를 NaN으로 채움
+        return "skip"
+
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    try:
+        table = pacsv.read_csv(
+            pa.BufferReader(buf),
+            read_options=pacsv.ReadOptions(use_threads=True),
+            parse_options=pacsv.ParseOptions(invalid_row_handler=on_invalid),
+            convert_options=pacsv.ConvertOptions(
+                column_types={"LogType": dict_str, "Timestamp": pa.timestamp("ns"),
+                              "Key": dict_str, "Value": dict_str},
+                timestamp_parsers=[pacsv.ISO8601],
+                null_values=_NA_VALUES,
+                strings_can_be_null=True,
+            ),
+        )
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        return None
+    if short_rows or table.column_names != list(FAST_HEADER):
+        return None
+
+    df = table.to_pandas()
+    # _normalize_columns와 같은 컬럼 순서/값: LogType, timestamp, key, value, event, level
+    df = df.rename(columns={"Timestamp": "timestamp", "Key": "key", "Value": "value"})
+    df["key"] = _clean_categories(df["key"])
+    df["value"] = _clean_categories(df["value"])
+    df["event"] = df["key"]
+    df["level"] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=["INFO"])
+    df["event_code"], df["event_obj"] = classify_events(df["event"])
+    df.sort_values(["timestamp"], inplace=True, kind="mergesort")
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+def _load_frame(source, header_line: bytes, stats: dict | None) -> pd.DataFrame:
+    """헤더가 고정 형식이면 빠른 경로, 아니면 별칭 해석 일반 경로로 파싱합니다."""
+    t0 = time.perf_counter()
+    df = None
+    compressed = not isinstance(source, io.BytesIO) and compression_of(source) is not None
+    if _is_fast_header(header_line):
+        if isinstance(source, io.BytesIO):
+            df = _read_fast(pa.py_buffer(source.getvalue()))
+        elif compressed:
+            with open_log(source) as f:
+                df = _read_fast(pa.py_buffer(f.read()))
+        else:
+            with pa.memory_map(str(source)) as mm:
+                df = _read_fast(mm.read_buffer())
+    fast = df is not None
+    if not fast:
+        if compressed:
+            with open_log(source) as f:
+                df = _normalize_columns(_read_frame(f))
+        else:
+            df = _normalize_columns(_read_frame(source))
+    if stats is not None:
+        elapsed = time.perf_counter() - t0
+        stats.update(rows=len(df), seconds=elapsed, fast_path=fast,
+                     rows_per_sec=len(df) / elapsed if elapsed > 0 else float("inf"))
+    return df
+
+def _read_frame(source) -> pd.DataFrame:
     # on_bad_lines='skip': 잘못된 형식의 라인 건너뛰기 (pandas 1.3+)
     # encoding_errors='replace': 인코딩 오류 발생 시 대체 문자로 변환
-    df = pd.read_csv(
-        path, 
+    return pd.read_csv(
+        source, 
         encoding="utf-8",
         on_bad_lines='skip',
         encoding_errors='replace'
     )
-    df = _normalize_columns(df)
-    df["PlayerID"] = player_id or filename_to_player_id(path)
+
+@profiled("parse", detail=lambda path, *a, **k: Path(path).name)
+def load_csv(path: Path, player_id: str | None = None, stats: dict | None = None) -> pd.DataFrame:
+    """
+    stats에 dict를 넘기면 rows, seconds, rows_per_sec, fast_path를 채워줍니다.
+    .csv.gz / .csv.zst는 스트림으로 풀면서 같은 방식으로 파싱합니다.
+    """
+    path = Path(path)
+    df = _load_frame(path, read_header_line(path), stats)
+    df["PlayerID"] = player_column(player_id or filename_to_player_id(path), len(df))
     return df
 
+def read_complete_lines(path: Path, offset: int = 0, final: bool = False) -> tuple[bytes, int]:
+    """
+    offset부터 마지막 줄바꿈까지의 바이트와 그 끝 오프셋을 반환합니다.
+    Unity가 쓰는 중인 마지막 미완성 줄은 다음 읽기로 미룹니다.
+    final=True(쓰기가 끝난 파일)면 줄바꿈 없이 끝나는 마지막 줄까지 포함합니다.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    cut = len(data) if final else data.rfind(b"\n") + 1
+    return data[:cut], offset + cut
+
+@profiled("parse", detail=lambda data, player_id, *a, **k: player_id)
+def load_csv_bytes(data: bytes, player_id: str, stats: dict | None = None) -> pd.DataFrame:
+    """헤더 줄을 포함한 CSV 바이트를 load_csv와 같은 방식으로 파싱합니다."""
+    df = _load_frame(io.BytesIO(data), data[:data.find(b"\n") + 1], stats)
+    df["PlayerID"] = player_column(player_id, len(df))
+    return df
+
+@functools.cache
+def _empty_raw_template() -> pd.DataFrame:
+    header = ",".join(FAST_HEADER).encode("utf-8") + b"\n"
+    df = _load_frame(io.BytesIO(header), header, None)
+    df["PlayerID"] = pd.Categorical([])
+    return df
+
+def empty_raw() -> pd.DataFrame:
+    """파서 출력과 같은 컬럼/dtype의 0행 raw 프레임 (헤더만 있는 로그를 파싱한 결과)"""
+    return _empty_raw_template().copy()
+
 def load_dir(data_dir: Path, pattern: str = "*.csv") -> pd.DataFrame:
     data_dir = Path(data_dir)
     frames = []
-    for p in data_dir.glob(pattern):
+    for p in scan_logs(data_dir, pattern):
         try:
             frames.append(load_csv(p))
         except Exception as e:
             print(f"[parser] Skip {p.name}: {e}")
     if not frames:
-        return pd.DataFrame(columns=["timestamp","event","level","key","value","PlayerID"])
-    return pd.concat(frames, ignore_index=True)
\ No newline at end of file
+        return empty_raw()
+    return concat_frames(frames)
\ No newline at end of file
@@ -0,0 +1,101 @@
+from __future__ import annotations
+import argparse
+import gzip
+import json
+import os
+from pathlib import Path
+from .cache_manager import result_stamp
+from .streaming import StreamingAggregator
+
+# app_cli --map / --reduce: 날짜 폴더(또는 그 안의 플레이어 파일 샤드) 하나를 작은 부분 집계 파일로 줄이고,
+# 여러 부분 집계 파일을 합쳐 app_cli와 같은 출력을 만듭니다. 샤드는 다른 코어/머신에서 돌려도 되고
+# 주고받는 것은 부분 집계 파일뿐입니다. 파일 이름이 .gz로 끝나면 gzip으로 압축합니다.
+PARTIAL_VERSION = 1
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """argparse type: "I/N" -> (I, N), 0 <= I < N"""
+    try:
+        i, n = (int(x) for x in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {text!r}")
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {n})")
+    return i, n
+
+
+def shard_paths(paths: list[Path], shard: tuple[int, int] | None) -> list[Path]:
+    """
+    paths(CacheManager와 같은 glob 순서)를 N개 연속 구간으로 나눈 I번째 구간.
+    연속 구간이라 샤드 순서대로 합치면 플레이어 순서(=평균 합산 순서)가 전체 실행과 같습니다.
+    """
+    if shard is None:
+        return paths
+    i, n = shard
+    return paths[i * len(paths) // n:(i + 1) * len(paths) // n]
+
+
+def partial_options(players: str, segment_engine: str, assume_orphan: bool = True) -> dict:
+    """같은 옵션으로 만든 부분 집계끼리만 합칠 수 있음 (분할 옵션은 version 도장에 포함)"""
+    return {"players": players, "segment_engine": segment_engine,
+            "version": result_stamp(assume_orphan)}
+
+
+def _open(path: Path, mode: str, compressed: bool):
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_partial(path: Path, agg: StreamingAggregator, data: Path, shard: tuple[int, int] | None,
+                  options: dict, n_files: int):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = {"version": PARTIAL_VERSION, "options": options, "data": str(Path(data).resolve()),
+           "shard": list(shard or (0, 1)), "files": n_files, "partial": agg.to_partial()}
+    tmp = path.with_name(path.name + ".tmp")
+    with _open(tmp, "w", path.suffix == ".gz") as f:
+        json.dump(doc, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def read_partial(path: Path) -> dict:
+    with _open(path, "r", Path(path).suffix == ".gz") as f:
+        doc = json.load(f)
+    if doc.get("version") != PARTIAL_VERSION:
+        raise ValueError(f"{path}: unsupported partial version {doc.get('version')}")
+    return doc
+
+
+def reduce_partials(paths: list[Path]) -> StreamingAggregator:
+    """
+    부분 집계 파일들을 (데이터 폴더, 샤드 번호) 순으로 합칩니다. 옵션/파서 버전이 다르거나
+    같은 샤드가 두 번 들어오면 ValueError, 빠진 샤드는 경고만 출력합니다.
+    """
+    docs = [(Path(p), read_partial(p)) for p in paths]
+    if not docs:
+        raise ValueError("No partial files given")
+    options = docs[0][1]["options"]
+    for p, doc in docs:
+        if doc["options"] != options:
+            raise ValueError(f"{p}: built with different options {doc['options']} != {options}")
+    docs.sort(key=lambda x: (x[1]["data"], x[1]["shard"][0]))
+    seen: dict[str, set[int]] = {}
+    for p, doc in docs:
+        shards = seen.setdefault(doc["data"], set())
+        i, n = doc["shard"]
+        if i in shards:
+            raise ValueError(f"{p}: shard {i}/{n} of {doc['data']} given twice")
+        shards.add(i)
+    for data, shards in seen.items():
+        n = next(doc["shard"][1] for _, doc in docs if doc["data"] == data)
+        missing = sorted(set(range(n)) - shards)
+        if missing:
+            print(f"[reduce] Warning: {data} is missing shards {missing} of {n}")
+
+    agg = StreamingAggregator()
+    for _, doc in docs:
+        agg.merge_partial(doc["partial"])
+    print(f"[reduce] Merged {len(docs)} partials ({sum(d['files'] for _, d in docs)} files, "
+          f"{len(seen)} data folders)")
+    return agg
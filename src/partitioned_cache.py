@@ -0,0 +1,292 @@
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+import pandas as pd
+from .cache_manager import CacheManager, cache_variant
+from .disk_cache import DiskCache
+from .parser import filename_to_player_id, scan_logs
+from .shared_store import SharedSnapshot, attach, snapshot_options
+from .sketches import DEFAULT_QUANTILES, QuantileSketch, merge_stage_sketches
+from .stage_store import sketch_quantiles
+
+DATE_DIR_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class PartitionedCacheManager:
+    """
+    DATA 루트 아래 날짜 폴더(yyyy-mm-dd)를 파티션으로 보고 날짜별 CacheManager를 관리합니다.
+
+    - 파티션은 partition(date)로 처음 조회될 때 읽습니다. 읽는 동안에는 전체 잠금을 잡지 않으므로
+      다른 날짜 조회, 파일 감시, 상태 조회가 기다리지 않고, 같은 날짜를 동시에 요청한 쪽만 그 로딩을 기다립니다.
+    - 조회할 때마다 최근 사용 순서를 갱신하고, ttl_seconds 동안 조회되지 않은 파티션과
+      메모리 예산(memory_budget_mb)을 넘는 만큼의 오래된 파티션을 내립니다(방금 조회한 파티션은 제외).
+      내리는 일은 partition() 호출 때만 일어나므로(백그라운드 타이머 없음) 조회가 없으면 TTL이 지나도 남아 있습니다.
+    - 모든 파티션이 디스크 캐시 하나를 공유하므로 내린 파티션은 Feather에서 빠르게 다시 올라옵니다.
+    watcher에는 이 객체를 그대로 넘기면 됩니다(reload_paths/refresh는 올라온 파티션에만 전달).
+    - shared_dir이 있으면 다른 프로세스가 내보낸 최신 공유 스냅샷에 먼저 붙고(파싱 없음),
+      없거나 낡았으면 직접 읽은 뒤 그 내용을 내보냅니다. 붙은 스냅샷의 입력이 바뀌면
+      새 스냅샷으로 갈아타거나, 아직 없으면 파티션을 내려 다음 조회 때 직접 읽습니다.
+    """
+
+    def __init__(self, data_root: str | Path, file_pattern: str = "*.csv",
+                 memory_budget_mb: float | None = None,
+                 ttl_seconds: float | None = None,
+                 cache_dir: str | None = None,
+                 shared_dir: str | None = None,
+                 **cm_kwargs):
+        self.data_dir = Path(data_root)
+        self.pattern = file_pattern
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.ttl = ttl_seconds or None
+        self.disk_cache = DiskCache(cache_dir) if cache_dir else None
+        self.shared_dir = shared_dir
+        self.cm_kwargs = cm_kwargs
+        # date -> CacheManager(또는 붙은 SharedSnapshot), 최근 사용이 뒤쪽
+        self._parts: OrderedDict[str, CacheManager | SharedSnapshot] = OrderedDict()
+        self._last_used: dict[str, float] = {}
+        # 읽는 중인 날짜 -> 로딩 결과(같은 날짜를 동시에 요청한 쪽이 기다림)
+        self._loading: dict[str, Future] = {}
+        # 읽는 중인 날짜에 들어온 watcher 경로 (로딩이 끝나면 다시 확인)
+        self._pending_paths: dict[str, list] = {}
+        # 내린 파티션 기록: date -> 횟수
+        self.evictions: dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def dates(self) -> list[str]:
+        if not self.data_dir.exists():
+            return []
+        return sorted(p.name for p in self.data_dir.iterdir()
+                      if p.is_dir() and DATE_DIR_RE.fullmatch(p.name))
+
+    def loaded(self) -> list[str]:
+        with self._lock:
+            return list(self._parts)
+
+    def partition(self, date: str) -> CacheManager | SharedSnapshot:
+        """
+        date 파티션을 (필요하면 읽거나 공유 스냅샷에 붙어서) 반환하고, 예산/TTL을 넘은 파티션을 내립니다.
+        읽기/붙기는 잠금 밖에서 하고, 잠금은 결과를 등록하고 _sweep할 때만 잡습니다.
+        """
+        with self._lock:
+            cm = self._parts.get(date)
+            if cm is not None:
+                return self._use(date, cm)
+            fut = self._loading.get(date)
+            owner = fut is None
+            if owner:
+                fut = self._loading[date] = Future()
+        if not owner:
+            return self._use_loaded(date, fut.result())
+        try:
+            cm = self._load(date)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(date, None)
+                self._pending_paths.pop(date, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._loading.pop(date, None)
+            pending = self._pending_paths.pop(date, [])
+            fut.set_result(cm)
+            cm = self._use_loaded(date, cm)
+        if pending and isinstance(cm, CacheManager):
+            cm.reload_paths(pending)  # 읽는 동안 바뀐 파일
+        return cm
+
+    def _load(self, date: str) -> CacheManager | SharedSnapshot:
+        """date 파티션을 공유 스냅샷에 붙거나 직접 읽어 만듭니다 (잠금 없이 호출)."""
+        cm = self._attach(date)
+        if cm is None:
+            # segments 보관 모드는 raw가 없어 내보내지 않음 (다른 프로세스가 내보낸 스냅샷에는 붙음)
+            publish = self.shared_dir if self.cm_kwargs.get("retention", "full") == "full" else None
+            cm = CacheManager(str(self.data_dir / date), self.pattern,
+                              cache_dir=self.disk_cache, shared_dir=publish,
+                              **self.cm_kwargs)
+            cm.initial_load()
+        return cm
+
+    def _use_loaded(self, date: str, cm: CacheManager | SharedSnapshot) -> CacheManager | SharedSnapshot:
+        """읽은 파티션을 등록합니다. 다른 요청이 이미 등록한(또는 그 뒤 새로 읽은) 파티션이 있으면 그것을 씁니다."""
+        with self._lock:
+            return self._use(date, self._parts.setdefault(date, cm))
+
+    def _use(self, date: str, cm: CacheManager | SharedSnapshot) -> CacheManager | SharedSnapshot:
+        self._parts.move_to_end(date)
+        self._last_used[date] = time.monotonic()
+        self._sweep()
+        return cm
+
+    def _attach(self, date: str) -> SharedSnapshot | None:
+        if not self.shared_dir:
+            return None
+        opts = snapshot_options(self.pattern,
+                                self.cm_kwargs.get("assume_orphan_grab_counts_as_one", True),
+                                self.cm_kwargs.get("segment_engine", "vectorized"))
+        return attach(self.shared_dir, self.data_dir / date, opts)
+
+    def _follow(self, date: str):
+        """붙은 스냅샷이 낡았으면 새 스냅샷으로 바꾸고, 없으면 파티션을 내립니다."""
+        snap = self._parts[date]
+        if snap.is_fresh():
+            return
+        new = self._attach(date)
+        if new is None:
+            self.evict(date)
+        else:
+            self._parts[date] = new
+
+    def refresh_partition(self, date: str):
+        """date 파티션 하나를 다시 확인합니다 (대시보드 Refresh, 서비스 /refresh)."""
+        cm = self.partition(date)
+        if isinstance(cm, SharedSnapshot):
+            with self._lock:
+                if self._parts.get(date) is cm:
+                    self._follow(date)
+        else:
+            cm.refresh()  # CacheManager는 자기 잠금으로 직렬화
+
+    def evict(self, date: str):
+        with self._lock:
+            if self._parts.pop(date, None) is not None:
+                self.evictions[date] = self.evictions.get(date, 0) + 1
+            self._last_used.pop(date, None)
+
+    def _sweep(self):
+        """가장 최근 파티션은 남기고 TTL 만료 → 메모리 예산 초과 순으로 오래된 파티션을 내립니다."""
+        candidates = list(self._parts)[:-1]
+        if self.ttl is not None:
+            now = time.monotonic()
+            for date in candidates:
+                if now - self._last_used[date] > self.ttl:
+                    self.evict(date)
+        if self.memory_budget is not None:
+            usage = {d: cm.memory_bytes() for d, cm in self._parts.items()}
+            total = sum(usage.values())
+            for date in list(self._parts)[:-1]:
+                if total <= self.memory_budget:
+                    break
+                total -= usage[date]
+                self.evict(date)
+
+    def memory_usage(self) -> dict[str, dict[str, int]]:
+        """올라온 파티션별 플레이어 메모리(바이트)"""
+        with self._lock:
+            return {d: cm.memory_usage() for d, cm in self._parts.items()}
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(cm.memory_bytes() for cm in self._parts.values())
+
+    def memory_breakdown(self) -> dict[str, int]:
+        """올라온 파티션 전체의 종류별 메모리(바이트): raw, grabs, segments, snapshots"""
+        out = {"raw": 0, "grabs": 0, "segments": 0, "snapshots": 0}
+        with self._lock:
+            for cm in self._parts.values():
+                for k, v in cm.memory_breakdown().items():
+                    if k in out:
+                        out[k] += v
+        return out
+
+    # ---------- 여러 날짜 분위수 ----------
+    def _stored_sketches(self, date: str, players: list[str] | None) -> list[dict] | None:
+        """
+        내려가 있는 date 파티션의 파일별 스케치를 디스크 캐시에서만 읽습니다 (세그먼트를 읽지 않음).
+        스케치가 저장되지 않은(또는 낡은) 파일이 하나라도 있으면 None.
+        """
+        if self.disk_cache is None:
+            return None
+        variant = cache_variant(self.cm_kwargs.get("assume_orphan_grab_counts_as_one", True))
+        wanted = None if players is None else set(players)
+        groups = []
+        for path in scan_logs(self.data_dir / date, self.pattern):
+            if wanted is not None and filename_to_player_id(path) not in wanted:
+                continue
+            sketches = self.disk_cache.get_sketches(path, variant)
+            if sketches is None:
+                return None
+            groups.append(sketches)
+        return groups
+
+    def stage_sketches(self, dates: list[str],
+                       players: list[str] | None = None) -> dict[str, dict[str, QuantileSketch]]:
+        """
+        여러 날짜의 {컬럼: {스테이지: 스케치}}를 병합합니다. 올라온 파티션은 메모리의 부분 집계를,
+        내려가 있는 날짜는 디스크 캐시에 저장된 파일별 스케치를 쓰고, 저장된 스케치가 없는 날짜만 읽어 올립니다.
+        """
+        groups = []
+        for date in dates:
+            with self._lock:
+                cm = self._parts.get(date)
+            stored = self._stored_sketches(date, players) if cm is None else None
+            if stored is None:
+                cm = cm or self.partition(date)
+                stored = [cm.stage_store.stage_sketches(players)]
+            groups.extend(stored)
+        return merge_stage_sketches(groups)
+
+    def stage_quantiles(self, dates: list[str], players: list[str] | None = None,
+                        quantiles: tuple[float, ...] = DEFAULT_QUANTILES) -> pd.DataFrame:
+        """여러 날짜를 합친 스테이지별 분위수 근사 (query_service global_stage_quantiles와 같은 모양)"""
+        return sketch_quantiles(self.stage_sketches(dates, players), quantiles)
+
+    # ---------- watcher 연동 ----------
+    def _date_of(self, path: str | Path) -> str | None:
+        try:
+            rel = Path(path).resolve().relative_to(self.data_dir.resolve())
+        except ValueError:
+            return None
+        return rel.parts[0] if rel.parts else None
+
+    def reload_paths(self, paths: list[str | Path], workers: int | None = None):
+        """올라온 파티션에 속한 경로만 해당 CacheManager로 넘깁니다 (나머지는 조회 시 새로 읽힘)."""
+        by_date: dict[str, list] = {}
+        for p in paths:
+            date = self._date_of(p)
+            if date is not None:
+                by_date.setdefault(date, []).append(p)
+        local = []
+        with self._lock:
+            for date, ps in by_date.items():
+                cm = self._parts.get(date)
+                if isinstance(cm, SharedSnapshot):
+                    self._follow(date)
+                elif cm is not None:
+                    local.append((cm, ps))
+                elif date in self._loading:
+                    self._pending_paths.setdefault(date, []).extend(ps)
+        for cm, ps in local:  # 다시 읽는 동안 전체 잠금을 잡지 않음
+            cm.reload_paths(ps, workers)
+
+    def refresh(self, workers: int | None = None):
+        with self._lock:
+            local = []
+            for date, cm in list(self._parts.items()):
+                if isinstance(cm, SharedSnapshot):
+                    self._follow(date)
+                else:
+                    local.append(cm)
+        for cm in local:  # 다시 읽는 동안 전체 잠금을 잡지 않음
+            cm.refresh(workers)
+
+
+def from_config(cfg: dict, data_root: str | Path, base_dir: str | Path = ".") -> PartitionedCacheManager:
+    """config.json 설정으로 PartitionedCacheManager를 만듭니다 (cache_dir/shared_store_dir는 base_dir 기준 상대 경로)."""
+    return PartitionedCacheManager(
+        data_root, cfg.get("file_pattern", "*.csv"),
+        memory_budget_mb=cfg.get("cache_memory_mb"),
+        ttl_seconds=cfg.get("cache_ttl_seconds"),
+        cache_dir=str(Path(base_dir) / cfg["cache_dir"]) if cfg.get("cache_dir") else None,
+        shared_dir=(str(Path(base_dir) / cfg["shared_store_dir"])
+                    if cfg.get("shared_store_dir") else None),
+        assume_orphan_grab_counts_as_one=cfg.get("assume_orphan_grab_counts_as_one", True),
+        segment_engine=cfg.get("segment_engine", "vectorized"),
+        incremental=cfg.get("incremental_ingest", True),
+        workers=cfg.get("load_workers", 0),
+        retention=cfg.get("retention", "full"),
+        # 디바운스 창 동안 그대로인 파일은 줄바꿈 없는 마지막 줄까지 읽음
+        settle_seconds=cfg.get("debounce_ms", 500) / 1000.0)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+import pandas as pd
+
+try:
+    import psutil
+    _PROC = psutil.Process()
+except ImportError:  # psutil 미설치 환경에서는 메모리 변화량을 기록하지 않음
+    _PROC = None
+
+# 파이프라인 단계별 계측. 기록은 Recorder에 모읍니다.
+#   - enable(): 프로세스 전체 기록기 (app_cli --profile, 로딩 워커)
+#   - activate(recorder): 현재 실행 문맥(대시보드 세션의 스크립트 실행 등)에만 쓰는 기록기.
+#     다른 세션이나 파일 감시 스레드는 영향을 받지 않습니다.
+# 둘 다 없으면 꺼진 상태이고, @profiled 함수는 기록기 조회 한 번만 하고 원래 함수를 그대로 호출합니다.
+# 기록기는 최근 MAX_RECORDS개만 남깁니다 (오래 켜 둔 대시보드에서도 메모리가 늘지 않게).
+MAX_RECORDS = 20_000
+
+
+class Recorder:
+    """최근 maxlen개 기록을 남기는 스레드 안전 버퍼"""
+
+    def __init__(self, maxlen: int = MAX_RECORDS):
+        self._records: deque[dict] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, rec: dict):
+        with self._lock:
+            self._records.append(rec)
+
+    def extend(self, recs):
+        with self._lock:
+            self._records.extend(recs)
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+_default: Recorder | None = None
+_session: ContextVar[Recorder | None] = ContextVar("profiler_session", default=None)
+
+
+def _active() -> Recorder | None:
+    rec = _session.get()
+    return rec if rec is not None else _default
+
+
+def enable(on: bool = True):
+    """프로세스 전체 기록을 켜거나 끕니다. 이미 켜져 있으면 기존 기록을 유지합니다."""
+    global _default
+    if not on:
+        _default = None
+    elif _default is None:
+        _default = Recorder()
+
+
+def activate(recorder: Recorder | None):
+    """현재 실행 문맥의 기록기를 정합니다 (None이면 프로세스 전체 기록기를 따름)."""
+    _session.set(recorder)
+
+
+def is_enabled() -> bool:
+    return _active() is not None
+
+
+def reset():
+    rec = _active()
+    if rec is not None:
+        rec.reset()
+
+
+def records() -> list[dict]:
+    rec = _active()
+    return [] if rec is None else rec.records()
+
+
+def extend(recs: list[dict]):
+    """다른 프로세스(로딩 워커)에서 모은 기록을 합칩니다."""
+    rec = _active()
+    if rec is not None:
+        rec.extend(recs)
+
+
+def _rss() -> int | None:
+    return _PROC.memory_info().rss if _PROC is not None else None
+
+
+def _record(recorder: Recorder, stage: str, detail: str, seconds: float, rows: int | None,
+            rss0: int | None, rss1: int | None):
+    recorder.add({"stage": stage, "detail": detail, "seconds": seconds, "rows": rows,
+                  "mem_delta_mb": (rss1 - rss0) / 2**20 if rss0 is not None and rss1 is not None else None})
+
+
+def _len(obj) -> int | None:
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def profiled(stage: str, rows: str | int = "out", detail=None):
+    """
+    함수 호출마다 (stage, detail, seconds, rows, mem_delta_mb)를 기록하는 데코레이터.
+    rows: "out"이면 반환값(튜플이면 첫 원소)의 길이, 정수 i면 위치 인자 args[i]의 길이.
+    detail: 호출 인자를 받아 파일명/플레이어 등 식별 문자열을 돌려주는 함수.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _active()
+            if recorder is None:
+                return fn(*args, **kwargs)
+            rss0 = _rss()
+            t0 = time.perf_counter()
+            out = fn(*args, **kwargs)
+            seconds = time.perf_counter() - t0
+            n = _len(out) if rows == "out" else _len(args[rows] if len(args) > rows else None)
+            try:
+                d = str(detail(*args, **kwargs)) if detail is not None else ""
+            except Exception:
+                d = ""
+            _record(recorder, stage, d, seconds, n, rss0, _rss())
+            return out
+        return wrapper
+    return deco
+
+
+class span:
+    """with span("stage", detail): 코드 블록 하나를 기록. 꺼져 있으면 아무것도 하지 않음."""
+
+    def __init__(self, stage: str, detail: str = "", rows: int | None = None):
+        self.stage, self.detail, self.rows = stage, detail, rows
+
+    def __enter__(self):
+        self._recorder = _active()
+        if self._recorder is not None:
+            self._rss0 = _rss()
+            self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._recorder is not None:
+            _record(self._recorder, self.stage, self.detail, time.perf_counter() - self._t0,
+                    self.rows, self._rss0, _rss())
+        return False
+
+
+def summary(recs: list[dict] | None = None) -> pd.DataFrame:
+    """단계별 합계: calls, seconds, rows, rows_per_sec, mem_delta_mb (seconds 내림차순)"""
+    df = pd.DataFrame(records() if recs is None else recs,
+                      columns=["stage", "detail", "seconds", "rows", "mem_delta_mb"])
+    if df.empty:
+        return pd.DataFrame(columns=["stage", "calls", "seconds", "rows", "rows_per_sec",
+                                     "mem_delta_mb"])
+    g = df.groupby("stage")
+    out = g.agg(calls=("seconds", "size"), seconds=("seconds", "sum"))
+    # 행 수/메모리를 모르는 기록만 있는 단계는 0이 아니라 NaN
+    out["rows"] = g["rows"].sum(min_count=1)
+    out["mem_delta_mb"] = g["mem_delta_mb"].sum(min_count=1)
+    out["rows_per_sec"] = out["rows"] / out["seconds"].where(out["seconds"] > 0)
+    out = out.reset_index().sort_values("seconds", ascending=False, kind="mergesort")
+    return out[["stage", "calls", "seconds", "rows", "rows_per_sec", "mem_delta_mb"]]
+
+
+def dump(path: str | Path):
+    """{"summary": [...], "records": [...]} JSON으로 저장합니다."""
+    recs = records()
+    doc = {"summary": summary(recs).to_dict(orient="records"), "records": recs}
+    Path(path).write_text(json.dumps(doc, indent=2, ensure_ascii=False, default=str),
+                          encoding="utf-8")
@@ -0,0 +1,381 @@
+from __future__ import annotations
+import argparse
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib import error as urlerror, request as urlrequest
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+import pyarrow as pa
+from .aggregator import (FIRST_GRAB_POLICIES, first_grab_top3_all, global_stage_quantiles,
+                         personal_stage_exit_counts)
+from .cache_manager import CacheManager
+from .parser import concat_frames, empty_raw
+from .partitioned_cache import DATE_DIR_RE, PartitionedCacheManager, from_config
+from .sketches import DEFAULT_QUANTILES
+
+# 로컬 조회 서비스: 오래 떠 있는 프로세스 하나가 날짜 파티션 캐시(+감시자)를 들고
+# 집계/raw 구간 조회를 localhost HTTP로 답합니다. 결과 프레임은 Arrow IPC 스트림으로 보내고
+# (날짜, generation, 조회, 플레이어, 인자)별로 직렬화된 바이트를 캐시합니다.
+# 대시보드/app_cli는 서비스가 떠 있으면 QueryClient로, 아니면 LocalBackend로 같은 조회를 실행합니다.
+DEFAULT_URL = "http://127.0.0.1:8765"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+class ServiceUnavailable(ConnectionError):
+    """서비스에 연결할 수 없음 (호출 측은 직접 로딩으로 대체)"""
+
+
+# ---------- 조회 (서비스/직접 로딩 공용) ----------
+
+def _segments(cm: CacheManager, players: list[str] | None) -> pd.DataFrame:
+    segs = cm.all_segments()
+    if players is None:
+        return segs
+    return segs[segs["PlayerID"].isin(players)] if players else segs.iloc[0:0]
+
+
+def _global_stats(cm: CacheManager, players: list[str] | None) -> pd.DataFrame:
+    gmean = cm.stage_store.global_stage_means(players)
+    gexit = cm.stage_store.global_stage_exit_counts(players)
+    return gmean.merge(gexit, on="stage", how="left")
+
+
+def _first_grab_top3(cm: CacheManager, players: list[str] | None,
+                     policies: list[str] | None = None, exclude_roots: bool = True) -> pd.DataFrame:
+    return first_grab_top3_all(cm.all_segments(), cm.grab_source(), players,
+                               policies=tuple(policies or FIRST_GRAB_POLICIES),
+                               exclude_roots=exclude_roots)
+
+
+def _stage_quantiles(cm: CacheManager, players: list[str] | None,
+                     quantiles: list[float] | None = None, exact: bool = False) -> pd.DataFrame:
+    """스테이지별 clear/play time, retry 분위수. 기본은 스케치 병합, exact=True면 세그먼트에서 정확히 (검증용)."""
+    qs = tuple(quantiles or DEFAULT_QUANTILES)
+    if exact:
+        return global_stage_quantiles(_segments(cm, players), qs)
+    return cm.stage_store.global_stage_quantiles(players, qs)
+
+
+def _raw_window(cm: CacheManager, players: list[str] | None, start: str | None = None,
+                end: str | None = None, events: list[str] | None = None) -> pd.DataFrame:
+    """
+    플레이어별 raw에서 [start, end] 시각 구간(양끝 포함)의 행 (cm.events 색인 조회).
+    events: 정규 이벤트 이름(EVENT_CODES) 또는 원문 event 문자열 목록.
+    """
+    frames = [cm.events(pid, start, end, events or None)
+              for pid in (cm.players() if players is None else players)]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return empty_raw()
+    return concat_frames(frames)
+
+
+# 조회 이름 -> fn(cm, players, **params). players=None이면 전체 플레이어
+QUERIES = {
+    "segments": _segments,
+    "global_stage_means": lambda cm, players: cm.stage_store.global_stage_means(players),
+    "global_stage_exit_counts": lambda cm, players: cm.stage_store.global_stage_exit_counts(players),
+    "global_stats": _global_stats,
+    "personal_exit_counts": lambda cm, players: personal_stage_exit_counts(cm.all_segments(), players),
+    "personal_first_clear": lambda cm, players: cm.stage_store.personal_first_clear_stars(players),
+    "global_stage_quantiles": _stage_quantiles,
+    "first_grab_top3": _first_grab_top3,
+    "raw_window": _raw_window,
+}
+
+
+def run_query(cm: CacheManager, name: str, players: list[str] | None = None, **params) -> pd.DataFrame:
+    fn = QUERIES.get(name)
+    if fn is None:
+        raise KeyError(f"Unknown query: {name}")
+    return fn(cm, None if players is None else list(players), **params)
+
+
+def to_arrow_bytes(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_arrow_bytes(data: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+def _options(pcm: PartitionedCacheManager) -> dict:
+    return {"data_root": str(pcm.data_dir.resolve()), "file_pattern": pcm.pattern,
+            "segment_engine": pcm.cm_kwargs.get("segment_engine", "vectorized"),
+            "assume_orphan": pcm.cm_kwargs.get("assume_orphan_grab_counts_as_one", True),
+            "retention": pcm.cm_kwargs.get("retention", "full")}
+
+
+def _memory_mb(pcm: PartitionedCacheManager) -> dict[str, float]:
+    return {k: v / 2**20 for k, v in pcm.memory_breakdown().items()}
+
+
+class LocalBackend:
+    """서비스 없이 이 프로세스의 PartitionedCacheManager로 조회합니다 (QueryClient와 같은 메서드)."""
+
+    source = "local"
+
+    def __init__(self, pcm: PartitionedCacheManager):
+        self.pcm = pcm
+
+    def status(self) -> dict:
+        return {"source": self.source, "options": _options(self.pcm), "dates": self.pcm.dates(),
+                "loaded": self.pcm.loaded(), "memory_mb": self.pcm.memory_bytes() / 2**20,
+                "memory_by_kind_mb": _memory_mb(self.pcm)}
+
+    def info(self, date: str) -> dict:
+        cm = self.pcm.partition(date)
+        return {"source": self.source, "generation": cm.generation, "players": cm.players()}
+
+    def query(self, date: str, name: str, players: list[str] | None = None, **params) -> pd.DataFrame:
+        return run_query(self.pcm.partition(date), name, players, **params)
+
+    def stage_quantiles(self, dates: list[str], players: list[str] | None = None,
+                        quantiles: list[float] | None = None) -> pd.DataFrame:
+        return self.pcm.stage_quantiles(dates, players, tuple(quantiles or DEFAULT_QUANTILES))
+
+    def refresh(self, date: str):
+        self.pcm.refresh_partition(date)
+
+
+# ---------- 서비스 ----------
+
+class QueryService:
+    """
+    PartitionedCacheManager 하나를 여러 클라이언트가 공유하게 하는 조회 계층.
+    결과는 Arrow IPC 바이트로 (날짜, generation, 조회, 플레이어, 인자) 키에 보관하므로
+    같은 데이터 세대의 같은 조회는 한 번만 계산/직렬화됩니다. 오래된 세대의 항목은 max_entries로 밀려납니다.
+    """
+
+    def __init__(self, pcm: PartitionedCacheManager, max_entries: int = 256):
+        self.pcm = pcm
+        self.instance = uuid.uuid4().hex[:12]
+        self.max_entries = max_entries
+        self._results: OrderedDict[tuple, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _check_date(self, date: str):
+        if not isinstance(date, str) or not DATE_DIR_RE.fullmatch(date) or date not in self.pcm.dates():
+            raise LookupError(f"Unknown date: {date}")
+
+    def _partition(self, date: str) -> CacheManager:
+        self._check_date(date)
+        return self.pcm.partition(date)
+
+    def status(self) -> dict:
+        with self._lock:
+            cached = len(self._results)
+        return {"source": f"service:{self.instance}", "options": _options(self.pcm),
+                "dates": self.pcm.dates(), "loaded": self.pcm.loaded(),
+                "memory_mb": self.pcm.memory_bytes() / 2**20,
+                "memory_by_kind_mb": _memory_mb(self.pcm),
+                "cached_results": cached, "hits": self.hits, "misses": self.misses}
+
+    def info(self, date: str) -> dict:
+        """source는 클라이언트 캐시 키용: 서비스가 재시작되면 generation이 다시 시작되므로 인스턴스별로 다름"""
+        cm = self._partition(date)
+        return {"source": f"service:{self.instance}", "generation": cm.generation,
+                "players": cm.players()}
+
+    def refresh(self, date: str) -> dict:
+        self._partition(date)
+        self.pcm.refresh_partition(date)
+        return {"generation": self.pcm.partition(date).generation}
+
+    def query_bytes(self, date: str, name: str, players: list[str] | None, params: dict) -> bytes:
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query: {name}")
+        cm = self._partition(date)
+        key = (date, cm.generation, name, None if players is None else tuple(players),
+               json.dumps(params, sort_keys=True))
+        with self._lock:
+            data = self._results.get(key)
+            if data is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = to_arrow_bytes(run_query(cm, name, players, **params))
+        with self._lock:
+            self._results[key] = data
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return data
+
+    def stage_quantiles_bytes(self, dates: list[str], players: list[str] | None,
+                              quantiles: list[float] | None) -> bytes:
+        """
+        여러 날짜를 합친 스테이지별 분위수. 저장된 스케치 병합이라 충분히 싸므로 결과 캐시에 넣지 않습니다
+        (내려가 있는 날짜에는 generation이 없어 캐시 키를 만들 수 없음).
+        """
+        if not isinstance(dates, list) or not dates:
+            raise ValueError("dates must be a non-empty list")
+        for date in dates:
+            self._check_date(date)
+        return to_arrow_bytes(self.pcm.stage_quantiles(dates, players, tuple(quantiles or DEFAULT_QUANTILES)))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: QueryService  # make_server에서 지정
+
+    def log_message(self, fmt, *args):  # 요청마다 stderr에 찍지 않음
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, obj, status: int = 200):
+        self._send(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"),
+                   "application/json; charset=utf-8")
+
+    def _dispatch(self, fn):
+        try:
+            fn()
+        except LookupError as e:  # 알 수 없는 날짜/조회 (KeyError 포함)
+            self._send_json({"error": str(e)}, 404)
+        except (TypeError, ValueError) as e:
+            self._send_json({"error": str(e)}, 400)
+        except Exception as e:
+            self._send_json({"error": f"{type(e).__name__}: {e}"}, 500)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == "/status":
+            self._dispatch(lambda: self._send_json(self.service.status()))
+        elif url.path == "/info":
+            self._dispatch(lambda: self._send_json(self.service.info(qs.get("date"))))
+        else:
+            self._send_json({"error": f"Not found: {url.path}"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError as e:
+            self._send_json({"error": f"Bad JSON: {e}"}, 400)
+            return
+        if url.path == "/query":
+            self._dispatch(lambda: self._send(200, self.service.query_bytes(
+                body.get("date"), body.get("name"), body.get("players"), body.get("params") or {}),
+                ARROW_STREAM))
+        elif url.path == "/stage_quantiles":
+            self._dispatch(lambda: self._send(200, self.service.stage_quantiles_bytes(
+                body.get("dates"), body.get("players"), body.get("quantiles")), ARROW_STREAM))
+        elif url.path == "/refresh":
+            self._dispatch(lambda: self._send_json(self.service.refresh(body.get("date"))))
+        else:
+            self._send_json({"error": f"Not found: {url.path}"}, 404)
+
+
+def make_server(service: QueryService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    handler = type("QueryHandler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# ---------- 클라이언트 ----------
+
+class QueryClient:
+    """QueryService HTTP 클라이언트. 연결이 안 되면 ServiceUnavailable을 냅니다."""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 300.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path: str, body: dict | None = None, timeout: float | None = None) -> bytes:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        req = urlrequest.Request(self.url + path, data=data,
+                                 headers={"Content-Type": "application/json"} if data else {})
+        try:
+            with urlrequest.urlopen(req, timeout=timeout or self.timeout) as resp:
+                return resp.read()
+        except urlerror.HTTPError as e:
+            try:
+                msg = json.loads(e.read()).get("error", "")
+            except ValueError:
+                msg = ""
+            if e.code == 404:
+                raise LookupError(msg or path) from None
+            raise RuntimeError(f"Query service error {e.code}: {msg}") from None
+        except (urlerror.URLError, ConnectionError, TimeoutError) as e:
+            raise ServiceUnavailable(f"{self.url}: {e}") from None
+
+    def status(self, timeout: float | None = None) -> dict:
+        return json.loads(self._call("/status", timeout=timeout))
+
+    def info(self, date: str) -> dict:
+        return json.loads(self._call(f"/info?date={date}"))
+
+    def query(self, date: str, name: str, players: list[str] | None = None, **params) -> pd.DataFrame:
+        body = {"date": date, "name": name,
+                "players": None if players is None else list(players), "params": params}
+        return from_arrow_bytes(self._call("/query", body))
+
+    def stage_quantiles(self, dates: list[str], players: list[str] | None = None,
+                        quantiles: list[float] | None = None) -> pd.DataFrame:
+        """여러 날짜를 합친 스테이지별 분위수 (PartitionedCacheManager.stage_quantiles)"""
+        body = {"dates": list(dates), "players": None if players is None else list(players),
+                "quantiles": None if quantiles is None else list(quantiles)}
+        return from_arrow_bytes(self._call("/stage_quantiles", body))
+
+    def refresh(self, date: str):
+        self._call("/refresh", {"date": date})
+
+
+def connect(url: str | None = DEFAULT_URL, timeout: float = 1.0) -> QueryClient | None:
+    """서비스가 떠 있으면 QueryClient, 아니면 None (호출 측은 직접 로딩으로 대체)."""
+    if not url:
+        return None
+    client = QueryClient(url)
+    try:
+        client.status(timeout=timeout)
+    except ServiceUnavailable:
+        return None
+    return client
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LogViz 로컬 조회 서비스")
+    ap.add_argument("--config", default="./config.json")
+    ap.add_argument("--data", help="DATA 루트 (기본: config.json의 data_dir)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--max-entries", type=int, default=256, help="보관할 조회 결과 수")
+    ap.add_argument("--no-watch", action="store_true", help="데이터 폴더 감시 끄기")
+    args = ap.parse_args()
+
+    cfg_file = Path(args.config)
+    cfg = json.loads(cfg_file.read_text(encoding="utf-8")) if cfg_file.exists() else {}
+    base = cfg_file.resolve().parent
+    data_root = Path(args.data) if args.data else base / cfg.get("data_dir", "./DATA")
+    pcm = from_config(cfg, data_root, base)
+    if cfg.get("watch", True) and not args.no_watch:
+        from .file_watcher import start_watcher
+        pcm.watcher = start_watcher(pcm, debounce_ms=cfg.get("debounce_ms", 500))
+    server = make_server(QueryService(pcm, args.max_entries), args.host, args.port)
+    print(f"[service] Serving {data_root.resolve()} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
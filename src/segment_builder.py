@@ -1,9 +1,22 @@
 from __future__ import annotations
 import pandas as pd
 import numpy as np
+from .parser import EVENT_CODES, event_codes
+from .profiler import profiled
+from .segment_metrics import SEGMENT_METRICS, computed_metrics
 
 
-def build_segments(df: pd.DataFrame, assume_orphan_grab_counts_as_one: bool = True) -> pd.DataFrame:
+SEGMENT_ENGINES = ("vectorized", "reference")
+# 등록표(segment_metrics) 밖에서 엔진이 직접 계산하는 컬럼. 전체 컬럼 순서는 segment_columns()
+BASE_COLUMNS = ["PlayerID", "stage", "t_begin", "t_end", "cleared",
+                "total_time", "stage_play_time", "clear_time", "exit_cnt", "first_grab_object"]
+# 세그먼트 컬럼/의미가 바뀌면 올린다 (디스크 캐시 무효화용)
+SEGMENTER_VERSION = 3
+
+
+@profiled("segment", rows=0, detail=lambda df, *a, **k: _player_of(df))
+def build_segments(df: pd.DataFrame, assume_orphan_grab_counts_as_one: bool = True,
+                   engine: str = "vectorized") -> pd.DataFrame:
     """
     게임 로그 DataFrame에서 스테이지 시도(세그먼트)를 추출하여 집계 정보를 생성합니다.
     
@@ -13,21 +26,67 @@ def build_segments(df: pd.DataFrame, assume_orphan_grab_counts_as_one: bool = Tr
         파싱된 로그 DataFrame (컬럼: timestamp, event, level, key, value, PlayerID)
     assume_orphan_grab_counts_as_one : bool
         고아 Grab(InputGrabBreak 없이 종료된 Grab)을 1회로 간주할지 여부
+    engine : str
+        "vectorized"(기본, 컬럼 연산) 또는 "reference"(행 단위 상태 머신).
+        두 엔진의 출력은 동일해야 하며, reference는 결과 비교용으로 남겨둔다.
     
     Returns:
     --------
     pd.DataFrame
         스테이지 시도별 집계 정보
-        컬럼: PlayerID, stage, t_begin, t_end, cleared, 
-              stage_play_time, clear_time, total_time,
-              retry_cnt, exit_cnt, first_star, final_star,
-              cam_move_cnt, cam_rotate_cnt, cam_pan_cnt, cam_total_cnt,
-              grab_pair_cnt, pushpull_cnt, first_grab_object
+        컬럼: BASE_COLUMNS (PlayerID, stage, t_begin, t_end, cleared,
+              total_time, stage_play_time, clear_time, exit_cnt, first_grab_object)
+              + segment_metrics 등록표의 지표 컬럼 (retry_cnt, cam_*_cnt, grab_pair_cnt,
+              pushpull_cnt, first_star, final_star, bomb_*_cnt, ...)
     """
     
     if df is None or df.empty:
         return _empty_segments_df()
-    
+    if engine == "reference":
+        return _build_segments_reference(df, assume_orphan_grab_counts_as_one)
+    if engine != "vectorized":
+        raise ValueError(f"Unknown segment engine: {engine}")
+    return _build_segments_vectorized(df, assume_orphan_grab_counts_as_one)[0]
+
+
+@profiled("segment", rows=0, detail=lambda df, *a, **k: _player_of(df))
+def build_segments_with_tail(df: pd.DataFrame, assume_orphan_grab_counts_as_one: bool = True,
+                             engine: str = "vectorized") -> tuple[pd.DataFrame, int, int]:
+    """
+    build_segments 결과와 함께 '아직 열린 꼬리' 정보를 반환합니다.
+
+    Returns:
+    --------
+    (segments, tail_row, n_final)
+        tail_row : 로그가 이어 붙으면 결과가 바뀔 수 있는 첫 행 위치
+                   (정렬된 df 기준, 열린/강제 마감 세그먼트의 StageBegin 행)
+        n_final  : tail_row 이전에 시작해 더 이상 바뀌지 않는 세그먼트 수
+    이어 붙인 뒤에는 df.iloc[tail_row:]만 다시 분할해 segments[:n_final] 뒤에 붙이면
+    전체를 다시 분할한 결과와 같습니다. reference 엔진은 항상 (segs, 0, 0)을 반환합니다.
+    """
+    if df is None or df.empty:
+        return _empty_segments_df(), 0, 0
+    if engine == "reference":
+        return _build_segments_reference(df, assume_orphan_grab_counts_as_one), 0, 0
+    if engine != "vectorized":
+        raise ValueError(f"Unknown segment engine: {engine}")
+    return _build_segments_vectorized(df, assume_orphan_grab_counts_as_one)
+
+
+def segment_columns() -> list[str]:
+    """세그먼트 DataFrame 컬럼 순서: BASE_COLUMNS + 등록된 지표"""
+    return BASE_COLUMNS + list(SEGMENT_METRICS)
+
+
+def _player_of(df: pd.DataFrame) -> str:
+    """프로파일 기록용 PlayerID (첫 행)"""
+    if df is None or df.empty or "PlayerID" not in df.columns:
+        return ""
+    return str(df["PlayerID"].iloc[0])
+
+
+def _build_segments_reference(df: pd.DataFrame, assume_orphan_grab_counts_as_one: bool) -> pd.DataFrame:
+    """iterrows 기반 원본 구현 (engine="reference")."""
     df = df.sort_values(["timestamp"], kind="mergesort").reset_index(drop=True)
     
     segments = []
@@ -96,7 +155,236 @@ def build_segments(df: pd.DataFrame, assume_orphan_grab_counts_as_one: bool = Tr
     if not segments:
         return _empty_segments_df()
     
-    return pd.DataFrame(segments)
+    out = pd.DataFrame(segments)[segment_columns()]
+    # 값/오프셋 지표는 전부 None인 경우에도 vectorized와 같은 float 컬럼으로
+    for m in computed_metrics():
+        if m.reducer != "count":
+            out[m.column] = out[m.column].astype(float)
+    return out
+
+
+# === 컬럼 연산 엔진 ===
+
+# 경계 이벤트 종류 (이벤트 코드 -> 종류)
+_K_OTHER, _K_BEGIN, _K_CLEAR, _K_EXIT, _K_RETRY = 0, 1, 2, 3, 4
+_BOUNDARY_KINDS = {
+    EVENT_CODES["StageBegin"]: _K_BEGIN,
+    EVENT_CODES["StageClear"]: _K_CLEAR,
+    EVENT_CODES["StageExit"]: _K_EXIT,
+    EVENT_CODES["StageRetry"]: _K_RETRY,
+}
+
+def _code_lut(mapping: dict[int, int], default: int) -> np.ndarray:
+    """이벤트 코드 -> 값 조회 배열"""
+    lut = np.full(max(EVENT_CODES.values()) + 1, default, dtype=np.int64)
+    for code, v in mapping.items():
+        lut[code] = v
+    return lut
+
+
+def _build_segments_vectorized(df: pd.DataFrame, assume_orphan: bool) -> tuple[pd.DataFrame, int, int]:
+    """
+    reference 엔진과 같은 결과를 배열 연산으로 계산합니다.
+
+    - StageBegin 위치로 행을 블록(= 세그먼트 후보)으로 나누고,
+      블록마다 첫 StageExit / 같은 스테이지의 StageClear를 마감 위치로 잡습니다.
+    - 각 행에 세그먼트 id를 부여하고, (세그먼트, 윈도우 여부, 이벤트 코드) 묶음 한 번으로
+      개수/첫 위치/마지막 위치를 구해 등록된 지표를 모두 계산합니다 (_window_code_table).
+    - 다음 StageBegin으로 강제 마감된 세그먼트는 reference와 같이
+      윈도우가 파일 끝까지 이어지므로, 블록 값의 suffix 합/최소/최대를 사용합니다.
+    """
+    df = df.sort_values(["timestamp"], kind="mergesort").reset_index(drop=True)
+    n = len(df)
+
+    # 문자열 대신 파서의 정수 이벤트 코드로 판정
+    codes = event_codes(df)
+    kind = _code_lut(_BOUNDARY_KINDS, _K_OTHER)[codes]
+
+    starts = np.flatnonzero(kind == _K_BEGIN)
+    if len(starts) == 0:
+        return _empty_segments_df(), n, 0
+    k_cnt = len(starts)
+    pos = np.arange(n)
+    blk = np.searchsorted(starts, pos, side="right") - 1  # -1: 첫 StageBegin 이전
+
+    ts = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+    values = df["value"]
+
+    # 스테이지명은 Begin/Clear 행에서만 정규화
+    seg_stage = _normalize_stage_values(values.iloc[starts])
+    clear_rows = np.flatnonzero((kind == _K_CLEAR) & (blk >= 0))
+    clear_ok = _normalize_stage_values(values.iloc[clear_rows]) == seg_stage[blk[clear_rows]]
+    exit_rows = np.flatnonzero((kind == _K_EXIT) & (blk >= 0))
+    cand = np.sort(np.concatenate([clear_rows[clear_ok], exit_rows]))
+
+    close_pos = np.full(k_cnt, -1, dtype=np.int64)
+    if len(cand):
+        cand_blk, first = np.unique(blk[cand], return_index=True)
+        close_pos[cand_blk] = cand[first]
+
+    seg_idx = np.arange(k_cnt)
+    closed = close_pos >= 0
+    cleared = closed & (kind[np.where(closed, close_pos, 0)] == _K_CLEAR)
+    forced = ~closed & (seg_idx < k_cnt - 1)  # 다음 StageBegin으로 강제 마감
+    end_idx = np.where(closed, close_pos, n - 1)
+
+    # 윈도우가 파일 끝까지 열린 첫 세그먼트부터가 '꼬리'
+    open_segs = np.flatnonzero(~closed)
+    n_final = int(open_segs[0]) if len(open_segs) else k_cnt
+    tail_row = int(starts[n_final]) if n_final < k_cnt else n
+
+    next_begin = starts[np.minimum(seg_idx + 1, k_cnt - 1)]
+    t_begin = ts[starts]
+    t_end = ts[np.where(closed, close_pos, np.where(forced, next_begin, n - 1))]
+
+    # 행별 세그먼트 id = blk, live는 그 세그먼트 윈도우(마감 이전)에 속하는지 여부
+    live = (blk >= 0) & (pos <= end_idx[np.maximum(blk, 0)])
+
+    # (세그먼트 id, 윈도우 여부, 이벤트 코드) 묶음 한 번으로 등록된 지표 전부 계산
+    code_cnt, code_first, code_last = _window_code_table(codes, blk, live, forced, k_cnt)
+    metrics = {m.column: _reduce_metric(m, code_cnt, code_first, code_last, values, ts, t_begin)
+               for m in computed_metrics()}
+
+    # clear_time: 마감 직전 마지막 StageRetry 기준
+    retry_pos = np.flatnonzero(kind == _K_RETRY)
+    last_retry = _last_in_window(retry_pos, starts + 1, end_idx - 1)
+    clear_from = ts[np.where(last_retry >= 0, retry_pos[np.maximum(last_retry, 0)], starts)] if len(retry_pos) else t_begin
+
+    total_time = (t_end - t_begin).astype(np.int64) / 1e9
+    clear_time = (t_end - clear_from).astype(np.int64) / 1e9
+
+    # 첫 그랩 오브젝트 (root 제외)
+    grab_mask = codes == EVENT_CODES["InputGrab"]
+    grab_pos = np.flatnonzero(grab_mask)
+    grab_val = values.iloc[grab_pos]
+    non_root = grab_val.astype(str).str.strip().str.lower().to_numpy() != "root"
+    nr_pos = grab_pos[non_root]
+    nr_val = grab_val.to_numpy(dtype=object)[non_root]
+    first_grab = _take(nr_val, _first_in_window(nr_pos, starts, end_idx), fill=None)
+
+    # 그랩 세트
+    if assume_orphan:
+        grab_pair = code_cnt[:, EVENT_CODES["InputGrab"]]
+    else:
+        break_mask = codes == EVENT_CODES["InputGrabBreak"]
+        grab_pair = _matched_grab_pairs(grab_mask, break_mask, starts, end_idx)
+
+    out = pd.DataFrame({
+        "PlayerID": df["PlayerID"].to_numpy()[starts],
+        "stage": seg_stage,
+        "t_begin": t_begin,
+        "t_end": t_end,
+        "cleared": cleared,
+        "total_time": total_time,
+        "stage_play_time": np.where(cleared, total_time, np.nan),
+        "clear_time": np.where(cleared, clear_time, np.nan),
+        "exit_cnt": (~cleared & ~forced).astype(np.int64),
+        "first_grab_object": first_grab,
+        "grab_pair_cnt": grab_pair,
+        **metrics,
+    })
+    return out[segment_columns()], tail_row, n_final
+
+
+def _window_code_table(codes: np.ndarray, blk: np.ndarray, live: np.ndarray, forced: np.ndarray,
+                       k_cnt: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    세그먼트 윈도우별 이벤트 코드의 (개수, 첫 행 위치, 마지막 행 위치), 각각 [k_cnt, 코드 수].
+    (세그먼트, 윈도우 여부, 코드) 키로 한 번 묶어 계산하므로 지표 수와 무관하게 행을 한 번만 훑습니다.
+    위치가 없으면 첫 위치 = 행 수, 마지막 위치 = -1.
+    """
+    n = len(codes)
+    c_cnt = max(EVENT_CODES.values()) + 1
+    rows = np.flatnonzero(blk >= 0)
+    key = (blk[rows] * 2 + live[rows]) * c_cnt + codes[rows]
+    size = k_cnt * 2 * c_cnt
+    count = np.bincount(key, minlength=size).reshape(k_cnt, 2, c_cnt)
+    first = np.full(size, n, dtype=np.int64)
+    np.minimum.at(first, key, rows)
+    last = np.full(size, -1, dtype=np.int64)
+    np.maximum.at(last, key, rows)
+    first, last = first.reshape(k_cnt, 2, c_cnt), last.reshape(k_cnt, 2, c_cnt)
+
+    # 강제 마감 세그먼트: 자기 블록부터 파일 끝까지 (마감 이후 행 포함)
+    f = forced[:, None]
+    cnt = np.where(f, np.cumsum(count.sum(axis=1)[::-1], axis=0)[::-1], count[:, 1])
+    fst = np.where(f, np.minimum.accumulate(first.min(axis=1)[::-1], axis=0)[::-1], first[:, 1])
+    lst = np.where(f, np.maximum.accumulate(last.max(axis=1)[::-1], axis=0)[::-1], last[:, 1])
+    return cnt, fst, lst
+
+
+def _reduce_metric(m, code_cnt: np.ndarray, code_first: np.ndarray, code_last: np.ndarray,
+                   values: pd.Series, ts: np.ndarray, t_begin: np.ndarray) -> np.ndarray:
+    """등록된 지표 하나를 _window_code_table 결과에서 계산합니다."""
+    if m.reducer == "count":
+        return code_cnt[:, m.codes].sum(axis=1)
+    n = len(values)
+    pos = code_last[:, m.codes].max(axis=1) if m.reducer == "last_value" else code_first[:, m.codes].min(axis=1)
+    hit = (pos >= 0) & (pos < n)
+    out = np.full(len(pos), np.nan)
+    if m.reducer == "first_offset":
+        out[hit] = (ts[pos[hit]] - t_begin[hit]).astype(np.int64) / 1e9
+    else:
+        out[hit] = pd.to_numeric(values.iloc[pos[hit]], errors="coerce").to_numpy(dtype=float)
+    return out
+
+
+def _normalize_stage_values(values: pd.Series) -> np.ndarray:
+    """_normalize_stage_name의 벡터 버전 (값 앞뒤 공백 제거 포함)"""
+    if values.empty:
+        return np.array([], dtype=object)
+    norm = (values.astype(str).str.strip()
+            .str.replace("\xa0", " ", regex=False).str.strip().str.lower())
+    return norm.where(values.notna().to_numpy(), "").to_numpy(dtype=object)
+
+
+def _first_in_window(positions: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """[lo, hi] 구간에 속하는 첫 원소의 positions 인덱스 (없으면 -1)"""
+    if len(positions) == 0:
+        return np.full(len(lo), -1, dtype=np.int64)
+    i = np.searchsorted(positions, lo, side="left")
+    ok = (i < len(positions)) & (positions[np.minimum(i, len(positions) - 1)] <= hi)
+    return np.where(ok, i, -1)
+
+
+def _last_in_window(positions: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """[lo, hi] 구간에 속하는 마지막 원소의 positions 인덱스 (없으면 -1)"""
+    if len(positions) == 0:
+        return np.full(len(lo), -1, dtype=np.int64)
+    i = np.searchsorted(positions, hi, side="right") - 1
+    ok = (i >= 0) & (positions[np.maximum(i, 0)] >= lo)
+    return np.where(ok, i, -1)
+
+
+def _take(vals: np.ndarray, idx: np.ndarray, fill=np.nan) -> np.ndarray:
+    """vals[idx], idx == -1이면 fill"""
+    out = np.full(len(idx), fill, dtype=vals.dtype if fill is not None else object)
+    hit = idx >= 0
+    out[hit] = vals[idx[hit]]
+    return out
+
+
+def _matched_grab_pairs(grab_mask: np.ndarray, break_mask: np.ndarray,
+                        starts: np.ndarray, end_idx: np.ndarray) -> np.ndarray:
+    """
+    _count_grab_pairs(assume_orphan=False)의 벡터 버전.
+    열린 그랩 수는 0에서 멈추는 누적합이므로
+    마지막 열린 수 = 누적합 - min(0, 누적합 최소값) 으로 구한다.
+    """
+    gb_pos = np.flatnonzero(grab_mask | break_mask)
+    step = np.where(grab_mask[gb_pos], 1, -1)
+    csum = np.concatenate([[0], np.cumsum(step)])
+    lo = np.searchsorted(gb_pos, starts, side="left")
+    hi = np.searchsorted(gb_pos, end_idx, side="right")
+    out = np.zeros(len(starts), dtype=np.int64)
+    for k in range(len(starts)):
+        if hi[k] <= lo[k]:
+            continue
+        walk = csum[lo[k] + 1:hi[k] + 1] - csum[lo[k]]
+        n_grab = int((step[lo[k]:hi[k]] > 0).sum())
+        still_open = walk[-1] - min(0, walk.min())
+        out[k] = n_grab - still_open
+    return out
 
 
 def _finalize_segment(seg: dict, df: pd.DataFrame, assume_orphan_grab: bool):
@@ -137,34 +425,12 @@ def _finalize_segment(seg: dict, df: pd.DataFrame, assume_orphan_grab: bool):
     else:
         seg["clear_time"] = None
     
-    # === 리트라이 횟수 ===
-    seg["retry_cnt"] = len(window[window["event"] == "StageRetry"])
-    
     # === 포기 횟수 ===
     seg["exit_cnt"] = 1 if not seg["cleared"] and seg["end_idx"] is not None else 0
     
-    # === 별 (StageStar) ===
-    star_rows = window[window["event"] == "StageStar"].copy()
-    if not star_rows.empty:
-        star_values = pd.to_numeric(star_rows["value"], errors="coerce")
-        seg["first_star"] = star_values.iloc[0] if len(star_values) > 0 else None
-        seg["final_star"] = star_values.iloc[-1] if len(star_values) > 0 else None
-    else:
-        seg["first_star"] = None
-        seg["final_star"] = None
-    
-    # === 카메라 조작 ===
-    seg["cam_move_cnt"] = len(window[window["event"] == "CameraZoom"])
-    seg["cam_rotate_cnt"] = len(window[window["event"] == "CameraRotate"])
-    seg["cam_pan_cnt"] = len(window[window["event"] == "CameraPanning"])
-    seg["cam_total_cnt"] = seg["cam_move_cnt"] + seg["cam_rotate_cnt"] + seg["cam_pan_cnt"]
-    
     # === 그랩 세트 (InputGrab ~ InputGrabBreak) ===
     seg["grab_pair_cnt"] = _count_grab_pairs(window, assume_orphan_grab)
     
-    # === 밀·당 ===
-    seg["pushpull_cnt"] = len(window[window["event"] == "InputPushPull"])
-    
     # === 첫 그랩 오브젝트 (root 제외) ===
     grab_rows = window[window["event"] == "InputGrab"].copy()
     if not grab_rows.empty:
@@ -173,6 +439,20 @@ def _finalize_segment(seg: dict, df: pd.DataFrame, assume_orphan_grab: bool):
     else:
         seg["first_grab_object"] = None
     
+    # === 등록된 지표 (segment_metrics) ===
+    codes = event_codes(window)
+    for m in computed_metrics():
+        rows = np.flatnonzero(np.isin(codes, m.codes))
+        if m.reducer == "count":
+            seg[m.column] = len(rows)
+        elif len(rows) == 0:
+            seg[m.column] = None
+        elif m.reducer == "first_offset":
+            seg[m.column] = (window["timestamp"].iloc[rows[0]] - t_begin).total_seconds()
+        else:
+            i = rows[-1] if m.reducer == "last_value" else rows[0]
+            seg[m.column] = pd.to_numeric(window["value"].iloc[[i]], errors="coerce").iloc[0]
+    
     # 임시 키 제거
     seg.pop("start_idx", None)
     seg.pop("end_idx", None)
@@ -209,14 +489,7 @@ def _count_grab_pairs(window: pd.DataFrame, assume_orphan_grab: bool) -> int:
 
 def _empty_segments_df() -> pd.DataFrame:
     """빈 세그먼트 DataFrame을 반환합니다."""
-    return pd.DataFrame(columns=[
-        "PlayerID", "stage", "t_begin", "t_end", "cleared",
-        "stage_play_time", "clear_time", "total_time", 
-        "retry_cnt", "exit_cnt",
-        "first_star", "final_star",
-        "cam_move_cnt", "cam_rotate_cnt", "cam_pan_cnt", "cam_total_cnt",
-        "grab_pair_cnt", "pushpull_cnt", "first_grab_object",
-    ])
+    return pd.DataFrame(columns=segment_columns())
 
 
 def _normalize_stage_name(stage_name: str) -> str:
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import hashlib
+from .parser import EVENT_CODES
+
+# 세그먼트(스테이지 시도)별 지표 등록표.
+# 이벤트를 선언한 지표는 세그먼트 엔진이 (세그먼트, 이벤트 코드) 묶음 한 번으로 함께 계산하고,
+# mean이 있는 지표는 global_stage_means / StageAggregateStore / 대시보드 지표 목록에 자동으로 나옵니다.
+# 새 지표는 이 파일 아래쪽 표에 register_metric 한 줄로 추가합니다.
+
+REDUCERS = ("count", "first_value", "last_value", "first_offset")
+
+
+class SegmentMetric:
+    """
+    지표 하나의 정의.
+    reducer (events가 있을 때, 세그먼트 윈도우 안의 해당 이벤트 기준):
+      count        : 개수 (정수)
+      first_value  : 첫 이벤트의 value (숫자 변환, 없으면 NaN)
+      last_value   : 마지막 이벤트의 value
+      first_offset : StageBegin부터 첫 이벤트까지 초 (없으면 NaN)
+    events가 비어 있으면 엔진이 따로 계산하는 컬럼이며(예: grab_pair_cnt) 평균/라벨 등록에만 쓰입니다.
+    mean: global_stage_means 평균 컬럼 이름 (None이면 평균을 내지 않음)
+    """
+
+    def __init__(self, column: str, events: tuple[str, ...] = (), reducer: str = "count",
+                 mean: str | None = None, label: str | None = None, note: str | None = None):
+        if reducer not in REDUCERS:
+            raise ValueError(f"Unknown reducer: {reducer}")
+        unknown = [e for e in events if e not in EVENT_CODES]
+        if unknown:
+            raise ValueError(f"Unknown events for {column}: {unknown}")
+        self.column = column
+        self.events = tuple(events)
+        self.codes = [EVENT_CODES[e] for e in self.events]
+        self.reducer = reducer
+        self.mean = mean
+        self.label = label or column
+        self.note = note
+
+    @property
+    def computed(self) -> bool:
+        """세그먼트 엔진이 등록표대로 계산하는 지표인지"""
+        return bool(self.events)
+
+    def __repr__(self) -> str:
+        return f"SegmentMetric({self.column!r}, {self.events!r}, {self.reducer!r}, mean={self.mean!r})"
+
+
+SEGMENT_METRICS: dict[str, SegmentMetric] = {}
+
+
+def register_metric(column: str, events: tuple[str, ...] = (), reducer: str = "count",
+                    mean: str | None = None, label: str | None = None,
+                    note: str | None = None) -> SegmentMetric:
+    """지표를 등록합니다 (같은 컬럼이면 교체, 순서 = 세그먼트/평균 컬럼 순서)."""
+    metric = SegmentMetric(column, events, reducer, mean, label, note)
+    SEGMENT_METRICS[column] = metric
+    return metric
+
+
+def computed_metrics() -> list[SegmentMetric]:
+    return [m for m in SEGMENT_METRICS.values() if m.computed]
+
+
+def mean_metrics() -> list[SegmentMetric]:
+    return [m for m in SEGMENT_METRICS.values() if m.mean]
+
+
+# 평균 중 등록표 밖에서 따로 계산하는 컬럼 (시간 지표, 첫 클리어 별)
+BASE_MEANS_COLUMNS = ["stage", "n_players_used", "mean_stage_play_time", "mean_clear_time",
+                      "mean_first_clear_star"]
+
+
+def means_columns() -> list[str]:
+    """global_stage_means 출력 컬럼 순서"""
+    return BASE_MEANS_COLUMNS + [m.mean for m in mean_metrics()]
+
+
+def metrics_digest() -> str:
+    """등록표 지문. 세그먼트 컬럼 구성이 바뀌면 디스크 캐시가 무효화되도록 버전 문자열에 넣습니다."""
+    return hashlib.blake2b(repr(list(SEGMENT_METRICS.values())).encode("utf-8"),
+                           digest_size=4).hexdigest()
+
+
+# === 등록표 ===
+register_metric("retry_cnt", ("StageRetry",), mean="mean_retry",
+                label="리트라이 횟수", note="시도 내 StageRetry 발생 횟수 평균.")
+register_metric("cam_move_cnt", ("CameraZoom",), mean="mean_cam_move",
+                label="카메라 이동", note="CameraZoom 횟수 평균.")
+register_metric("cam_rotate_cnt", ("CameraRotate",), mean="mean_cam_rotate",
+                label="카메라 회전", note="CameraRotate 횟수 평균.")
+register_metric("cam_pan_cnt", ("CameraPanning",), mean="mean_cam_pan",
+                label="카메라 패닝", note="CameraPanning 횟수 평균.")
+register_metric("cam_total_cnt", ("CameraZoom", "CameraRotate", "CameraPanning"), mean="mean_cam_total",
+                label="카메라 조작(통합)", note="줌/회전/패닝 이벤트 합의 평균.")
+register_metric("grab_pair_cnt", mean="mean_grab_pair",  # 그랩/브레이크 짝 맞추기는 엔진이 계산
+                label="그랩(세트)", note="InputGrab~InputGrabBreak 한 쌍을 1회로 본 횟수 평균.")
+register_metric("pushpull_cnt", ("InputPushPull",), mean="mean_pushpull",
+                label="밀·당 횟수", note="InputPushPull 횟수 평균.")
+register_metric("first_star", ("StageStar",), "first_value")
+register_metric("final_star", ("StageStar",), "last_value")
+register_metric("bomb_detect_cnt", ("BombDetect",), mean="mean_bomb_detect",
+                label="폭탄 감지", note="폭탄 감지 메시지(BombDetect) 횟수 평균.")
+register_metric("bomb_explode_cnt", ("BombExplode",), mean="mean_bomb_explode",
+                label="폭탄 폭발", note="[BombManager] 폭발 메시지(BombExplode) 횟수 평균.")
+register_metric("climax_cnt", ("ClimaxRequest",), mean="mean_climax",
+                label="클라이맥스 폭발 요청", note="[climax] 폭발 요청(ClimaxRequest) 횟수 평균.")
+register_metric("tilt_cnt", ("SeesawTilt",), mean="mean_tilt",
+                label="시소 기울이기", note="SeesawTilt 횟수 평균.")
+register_metric("first_bomb_offset", ("BombDetect",), "first_offset", mean="mean_first_bomb_offset",
+                label="첫 폭탄 감지까지(초)", note="StageBegin ~ 첫 BombDetect 시간(감지가 있었던 시도만 평균).")
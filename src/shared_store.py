@@ -0,0 +1,296 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import uuid
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+import pandas as pd
+import pyarrow.feather as feather
+from .cache_manager import _GENERATIONS, CacheManager, result_stamp
+from .event_index import EventIndex
+from .parser import concat_frames, empty_raw, scan_logs
+from .segment_builder import segment_columns
+from .stage_store import StageAggregateStore
+
+# 공유 스냅샷: CacheManager가 현재 내용을 무압축 Arrow IPC(Feather v2) 파일로 내보내고,
+# 다른 프로세스(Streamlit 워커, app_cli)는 파싱 없이 memory_map으로 붙어 읽습니다.
+# 매핑된 페이지는 OS 페이지 캐시를 함께 쓰므로 읽는 프로세스가 N개여도 raw는 거의 한 벌만 차지합니다.
+#
+#   <shared_root>/<data_dir 해시>/CURRENT              -> "manifest-g<G>-<writer>.json" (os.replace로 교체)
+#   <shared_root>/<data_dir 해시>/manifest-g<G>-<writer>.json
+#   <shared_root>/<data_dir 해시>/<플레이어 해시>-<writer>-g<g>.{raw,seg}.arrow
+# 플레이어 파일 이름에는 그 플레이어가 마지막으로 바뀐 generation이 들어가므로,
+# 다시 내보낼 때는 바뀐 플레이어 파일만 새로 씁니다. 파일은 쓰고 난 뒤 내용을 바꾸지 않습니다.
+SHARED_VERSION = 1
+CURRENT_NAME = "CURRENT"
+# 최근 manifest 몇 개가 가리키는 파일까지 남길지 (막 붙으려던 읽는 쪽이 지워진 파일을 만나지 않게)
+KEEP_MANIFESTS = 3
+_MANIFEST_RE = re.compile(r"manifest-g(\d+)-[0-9a-f]+\.json")
+
+
+def partition_dir(shared_root: str | Path, data_dir: str | Path) -> Path:
+    """data_dir(날짜 파티션)별 공유 폴더"""
+    key = str(Path(data_dir).resolve()).encode("utf-8")
+    return Path(shared_root) / hashlib.blake2b(key, digest_size=6).hexdigest()
+
+
+def snapshot_options(file_pattern: str, assume_orphan: bool, segment_engine: str) -> dict:
+    """스냅샷을 그대로 써도 되는지 비교하는 옵션 (파서/분할기/지표 버전 포함)"""
+    return {"file_pattern": file_pattern, "assume_orphan": bool(assume_orphan),
+            "segment_engine": segment_engine,
+            "version": result_stamp(assume_orphan)}
+
+
+def input_stats(data_dir: Path, pattern: str) -> dict[str, list[int]]:
+    """입력 파일 이름 -> [size, mtime_ns] (스냅샷 최신 여부 확인용)"""
+    stats = {}
+    for p in scan_logs(Path(data_dir), pattern):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        stats[p.relative_to(data_dir).as_posix()] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def _mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _write_json(path: Path, doc) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(doc, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _write_frame(df: pd.DataFrame, path: Path) -> None:
+    tmp = path.with_suffix(".tmp")
+    feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+    os.replace(tmp, path)
+
+
+class SharedStoreWriter:
+    """CacheManager 하나의 내용을 공유 폴더로 내보냅니다 (CacheManager(shared_dir=...)가 만들어 씀)."""
+
+    def __init__(self, shared_root: str | Path, data_dir: str | Path):
+        self.data_dir = Path(data_dir)
+        self.dir = partition_dir(shared_root, data_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # 프로세스마다 generation이 1부터 다시 시작하므로 파일 이름에 내보내는 쪽 식별자를 넣음
+        self.writer = uuid.uuid4().hex[:8]
+        self.published = 0
+
+    def publish(self, cm: CacheManager) -> Path:
+        """cm의 현재 내용을 manifest로 내보내고 CURRENT를 바꿉니다. 호출 측이 cm._lock을 잡고 있어야 합니다."""
+        files = {}
+        for pid in cm.seg_by_player:  # 플레이어 순서(=평균 합산 순서)를 그대로 보존
+            stem = hashlib.blake2b(pid.encode("utf-8"), digest_size=6).hexdigest()
+            stem = f"{stem}-{self.writer}-g{cm.player_generation[pid]}"
+            names = {k: f"{stem}.{k}.arrow" for k in ("raw", "seg")}
+            for kind, frames in (("raw", cm.raw_by_player), ("seg", cm.seg_by_player)):
+                if not (self.dir / names[kind]).exists():
+                    _write_frame(frames[pid], self.dir / names[kind])
+            files[pid] = names
+        manifest = {
+            "version": SHARED_VERSION,
+            "generation": cm.generation,
+            "writer": self.writer,
+            "data_dir": str(self.data_dir.resolve()),
+            "options": snapshot_options(cm.pattern, cm.assume_orphan, cm.segment_engine),
+            # 내보내는 시점이 아니라 로딩할 때 본 값 (그 사이 바뀐 파일은 읽는 쪽이 최신이 아니라고 판단)
+            "inputs": cm.input_stats(),
+            # incremental 모드에서 파싱을 마친 위치 (inputs의 크기보다 작으면 마지막 줄을 아직 안 읽은 스냅샷)
+            "offsets": cm.tail_offsets(),
+            "players": files,
+        }
+        name = f"manifest-g{cm.generation}-{self.writer}.json"
+        _write_json(self.dir / name, manifest)
+        tmp = self.dir / (CURRENT_NAME + ".tmp")
+        tmp.write_text(name, encoding="utf-8")
+        os.replace(tmp, self.dir / CURRENT_NAME)
+        self.published = cm.generation
+        self.collect(keep=name)
+        return self.dir / name
+
+    def collect(self, keep: str | None = None) -> int:
+        """
+        최근 KEEP_MANIFESTS개(+keep)의 manifest가 가리키지 않는 파일을 지웁니다.
+        이미 매핑한 프로세스는 지워진 파일도 계속 읽을 수 있고(POSIX), 지우지 못한 파일은 다음에 다시 시도합니다.
+        """
+        manifests = sorted((p for p in self.dir.glob("manifest-*.json") if _MANIFEST_RE.fullmatch(p.name)),
+                           key=_mtime_ns, reverse=True)
+        kept = manifests[:KEEP_MANIFESTS] + ([self.dir / keep] if keep else [])
+        live: set[str] = set()
+        for p in kept:
+            try:
+                doc = json.loads(p.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                continue
+            live.update(n for names in doc["players"].values() for n in names.values())
+        removed = 0
+        for p in manifests[KEEP_MANIFESTS:] + list(self.dir.glob("*.arrow")):
+            if p in kept or p.name in live:
+                continue
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class _MappedFrames(Mapping):
+    """PlayerID -> 프레임. 파일은 붙을 때 모두 매핑해 두고, pandas 변환은 처음 조회될 때 합니다."""
+
+    def __init__(self, tables: dict):
+        self._tables = tables
+        self._frames: dict[str, pd.DataFrame] = {}
+
+    def __getitem__(self, pid: str) -> pd.DataFrame:
+        df = self._frames.get(pid)
+        if df is None:
+            # 숫자/시간/범주 코드 컬럼은 매핑된 버퍼를 그대로 가리킴 (복사 없음, 읽기 전용)
+            df = self._frames[pid] = self._tables[pid].to_pandas(split_blocks=True)
+        return df
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._tables)
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+
+class SharedSnapshot:
+    """
+    공유 폴더에 붙은 읽기 전용 스냅샷. CacheManager의 조회용 속성/메서드
+    (generation, players, raw_by_player, seg_by_player, stage_store, event_index, events, all_segments)를
+    같은 모양으로 제공하므로 query_service.run_query와 집계 함수에 그대로 넘길 수 있습니다.
+    generation은 이 프로세스의 _GENERATIONS에서 새로 받으므로 로컬 CacheManager 값과 겹치지 않습니다.
+    """
+
+    def __init__(self, directory: Path, manifest_name: str, manifest: dict):
+        self.dir = directory
+        self.manifest_name = manifest_name
+        self.manifest = manifest
+        self.data_dir = Path(manifest["data_dir"])
+        self.pattern = manifest["options"]["file_pattern"]
+        self.published_generation = manifest["generation"]
+        self.generation = next(_GENERATIONS)
+        self.errors: dict[Path, str] = {}
+        self.load_stats: dict[Path, dict] = {}
+        players = manifest["players"]
+        self.raw_by_player = _MappedFrames(
+            {pid: feather.read_table(directory / n["raw"], memory_map=True) for pid, n in players.items()})
+        self.seg_by_player = _MappedFrames(
+            {pid: feather.read_table(directory / n["seg"], memory_map=True) for pid, n in players.items()})
+        self.stage_store = StageAggregateStore()
+        for pid in players:
+            self.stage_store.update(pid, self.seg_by_player[pid])
+        # raw 색인은 플레이어가 처음 조회될 때 만듦 (붙을 때 raw 페이지를 건드리지 않게)
+        self.event_index = EventIndex(self.raw_by_player)
+        self._segments: pd.DataFrame | None = None
+        self._raw: pd.DataFrame | None = None
+
+    def is_complete(self) -> bool:
+        """내보낼 때 모든 입력 파일을 끝까지 반영했는지 (줄바꿈 없는 마지막 줄을 미룬 파일이 없는지)"""
+        inputs = self.manifest["inputs"]
+        return all(name in inputs and inputs[name][0] == offset
+                   for name, offset in self.manifest.get("offsets", {}).items())
+
+    def is_fresh(self) -> bool:
+        """
+        입력 파일 목록/크기/mtime이 내보낼 때와 같고 모두 끝까지 반영했는지 (파일 내용은 읽지 않음).
+        마지막 줄을 미룬 스냅샷은 입력이 그대로여도 최신으로 보지 않습니다.
+        """
+        return self.is_complete() and input_stats(self.data_dir, self.pattern) == self.manifest["inputs"]
+
+    def is_current(self) -> bool:
+        """이 스냅샷이 여전히 CURRENT가 가리키는 manifest인지"""
+        return _read_current(self.dir) == self.manifest_name
+
+    def players(self) -> list[str]:
+        return sorted(self.raw_by_player)
+
+    def events(self, player: str, t0=None, t1=None, event_types: list[str] | None = None) -> pd.DataFrame:
+        """CacheManager.events와 같음"""
+        return self.event_index.events(player, t0, t1, event_types)
+
+    def grab_source(self) -> EventIndex:
+        return self.event_index
+
+    def load_raw(self, pid: str) -> pd.DataFrame:
+        return self.raw_by_player[pid]
+
+    def all_segments(self) -> pd.DataFrame:
+        if self._segments is None:
+            frames = [self.seg_by_player[pid] for pid in self.seg_by_player]
+            self._segments = (pd.concat(frames, ignore_index=True) if frames
+                              else pd.DataFrame(columns=segment_columns()))
+        return self._segments
+
+    def all_raw(self) -> pd.DataFrame:
+        """전체 raw를 이어 붙인 프레임 (이 호출은 매핑이 아니라 복사본을 만듭니다)"""
+        if self._raw is None:
+            frames = [self.raw_by_player[pid] for pid in self.raw_by_player]
+            self._raw = concat_frames(frames) if frames else empty_raw()
+        return self._raw
+
+    def memory_usage(self) -> dict[str, int]:
+        """이 프로세스가 따로 들고 있는 메모리만 셉니다 (매핑된 raw 버퍼는 공유라 제외, 세그먼트만)."""
+        return {pid: int(self.seg_by_player[pid].memory_usage(deep=True).sum())
+                for pid in self.seg_by_player}
+
+    def memory_bytes(self) -> int:
+        total = sum(self.memory_usage().values())
+        for df in (self._segments, self._raw):
+            if df is not None:
+                total += int(df.memory_usage(deep=True).sum())
+        return total
+
+    def memory_breakdown(self) -> dict:
+        """CacheManager.memory_breakdown과 같은 모양 (raw는 매핑이라 0)"""
+        snapshots = sum(int(df.memory_usage(deep=True).sum())
+                        for df in (self._segments, self._raw) if df is not None)
+        return {"retention": "shared", "raw": 0, "grabs": 0,
+                "segments": sum(self.memory_usage().values()), "snapshots": snapshots}
+
+
+def _read_current(directory: Path) -> str | None:
+    try:
+        return (directory / CURRENT_NAME).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def attach(shared_root: str | Path, data_dir: str | Path, options: dict | None = None,
+           fresh: bool = True) -> SharedSnapshot | None:
+    """
+    data_dir의 현재 공유 스냅샷에 붙습니다. 없거나, options(snapshot_options)가 다르거나,
+    fresh=True인데 입력 파일이 그 뒤로 바뀌었거나 마지막 줄을 미룬 스냅샷이면 None (호출 측이 직접 로딩).
+    CURRENT를 읽은 직후 정리로 파일이 지워지는 경합은 한 번 다시 시도합니다.
+    """
+    directory = partition_dir(shared_root, data_dir)
+    for attempt in range(2):
+        name = _read_current(directory)
+        if name is None:
+            return None
+        try:
+            manifest = json.loads((directory / name).read_text(encoding="utf-8"))
+            if manifest.get("version") != SHARED_VERSION:
+                return None
+            if options is not None and manifest["options"] != options:
+                return None
+            snap = SharedSnapshot(directory, name, manifest)
+        except FileNotFoundError:
+            if attempt:
+                return None
+            continue
+        if fresh and not snap.is_fresh():
+            return None
+        return snap
+    return None
@@ -0,0 +1,177 @@
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+# 병합 가능한 분위수 스케치 (DDSketch 방식 로그 버킷 히스토그램).
+# 값 v를 ceil(log_gamma |v|) 버킷에 세어 두면 어떤 분위수든 상대 오차 ALPHA 안에서 답하고,
+# 병합은 버킷별 개수 합이라 순서와 무관하게 결과가 같습니다(플레이어/날짜 선택을 자유롭게 합침).
+# 버킷 수는 값의 범위(최소/최대 비율)에만 비례하므로 데이터가 몇 달 치여도 스테이지당 크기가 일정합니다.
+ALPHA = 0.01
+_GAMMA = (1 + ALPHA) / (1 - ALPHA)
+_LOG_GAMMA = np.log(_GAMMA)
+# |v|가 이보다 작으면 0 버킷. 버킷 키는 부호를 살린 서수로 저장: 0, ±(k + _KEY_OFFSET)
+_MIN_VALUE = 1e-9
+_KEY_OFFSET = 1 << 20
+
+# 스케치를 만드는 세그먼트 컬럼 (global_stage_quantiles 출력 순서)
+SKETCH_COLUMNS = ["stage_play_time", "clear_time", "retry_cnt"]
+# 정수 지표: |값| < 0.5/ALPHA(=50)이면 상대 오차가 0.5보다 작으므로 반올림하면 정확한 값
+INTEGER_COLUMNS = {"retry_cnt"}
+DEFAULT_QUANTILES = (0.5, 0.9)
+
+
+def sketch_keys(values: np.ndarray) -> np.ndarray:
+    """값 -> 정렬 순서를 보존하는 버킷 키 (int64). NaN은 호출 측에서 빼야 합니다."""
+    v = np.asarray(values, dtype=float)
+    mag = np.abs(v)
+    keys = np.zeros(len(v), dtype=np.int64)
+    nz = mag >= _MIN_VALUE
+    k = np.ceil(np.log(mag[nz]) / _LOG_GAMMA).astype(np.int64) + _KEY_OFFSET
+    keys[nz] = np.where(v[nz] > 0, k, -k)
+    return keys
+
+
+def _key_value(key: int) -> float:
+    """버킷 대표값 (버킷 경계 사이에서 상대 오차가 ALPHA 이하인 값)"""
+    if key == 0:
+        return 0.0
+    k = abs(key) - _KEY_OFFSET
+    v = 2 * _GAMMA ** k / (_GAMMA + 1)
+    return v if key > 0 else -v
+
+
+def quantile_label(column: str, q: float) -> str:
+    """clear_time, 0.9 -> clear_time_p90"""
+    return f"{column}_p{q * 100:g}"
+
+
+class QuantileSketch:
+    """
+    버킷 키(오름차순)와 개수, 정확한 최솟값/최댓값. 값이 없는 스케치는 count == 0.
+    만든 뒤에는 바꾸지 않고, merge()가 새 스케치를 돌려줍니다.
+    """
+
+    __slots__ = ("keys", "counts", "min", "max")
+
+    def __init__(self, keys: np.ndarray | None = None, counts: np.ndarray | None = None,
+                 vmin: float = np.nan, vmax: float = np.nan):
+        self.keys = np.empty(0, dtype=np.int64) if keys is None else keys
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+        self.min = vmin
+        self.max = vmax
+
+    @classmethod
+    def from_values(cls, values) -> QuantileSketch:
+        v = np.asarray(values, dtype=float)
+        v = v[~np.isnan(v)]
+        if not len(v):
+            return cls()
+        keys, counts = np.unique(sketch_keys(v), return_counts=True)
+        return cls(keys, counts.astype(np.int64), float(v.min()), float(v.max()))
+
+    @classmethod
+    def merge(cls, sketches) -> QuantileSketch:
+        """여러 스케치를 합친 새 스케치 (순서와 무관)"""
+        parts = [s for s in sketches if s.count]
+        if not parts:
+            return cls()
+        if len(parts) == 1:
+            return parts[0]
+        keys, inv = np.unique(np.concatenate([s.keys for s in parts]), return_inverse=True)
+        counts = np.bincount(inv, weights=np.concatenate([s.counts for s in parts]),
+                             minlength=len(keys)).astype(np.int64)
+        return cls(keys, counts, min(s.min for s in parts), max(s.max for s in parts))
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        """
+        q 분위수 근사. 정렬된 n개 값 중 floor(q*(n-1))번째 값(pandas interpolation="lower")을
+        상대 오차 ALPHA 안에서 돌려줍니다. q=0/1은 정확한 최솟값/최댓값.
+        """
+        n = self.count
+        if n == 0:
+            return np.nan
+        rank = int(np.floor(q * (n - 1)))
+        if rank <= 0:
+            return self.min
+        if rank >= n - 1:
+            return self.max
+        i = int(np.searchsorted(np.cumsum(self.counts), rank, side="right"))
+        return float(min(max(_key_value(int(self.keys[i])), self.min), self.max))
+
+    def to_dict(self) -> dict:
+        """JSON으로 저장할 수 있는 형태 (from_dict로 복원)"""
+        return {"keys": self.keys.tolist(), "counts": self.counts.tolist(),
+                "min": self.min, "max": self.max, "alpha": ALPHA}
+
+    @classmethod
+    def from_dict(cls, doc: dict) -> QuantileSketch:
+        if doc.get("alpha") != ALPHA:
+            raise ValueError(f"Sketch alpha {doc.get('alpha')} != {ALPHA}")
+        return cls(np.asarray(doc["keys"], dtype=np.int64), np.asarray(doc["counts"], dtype=np.int64),
+                   float(doc["min"]), float(doc["max"]))
+
+    def __repr__(self) -> str:
+        return f"QuantileSketch(n={self.count}, buckets={len(self.keys)}, min={self.min}, max={self.max})"
+
+
+def merge_stage_sketches(groups) -> dict[str, dict[str, QuantileSketch]]:
+    """{컬럼: {스테이지: 스케치}} 여러 개(플레이어별, 날짜별 등)를 하나로 병합합니다."""
+    collected: dict[str, dict[str, list[QuantileSketch]]] = {col: {} for col in SKETCH_COLUMNS}
+    for group in groups:
+        for col, by_stage in group.items():
+            for stage, sketch in by_stage.items():
+                collected.setdefault(col, {}).setdefault(stage, []).append(sketch)
+    return {col: {stage: QuantileSketch.merge(v) for stage, v in sorted(by_stage.items())}
+            for col, by_stage in collected.items()}
+
+
+def encode_sketches(sketches: dict[str, dict[str, QuantileSketch]]) -> dict:
+    """{컬럼: {스테이지: 스케치}} -> JSON으로 저장할 수 있는 dict"""
+    return {col: {stage: sk.to_dict() for stage, sk in by_stage.items()}
+            for col, by_stage in sketches.items()}
+
+
+def decode_sketches(doc: dict) -> dict[str, dict[str, QuantileSketch]]:
+    """encode_sketches의 역 (ALPHA가 다르면 ValueError)"""
+    return {col: {stage: QuantileSketch.from_dict(d) for stage, d in by_stage.items()}
+            for col, by_stage in doc.items()}
+
+
+def segment_sketches(seg: pd.DataFrame) -> dict[str, dict[str, QuantileSketch]]:
+    """세그먼트 프레임(플레이어 한 명) -> {컬럼: {스테이지: 스케치}} (stage가 없는 행 제외)"""
+    s = seg[seg["stage"].notna()] if not seg.empty else seg
+    if s.empty:
+        return {}
+    return {col: stage_sketches(s, col) for col in SKETCH_COLUMNS}
+
+
+def stage_sketches(s: pd.DataFrame, column: str) -> dict[str, QuantileSketch]:
+    """
+    세그먼트 프레임(stage가 있는 행) -> 스테이지별 column 스케치.
+    (스테이지, 버킷) 순으로 한 번 정렬해 모든 스테이지의 버킷 개수를 함께 셉니다.
+    """
+    v = s[column].to_numpy(dtype=float)
+    ok = ~np.isnan(v)
+    if not ok.any():
+        return {}
+    codes, stages = pd.factorize(s["stage"].to_numpy()[ok], sort=True)
+    v = v[ok]
+    keys = sketch_keys(v)
+    order = np.lexsort((keys, codes))
+    codes, keys, v = codes[order], keys[order], v[order]
+    new_cell = np.r_[True, (codes[1:] != codes[:-1]) | (keys[1:] != keys[:-1])]
+    cell_starts = np.flatnonzero(new_cell)
+    cell_counts = np.diff(np.append(cell_starts, len(v)))
+    cell_codes = codes[cell_starts]
+    row_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    vmin = np.minimum.reduceat(v, row_starts)
+    vmax = np.maximum.reduceat(v, row_starts)
+    bounds = np.searchsorted(cell_codes, np.arange(len(stages) + 1))
+    return {stage: QuantileSketch(keys[cell_starts[bounds[i]:bounds[i + 1]]],
+                                  cell_counts[bounds[i]:bounds[i + 1]].astype(np.int64),
+                                  float(vmin[i]), float(vmax[i]))
+            for i, stage in enumerate(stages)}
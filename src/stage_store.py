@@ -0,0 +1,253 @@
+from __future__ import annotations
+import threading
+import numpy as np
+import pandas as pd
+from .profiler import profiled
+from .segment_metrics import mean_metrics, means_columns
+from .sketches import (ALPHA, DEFAULT_QUANTILES, INTEGER_COLUMNS, SKETCH_COLUMNS, QuantileSketch,
+                       decode_sketches, encode_sketches, merge_stage_sketches, quantile_label,
+                       segment_sketches)
+
+# 시간 지표(실수): 합산 순서에 따라 마지막 비트가 달라지므로 값 배열을 보관
+TIME_METRICS = {
+    "mean_stage_play_time": "stage_play_time",
+    "mean_clear_time": "clear_time",
+}
+FIRST_CLEAR_COLUMNS = ["PlayerID", "stage", "first_clear_star"]
+
+
+def _split_metrics() -> tuple[dict[str, str], dict[str, str]]:
+    """
+    평균 컬럼 -> 세그먼트 컬럼 (횟수 지표, 실수 지표).
+    횟수 지표는 정수 합/개수로 병합해도 pandas 평균과 정확히 같고,
+    실수 지표(시간 + 등록된 값/오프셋 지표)는 값 배열을 보관해 같은 순서로 이어 붙인 뒤 pandas로 평균냅니다.
+    """
+    counts, values = {}, dict(TIME_METRICS)
+    for m in mean_metrics():
+        (counts if m.reducer == "count" else values)[m.mean] = m.column
+    return counts, values
+
+
+def _empty_values() -> dict[str, np.ndarray]:
+    return {"stage": np.empty(0, dtype=object),
+            **{col: np.empty(0, dtype=float) for col in _split_metrics()[1].values()}}
+
+
+def _values_to_dict(values: dict[str, np.ndarray]) -> dict:
+    """실수 지표 값 배열 -> {컬럼: {스테이지: 값 목록(행 순)}} (부분 집계 파일 형식)"""
+    idx = pd.Series(values["stage"]).groupby(values["stage"], sort=True).indices
+    return {col: {stage: arr[pos].tolist() for stage, pos in idx.items()}
+            for col, arr in values.items() if col != "stage"}
+
+
+def _values_from_dict(doc: dict) -> dict[str, np.ndarray]:
+    """_values_to_dict의 역. 스테이지별로 모이지만 스테이지 안의 행 순서는 그대로라 평균이 같습니다."""
+    if not doc:
+        return _empty_values()
+    first = next(iter(doc.values()))
+    stages = np.array([stage for stage, vals in first.items() for _ in vals], dtype=object)
+    return {"stage": stages,
+            **{col: np.array([v for vals in by_stage.values() for v in vals], dtype=float)
+               for col, by_stage in doc.items()}}
+
+
+def _player_partial(seg: pd.DataFrame) -> dict:
+    """플레이어 한 명의 세그먼트를 스테이지별 부분 집계로 줄입니다."""
+    count_metrics, value_metrics = _split_metrics()
+    s = seg[seg["stage"].notna()] if not seg.empty else seg
+    if s.empty:
+        return {"sums": pd.DataFrame(), "counts": pd.DataFrame(), "values": _empty_values(),
+                "first_star": None, "sketches": {}}
+    by = s.groupby("stage", sort=True)
+    cols = list(count_metrics.values())
+    sums = by[cols + ["exit_cnt"]].sum()
+    counts = by[cols].count()
+    sums["players"] = 1
+
+    # 실수 지표는 스테이지/값 배열을 세그먼트 순서 그대로 보관
+    values = {"stage": s["stage"].to_numpy(dtype=object),
+              **{col: s[col].to_numpy(dtype=float) for col in value_metrics.values()}}
+
+    cleared = s[(s["cleared"] == True) & s["first_star"].notna()]
+    first_star = None
+    if not cleared.empty:
+        cleared = cleared.sort_values(["stage", "t_end"], kind="mergesort")
+        first_star = cleared.groupby("stage")["first_star"].first()
+    sketches = segment_sketches(s)
+    return {"sums": sums, "counts": counts, "values": values, "first_star": first_star,
+            "sketches": sketches}
+
+
+def _frame_to_dict(df: pd.DataFrame) -> dict:
+    return {"index": df.index.tolist(), "columns": {c: df[c].tolist() for c in df.columns}}
+
+
+def _frame_from_dict(doc: dict) -> pd.DataFrame:
+    return pd.DataFrame(doc["columns"], index=pd.Index(doc["index"], dtype=object, name="stage"))
+
+
+def encode_partial(part: dict) -> dict:
+    """플레이어 부분 집계 -> JSON으로 저장할 수 있는 dict (map-reduce 부분 집계 파일용)"""
+    if part["sums"].empty:
+        return {"empty": True}
+    star = part["first_star"]
+    return {
+        "sums": _frame_to_dict(part["sums"]),
+        "counts": _frame_to_dict(part["counts"]),
+        "values": _values_to_dict(part["values"]),
+        "first_star": None if star is None else {"index": star.index.tolist(), "values": star.tolist()},
+        "sketches": encode_sketches(part["sketches"]),
+    }
+
+
+def decode_partial(doc: dict) -> dict:
+    """encode_partial의 역. 복원한 부분 집계로 병합한 결과는 원래 세그먼트로 계산한 값과 같습니다."""
+    if doc.get("empty"):
+        return {"sums": pd.DataFrame(), "counts": pd.DataFrame(), "values": _empty_values(),
+                "first_star": None, "sketches": {}}
+    star = doc["first_star"]
+    return {
+        "sums": _frame_from_dict(doc["sums"]),
+        "counts": _frame_from_dict(doc["counts"]),
+        "values": _values_from_dict(doc["values"]),
+        "first_star": None if star is None else pd.Series(
+            star["values"], index=pd.Index(star["index"], dtype=object, name="stage"),
+            dtype=float, name="first_star"),
+        "sketches": decode_sketches(doc["sketches"]),
+    }
+
+
+class StageAggregateStore:
+    """
+    플레이어별 스테이지 부분 집계(합, 개수, 참여 여부, 첫 클리어 별)를 보관하고
+    선택된 플레이어의 부분 집계만 병합해 전역 지표를 답합니다.
+
+    결과는 aggregator.global_stage_means / global_stage_exit_counts /
+    personal_first_clear_stars 와 정확히 같습니다.
+    - 횟수 지표와 exit 합은 정수 합/개수로 병합
+    - 시간 지표는 플레이어 등록 순으로 값 배열을 이어 붙여 pandas groupby 평균(같은 순서의 보정 합산)
+    - 첫 클리어 별 평균은 PlayerID 정렬 순으로 이어 붙여 같은 방식으로 평균
+    분위수(global_stage_quantiles)는 플레이어별 스케치를 병합한 근사값입니다(정확한 값은 aggregator 쪽).
+    플레이어 순서는 CacheManager.seg_by_player와 같게 유지됩니다(갱신은 자리 유지, 새 플레이어는 뒤에).
+    """
+
+    def __init__(self):
+        self._parts: dict[str, dict] = {}
+        # 감시 스레드의 갱신과 조회가 겹쳐도 dict 순회가 깨지지 않도록
+        self._lock = threading.Lock()
+
+    def update(self, pid: str, seg: pd.DataFrame):
+        """pid의 세그먼트가 바뀌었을 때 그 플레이어의 부분 집계만 교체합니다."""
+        part = _player_partial(seg)
+        with self._lock:
+            self._parts[pid] = part
+
+    def remove(self, pid: str):
+        with self._lock:
+            self._parts.pop(pid, None)
+
+    def partials(self) -> list[tuple[str, dict]]:
+        """(PlayerID, 부분 집계) 목록 (등록 순)"""
+        with self._lock:
+            return list(self._parts.items())
+
+    def put_partial(self, pid: str, part: dict):
+        """다른 곳에서 만든 부분 집계(decode_partial)를 그대로 등록합니다 (맨 뒤, 이미 있으면 자리 유지)."""
+        with self._lock:
+            self._parts[pid] = part
+
+    def move_to_end(self, pids: list[str]):
+        """pids를 주어진 순서로 맨 뒤에 다시 놓습니다 (CacheManager 플레이어 순서와 맞추기용)."""
+        with self._lock:
+            for pid in pids:
+                if pid in self._parts:
+                    self._parts[pid] = self._parts.pop(pid)
+
+    def clear(self):
+        with self._lock:
+            self._parts.clear()
+
+    def _select(self, players: list[str] | None) -> list[tuple[str, dict]]:
+        """players=None이면 전체. 순서는 등록 순."""
+        with self._lock:
+            if players is None:
+                return list(self._parts.items())
+            wanted = set(players)
+            return [(p, part) for p, part in self._parts.items() if p in wanted]
+
+    @profiled("aggregate.store.global_stage_means")
+    def global_stage_means(self, players: list[str] | None = None) -> pd.DataFrame:
+        selected = self._select(players)
+        parts = [part for _, part in selected if not part["sums"].empty]
+        if not parts:
+            return pd.DataFrame(columns=means_columns())
+        count_metrics, value_metrics = _split_metrics()
+        sums = pd.concat([p["sums"] for p in parts]).groupby(level=0).sum()
+        counts = pd.concat([p["counts"] for p in parts]).groupby(level=0).sum()
+        stages = sums.index
+
+        out = pd.DataFrame({"stage": stages.to_numpy(dtype=object)})
+        out["n_players_used"] = sums["players"].to_numpy()
+        # 값 배열을 등록 순으로 이어 붙여 한 번에 평균 (pandas의 보정 합산이라 전체 세그먼트 평균과 비트 단위로 같음)
+        values = pd.DataFrame({k: np.concatenate([p["values"][k] for p in parts]) for k in parts[0]["values"]})
+        means = values.groupby("stage", sort=True)[list(value_metrics.values())].mean().reindex(stages)
+        for name, col in value_metrics.items():
+            out[name] = means[col].to_numpy()
+        stars = [part["first_star"] for _, part in sorted(selected, key=lambda x: x[0])
+                 if part["first_star"] is not None]
+        star_means = (pd.concat(stars).astype(float).groupby(level=0).mean() if stars
+                      else pd.Series(dtype=float))
+        out["mean_first_clear_star"] = star_means.reindex(stages).to_numpy(dtype=float)
+        for name, col in count_metrics.items():
+            n = counts[col].to_numpy()
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[name] = np.where(n > 0, sums[col].to_numpy(dtype=float) / n, np.nan)
+        return out[means_columns()]
+
+    def stage_sketches(self, players: list[str] | None = None) -> dict[str, dict[str, QuantileSketch]]:
+        """선택된 플레이어의 스케치를 병합한 {컬럼: {스테이지: 스케치}} (날짜 간 병합은 merge_stage_sketches)"""
+        return merge_stage_sketches(part["sketches"] for _, part in self._select(players))
+
+    @profiled("aggregate.store.global_stage_quantiles")
+    def global_stage_quantiles(self, players: list[str] | None = None,
+                               quantiles: tuple[float, ...] = DEFAULT_QUANTILES) -> pd.DataFrame:
+        """스테이지별 SKETCH_COLUMNS 분위수 근사 (상대 오차 sketches.ALPHA 이내)"""
+        return sketch_quantiles(self.stage_sketches(players), quantiles)
+
+    @profiled("aggregate.store.global_stage_exit_counts")
+    def global_stage_exit_counts(self, players: list[str] | None = None) -> pd.DataFrame:
+        parts = [part["sums"] for _, part in self._select(players)]
+        parts = [s for s in parts if not s.empty]
+        if not parts:
+            return pd.DataFrame(columns=["stage", "exit_sum"])
+        exit_sum = pd.concat([s["exit_cnt"] for s in parts]).groupby(level=0).sum()
+        return pd.DataFrame({"stage": exit_sum.index.to_numpy(dtype=object),
+                             "exit_sum": exit_sum.to_numpy().astype(int)})
+
+    @profiled("aggregate.store.personal_first_clear_stars")
+    def personal_first_clear_stars(self, players: list[str] | None = None) -> pd.DataFrame:
+        frames = []
+        for pid, part in sorted(self._select(players), key=lambda x: x[0]):
+            s = part["first_star"]
+            if s is not None:
+                frames.append(pd.DataFrame({"PlayerID": pid, "stage": s.index.to_numpy(dtype=object),
+                                            "first_clear_star": s.to_numpy()}))
+        if not frames:
+            return pd.DataFrame(columns=FIRST_CLEAR_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+
+def sketch_quantiles(sketches: dict[str, dict[str, QuantileSketch]],
+                     quantiles: tuple[float, ...] = DEFAULT_QUANTILES) -> pd.DataFrame:
+    """{컬럼: {스테이지: 스케치}} -> stage, <컬럼>_p<q>... 프레임 (aggregator.global_stage_quantiles와 같은 모양)"""
+    stages = sorted({stage for col in SKETCH_COLUMNS for stage in sketches.get(col, {})})
+    out = pd.DataFrame({"stage": pd.Series(stages, dtype=object)})
+    for col in SKETCH_COLUMNS:
+        by_stage = sketches.get(col, {})
+        for q in quantiles:
+            vals = np.array([by_stage[st].quantile(q) if st in by_stage else np.nan for st in stages],
+                            dtype=float)
+            if col in INTEGER_COLUMNS:
+                vals = np.where(np.abs(vals) < 0.5 / ALPHA, np.round(vals), vals)
+            out[quantile_label(col, q)] = vals
+    return out
@@ -0,0 +1,135 @@
+from __future__ import annotations
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+import pandas as pd
+from .aggregator import first_grab_top3_all, personal_stage_exit_counts, TOP3_COLUMNS
+from .cache_manager import cache_variant, parse_file
+from .disk_cache import DiskCache
+from .parser import filename_to_player_id
+from .stage_store import StageAggregateStore, decode_partial, encode_partial
+
+
+def iter_player_frames(paths: Iterable[Path], assume_orphan: bool = True,
+                       segment_engine: str = "vectorized",
+                       disk_cache: DiskCache | None = None) -> Iterator[tuple[str, pd.DataFrame, pd.DataFrame]]:
+    """
+    파일을 하나씩 (PlayerID, raw, 세그먼트)로 읽어 내보내는 제너레이터.
+    다음 파일은 소비자가 이전 결과를 다 쓴 뒤에 읽으므로 동시에 메모리에 있는 raw는 파일 하나뿐입니다.
+    disk_cache가 있으면 적중 시 Feather에서 읽고, 아니면 파싱 후 저장합니다.
+    """
+    variant = cache_variant(assume_orphan)
+    for path in paths:
+        try:
+            hit = disk_cache.get(path, variant) if disk_cache is not None else None
+            if hit is not None:
+                raw, seg, _ = hit
+                yield filename_to_player_id(path), raw, seg
+                continue
+            res = parse_file(path, assume_orphan, segment_engine, disk_cache)
+        except Exception as e:
+            print(f"[stream] Skip {path.name}: {e}")
+            continue
+        yield res["pid"], res["raw"], res["seg"]
+
+
+class StreamingAggregator:
+    """
+    플레이어를 하나씩 받아 CLI 출력(전역 평균, 개인 포기 합계, 스테이지별 First-Grab TOP3)을
+    누적합니다. raw는 add() 안에서만 쓰고 보관하지 않습니다.
+
+    결과는 모든 플레이어를 이어 붙여 계산한 값과 같습니다.
+    - 전역 평균: StageAggregateStore (플레이어를 넣은 순서 = 이어 붙인 순서)
+    - TOP3(earliest): 스테이지별로 (t_end, t_begin)이 가장 이른 시도를 후보로 유지,
+      동률이면 먼저 들어온 플레이어 (이어 붙인 뒤 안정 정렬한 것과 같은 규칙)
+    누적 상태는 to_partial()로 내보내고 merge_partial()로 합칠 수 있습니다 (app_cli --map/--reduce).
+    부분 집계를 플레이어 순서대로 합치면 결과는 한 번에 add()한 것과 같습니다.
+    """
+
+    def __init__(self, exclude_roots: bool = True):
+        self.exclude_roots = exclude_roots
+        self.store = StageAggregateStore()
+        self._exits: dict[str, pd.DataFrame] = {}
+        # stage -> ((t_end, t_begin), TOP3 행 프레임)
+        self._top3: dict[str, tuple[tuple, pd.DataFrame]] = {}
+
+    def add(self, pid: str, raw: pd.DataFrame, seg: pd.DataFrame):
+        self.store.update(pid, seg)
+        self._exits[pid] = personal_stage_exit_counts(seg, None)
+
+        s = seg[seg["t_end"].notna()]
+        if s.empty:
+            return
+        s = s.sort_values(["t_end", "t_begin"], kind="mergesort")
+        picks = s.groupby("stage", sort=True).head(1)
+        rows = first_grab_top3_all(picks, {pid: raw}, None, policies=("earliest",),
+                                   exclude_roots=self.exclude_roots)
+        for pick in picks.itertuples(index=False):
+            key = (pick.t_end, pick.t_begin)
+            cur = self._top3.get(pick.stage)
+            if cur is None or key < cur[0]:
+                self._top3[pick.stage] = (key, rows[rows["stage"] == pick.stage])
+
+    def global_stage_means(self) -> pd.DataFrame:
+        return self.store.global_stage_means()
+
+    def personal_exit_counts(self) -> pd.DataFrame:
+        frames = [self._exits[pid] for pid in sorted(self._exits) if not self._exits[pid].empty]
+        if not frames:
+            return pd.DataFrame(columns=["PlayerID","stage","exit_sum"])
+        return pd.concat(frames, ignore_index=True)
+
+    def first_grab_top3(self) -> pd.DataFrame:
+        frames = [self._top3[stage][1] for stage in sorted(self._top3)]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=TOP3_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    # ---------- map-reduce 부분 집계 ----------
+    def to_partial(self) -> dict:
+        """누적 상태를 JSON으로 저장할 수 있는 dict로 내보냅니다 (시각은 ns 정수)."""
+        top3 = {}
+        for stage, ((t_end, t_begin), rows) in self._top3.items():
+            top3[stage] = {
+                "key": [t_end.value, t_begin.value],
+                "rows": {"rank": rows["rank"].astype(int).tolist(),
+                         "object_name": rows["object_name"].astype(object).tolist(),
+                         "timestamp": pd.to_datetime(rows["timestamp"]).astype("int64").tolist(),
+                         "dt_from_begin": rows["dt_from_begin"].astype(float).tolist(),
+                         "PlayerID": rows["PlayerID"].astype(object).tolist()},
+            }
+        return {
+            "exclude_roots": self.exclude_roots,
+            "players": [[pid, encode_partial(part)] for pid, part in self.store.partials()],
+            "exits": {pid: {"stage": df["stage"].tolist(), "exit_sum": df["exit_sum"].astype(int).tolist()}
+                      for pid, df in self._exits.items()},
+            "top3": top3,
+        }
+
+    def merge_partial(self, doc: dict):
+        """
+        to_partial() 결과를 합칩니다. 전역 평균의 합산 순서를 지키려면 부분 집계를
+        플레이어 순서대로(샤드 순서대로) 넣어야 합니다. TOP3 동률은 먼저 합친 쪽이 이깁니다.
+        """
+        if doc["exclude_roots"] != self.exclude_roots:
+            raise ValueError("Partial built with a different exclude_roots setting")
+        for pid, part in doc["players"]:
+            self.store.put_partial(pid, decode_partial(part))
+        for pid, ex in doc["exits"].items():
+            self._exits[pid] = pd.DataFrame({"PlayerID": pid, "stage": pd.Series(ex["stage"], dtype=object),
+                                             "exit_sum": pd.Series(ex["exit_sum"], dtype=int)})
+        for stage, cand in doc["top3"].items():
+            key = (pd.Timestamp(cand["key"][0]), pd.Timestamp(cand["key"][1]))
+            cur = self._top3.get(stage)
+            if cur is not None and not key < cur[0]:
+                continue
+            r = cand["rows"]
+            rows = pd.DataFrame({
+                "policy": "earliest", "stage": stage,
+                "rank": pd.Series(r["rank"], dtype=int),
+                "object_name": pd.Series(r["object_name"], dtype=object),
+                "timestamp": pd.to_datetime(pd.Series(r["timestamp"], dtype="int64")),
+                "dt_from_begin": pd.Series(r["dt_from_begin"], dtype=float),
+                "PlayerID": pd.Series(r["PlayerID"], dtype=object),
+            }, columns=TOP3_COLUMNS)
+            self._top3[stage] = (key, rows)
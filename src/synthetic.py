@@ -0,0 +1,128 @@
+from __future__ import annotations
+import random
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# DATA/ 실측 분포를 대략 따른 합성 로그 생성기 (벤치마크/부하 시험용).
+# 같은 (seed, 날짜, 플레이어)면 항상 같은 파일이 나온다.
+
+STAGES = ["튜토리얼", "미국 : 자유의 여신상", "공구상자", "정전_타이머x", "정전", "숫자",
+          "타워 크레인", "시소", "키보드", "소마큐브", "몽키", "체인링", "ABC", "카드지갑",
+          "링 2", "대한민국 : 첨성대"]
+GRAB_OBJECTS = ["Bomb", "C", "TopSurface", "Bomb (1)", "CrossRingBomb", "UpperBody",
+                "root", "Bomb (2)", "BombWeight", "Movable", "GameObject", "Cube (2)"]
+BOMB_NAMES = ["Bomb", "Bomb (1)", "Bomb (2)", "BombWeight", "0", "1", "Bomb (4)", "Bomb (8)"]
+ZOOM_VALUES = ["1.000", "-1.000", "0.000", "-3.000"]
+
+# 한 스테이지 시도 안에서 다음 행동을 고르는 가중치 (실측 이벤트 빈도 비율)
+_ACTIONS = ["grab", "zoom", "tilt", "pushpull", "rotate", "pan", "bomb", "warn"]
+_WEIGHTS = [10.8, 3.0, 9.7, 8.6, 6.7, 1.0, 1.2, 0.3]
+
+HEADER = "\ufeffLogType,Timestamp,Key,Value\n"
+
+
+class _Writer:
+    def __init__(self, start: datetime, rng: random.Random):
+        self.t = start
+        self.rng = rng
+        self.lines: list[str] = []
+
+    def emit(self, key: str, value: str, level: str = "INFO", dt: float = 0.0):
+        self.t += timedelta(seconds=dt)
+        ts = self.t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{self.t.microsecond // 1000:03d}"
+        self.lines.append(f"{level},{ts},{key},{value}\n")
+
+    def gap(self, lo: float = 0.1, hi: float = 3.0) -> float:
+        return self.rng.uniform(lo, hi)
+
+
+def _emit_action(w: _Writer, action: str):
+    rng = w.rng
+    if action == "grab":
+        obj = rng.choice(GRAB_OBJECTS)
+        w.emit("InputGrab", obj, dt=w.gap())
+        if rng.random() < 0.97:  # 나머지는 Break 없는 고아 Grab
+            w.emit("InputGrabBreak", obj, dt=w.gap(0.1, 1.5))
+    elif action == "zoom":
+        for _ in range(rng.randint(2, 8)):  # 휠 연속 입력
+            w.emit("CameraZoom", rng.choice(ZOOM_VALUES), dt=w.gap(0.01, 0.15))
+    elif action == "tilt":
+        w.emit("SeesawTilt", f'"Angle:{rng.uniform(0, 8):.2f}"', dt=w.gap(0.05, 0.5))
+    elif action == "pushpull":
+        w.emit("InputPushPull", rng.choice(GRAB_OBJECTS), dt=w.gap())
+    elif action == "rotate":
+        w.emit("CameraRotate", f'"({rng.uniform(-180, 180):.2f},{rng.uniform(-30, 30):.2f})"',
+               dt=w.gap(0.1, 2.0))
+    elif action == "pan":
+        w.emit("CameraPanning", f'"({rng.uniform(-1, 1):.2f},{rng.uniform(-1, 1):.2f})"',
+               dt=w.gap(0.1, 2.0))
+    elif action == "bomb":
+        b = rng.choice(BOMB_NAMES)
+        w.emit(f"폭탄 {b}을(를) 감지했습니다.", "True", dt=w.gap())
+        w.emit(f"충돌 감지: {b} 즉시 폭발 처리 (CollisionExplosion 모드)", "True", dt=0.001)
+        w.emit(f"[ClimaxController] 폭발 처리 모드: CollisionExplosion for {b}", "1", dt=0.001)
+        w.emit(f"[BombManager] 폭탄 {b}이(가) 폭발했습니다.", "1")
+        # 실제 로그처럼 따옴표 없는 좌표 -> 필드 수 초과 줄 (파서가 건너뜀)
+        w.emit(f"[ClimaxController] 폭탄 폭발: {b} at ({rng.uniform(-50, 50):.2f}, "
+               f"{rng.uniform(-50, 50):.2f}, {rng.uniform(-90, 0):.2f})", "1", dt=0.001)
+        w.emit("[climax]폭발 요청 폭발 진행", "True")
+    else:
+        if rng.random() < 0.5:
+            w.emit("OrbitOrthoProxy", "Orthographic 카메라가 아닙니다. 이 Proxy는 동작하지 않습니다.",
+                   level="WARNING", dt=w.gap())
+        else:
+            w.emit("MissingManager", "[ClearManager] GameManager가 없어 GameClear 로깅 실패",
+                   level="WARNING", dt=w.gap())
+
+
+def generate_player_day(player: int, day: date, events: int, seed: int = 0) -> str:
+    """
+    플레이어 하나의 하루치 CSV 텍스트(헤더 포함)를 만듭니다. 대략 events 행이 될 때까지
+    StageBegin -> (행동들 + StageRetry) -> StageClear/StageExit 시도를 이어 씁니다.
+    """
+    rng = random.Random(f"{seed}:{day.isoformat()}:{player}")
+    start = datetime(day.year, day.month, day.day, 18) + timedelta(seconds=rng.uniform(0, 4 * 3600))
+    w = _Writer(start, rng)
+    stage_idx = 0
+    while len(w.lines) < events:
+        stage = STAGES[stage_idx % len(STAGES)] if rng.random() < 0.8 else rng.choice(STAGES)
+        w.emit("StageBegin", stage, dt=w.gap(2, 10))
+        if rng.random() < 0.1:
+            w.emit("SequentialBombInit", "초기화 완료 | 총 블록 개수: 10개", dt=0.01)
+            w.emit("StageConfigSetup", "StageConfig를 Manual 모드로 설정하세요. 목표 폭탄 개수: 10개")
+            for i in range(rng.randint(1, 4)):
+                w.emit("BlockToBomb", f"{i} (Index: {i})", dt=w.gap(0.5, 2))
+        if rng.random() < 0.05:
+            continue  # StageBegin만 남기고 바로 다른 스테이지로 (미종료 시도)
+        for action in rng.choices(_ACTIONS, _WEIGHTS, k=rng.randint(5, 60)):
+            if rng.random() < 0.01:
+                w.emit("StageRetry", stage, dt=w.gap())
+            _emit_action(w, action)
+        if rng.random() < 0.2:
+            w.emit("StageExit", "1", dt=w.gap())
+        else:
+            w.emit("StageStar", str(rng.choices([0, 1, 2, 3], [1, 2, 3, 4])[0]), dt=w.gap())
+            w.emit("StageClear", stage)
+            stage_idx += 1
+    return HEADER + "".join(w.lines)
+
+
+def generate_dataset(out_dir: Path, players: int = 13, days: int = 1, events: int = 1500,
+                     seed: int = 0, start: date = date(2025, 11, 1)) -> list[Path]:
+    """
+    out_dir/YYYY-MM-DD/Player_<n>_YYYYMMDD.csv 형태(DATA/와 같음)로 합성 로그를 씁니다.
+    이미 같은 내용이 있으면 다시 쓰지 않으므로 반복 실행해도 mtime이 바뀌지 않습니다.
+    """
+    out_dir = Path(out_dir)
+    paths = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        day_dir = out_dir / day.isoformat()
+        day_dir.mkdir(parents=True, exist_ok=True)
+        for p in range(1, players + 1):
+            path = day_dir / f"Player_{p}_{day:%Y%m%d}.csv"
+            data = generate_player_day(p, day, events, seed).encode("utf-8")
+            if not path.exists() or path.read_bytes() != data:
+                path.write_bytes(data)
+            paths.append(path)
+    return paths
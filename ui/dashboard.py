@@ -11,31 +11,34 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from src.cache_manager import CacheManager
-from src.aggregator import (
-    global_stage_means,
-    earliest_3_distinct_grabs_for_stage_with_policy,
-    global_stage_exit_counts,
-    personal_stage_exit_counts,
-    personal_first_clear_stars,   # ★ 추가
-)
+from src import profiler
+from src.partitioned_cache import PartitionedCacheManager, from_config
+from src.file_watcher import start_watcher
+from src.query_service import LocalBackend, QueryClient, ServiceUnavailable
+from src.segment_metrics import mean_metrics
 
 st.set_page_config(page_title="Game Log Analyzer", layout="wide")
 
 # =============== 캐싱 최적화 ===============
 
 @st.cache_resource
-def get_cache_manager(config_path: str, data_root: str) -> CacheManager:
+def get_cache_manager(config_path: str, data_root: str) -> PartitionedCacheManager:
+    """DATA 루트 전체를 날짜 파티션으로 다루는 캐시 하나 (날짜는 조회될 때 읽고, 예산/TTL 초과 시 내림)"""
     cfg_file = Path(config_path)
     if cfg_file.exists():
         cfg = json.loads(cfg_file.read_text(encoding="utf-8"))
     else:
         cfg = {"data_dir": "./DATA", "file_pattern": "*.csv", 
                "assume_orphan_grab_counts_as_one": True}
-    cm = CacheManager(data_root, cfg.get("file_pattern", "*.csv"),
-                      cfg.get("assume_orphan_grab_counts_as_one", True))
-    cm.initial_load()
-    return cm
+    pcm = from_config(cfg, data_root, ROOT)
+    if cfg.get("watch", True):
+        # 바뀐 파일만 debounce 후 다시 읽음 (inotify 불가 시 polling)
+        pcm.watcher = start_watcher(pcm, debounce_ms=cfg.get("debounce_ms", 500))
+    return pcm
+
+@st.cache_resource
+def get_query_client(url: str) -> QueryClient:
+    return QueryClient(url)
 
 @st.cache_data(ttl=60)
 def get_date_dirs(base_path: str) -> list[str]:
@@ -45,34 +48,50 @@ def get_date_dirs(base_path: str) -> list[str]:
     return [p.name for p in sorted([d for d in base.iterdir() 
             if d.is_dir() and re.fullmatch(r"\d{4}-\d{2}-\d{2}", d.name)])]
 
-@st.cache_data(ttl=30)
-def load_all_data(_cm: CacheManager) -> tuple[pd.DataFrame, pd.DataFrame, list[str]]:
-    segs_all = _cm.all_segments()
-    raw_all = _cm.all_raw()
-    players = _cm.players()
-    return segs_all, raw_all, players
-
-@st.cache_data
-def compute_global_stats(segs_sel: pd.DataFrame, selected_players: list[str]) -> pd.DataFrame:
-    gmean = global_stage_means(segs_sel)
-    gexit = global_stage_exit_counts(segs_sel, selected_players)
-    return gmean.merge(gexit, on="stage", how="left")
-
-@st.cache_data
-def compute_personal_exits(segs_sel: pd.DataFrame, selected_players: list[str]) -> pd.DataFrame:
-    return personal_stage_exit_counts(segs_sel, selected_players)
-
-@st.cache_data
-def compute_personal_first_clear(segs_sel: pd.DataFrame, selected_players: list[str]) -> pd.DataFrame:
-    return personal_first_clear_stars(segs_sel, selected_players)
-
-@st.cache_data
-def compute_first_grabs(raw_all: pd.DataFrame, stage: str, 
-                        selected_players: list[str], policy: str) -> pd.DataFrame:
-    return earliest_3_distinct_grabs_for_stage_with_policy(
-        raw_all, stage=stage, selected_players=selected_players,
-        policy=policy, exclude_roots=True
-    )
+# 데이터 계층 캐시 키: (데이터 출처, 날짜, generation, 정렬된 플레이어 튜플).
+# 조회는 backend(조회 서비스 클라이언트 또는 이 프로세스의 LocalBackend)로 실행하고,
+# backend는 _ 접두 인자로 넘겨 Streamlit이 해시하지 않음.
+# generation은 파일이 다시 읽힐 때만 바뀌므로, 바뀐 날짜의 항목만 적중하지 않고
+# 다른 날짜/플레이어 조합의 항목은 그대로 남음 (오래된 항목은 max_entries로 밀려남).
+# 출처는 서비스 인스턴스별로 달라 서비스 재시작/직접 로딩 전환 시 generation 값이 겹쳐도 섞이지 않음
+_DATA_CACHE = dict(max_entries=64, show_spinner=False)
+
+def data_key(info: dict, date: str, players: list[str]) -> tuple[str, str, int, tuple[str, ...]]:
+    return info["source"], date, info["generation"], tuple(sorted(players))
+
+@st.cache_data(**_DATA_CACHE)
+def select_segments(source: str, date: str, generation: int, players: tuple[str, ...],
+                    _backend) -> pd.DataFrame:
+    return _backend.query(date, "segments", list(players))
+
+# 전역 지표/첫 클리어 별은 CacheManager.stage_store의 플레이어별 부분 집계를 병합 (세그먼트 재스캔 없음)
+@st.cache_data(**_DATA_CACHE)
+def compute_global_stats(source: str, date: str, generation: int, players: tuple[str, ...],
+                         _backend) -> pd.DataFrame:
+    return _backend.query(date, "global_stats", list(players))
+
+@st.cache_data(**_DATA_CACHE)
+def compute_stage_quantiles(source: str, date: str, generation: int, players: tuple[str, ...],
+                            _backend) -> pd.DataFrame:
+    # 플레이어별 분위수 스케치 병합 (상대 오차 1% 이내 근사)
+    return _backend.query(date, "global_stage_quantiles", list(players))
+
+@st.cache_data(**_DATA_CACHE)
+def compute_personal_exits(source: str, date: str, generation: int, players: tuple[str, ...],
+                           _backend) -> pd.DataFrame:
+    return _backend.query(date, "personal_exit_counts", list(players))
+
+@st.cache_data(**_DATA_CACHE)
+def compute_personal_first_clear(source: str, date: str, generation: int, players: tuple[str, ...],
+                                 _backend) -> pd.DataFrame:
+    return _backend.query(date, "personal_first_clear", list(players))
+
+@st.cache_data(**_DATA_CACHE)
+def compute_first_grabs(source: str, date: str, generation: int, players: tuple[str, ...],
+                        _backend) -> pd.DataFrame:
+    # 모든 스테이지 × 정책을 한 번에 계산 (스테이지/탭 전환은 필터만).
+    # raw는 이어 붙이지 않고 플레이어별 프레임을 그대로 사용
+    return _backend.query(date, "first_grab_top3", list(players), exclude_roots=True)
 
 # =============== 설정 로딩 ===============
 cfg_path = str(ROOT / "config.json")
@@ -98,15 +117,43 @@ selected_date = st.sidebar.selectbox(
 date_root = (BASE_DATA_DIR / selected_date)
 date_root.mkdir(parents=True, exist_ok=True)
 
+def get_backend(date: str) -> tuple[QueryClient | LocalBackend, dict]:
+    """config.json의 query_service가 떠 있으면 그 서비스로, 아니면 이 프로세스에서 직접 로딩"""
+    url = base_cfg.get("query_service")
+    if url:
+        client = get_query_client(url)
+        try:
+            return client, client.info(date)
+        except ServiceUnavailable:
+            pass
+    local = LocalBackend(get_cache_manager(cfg_path, str(BASE_DATA_DIR)))
+    return local, local.info(date)
+
+# 켜 두면 로딩/분할/집계/st.cache_data 호출 시간을 이 세션의 기록기에 모아 맨 아래 진단 패널에 표시
+# (다른 브라우저 세션과 백그라운드 파일 감시 스레드는 기록하지 않음)
+if st.sidebar.checkbox("진단 프로파일링", value=False, key="profile"):
+    profiler.activate(st.session_state.setdefault("profiler", profiler.Recorder()))
+else:
+    profiler.activate(None)
+
 if st.sidebar.button("🔄 Refresh"):
-    st.cache_data.clear()
-    cm = get_cache_manager(cfg_path, str(date_root))
-    cm.refresh()
+    # 전역 cache_data.clear() 대신: 날짜 목록만 비우고, 바뀐 파일이 있으면 generation이 바뀌어
+    # 그 날짜의 데이터 캐시만 다시 계산됨
+    get_date_dirs.clear()
+    get_backend(selected_date)[0].refresh(selected_date)
     st.rerun()
 
 # =============== 데이터 적재 ===============
-cm = get_cache_manager(cfg_path, str(date_root))
-segs_all, raw_all, all_players = load_all_data(cm)
+backend, info = get_backend(selected_date)
+status = backend.status()
+where = "조회 서비스" if isinstance(backend, QueryClient) else "직접 로딩"
+st.sidebar.caption(f"{where} · 캐시 메모리 약 {status['memory_mb']:.0f} MB · "
+                   f"올라온 날짜 {len(status['loaded'])}개")
+kinds = status.get("memory_by_kind_mb")
+if kinds:  # raw 보관 방식별 절감 확인용 (이전 버전 서비스에는 없음)
+    st.sidebar.caption(f"보관 방식 {status['options'].get('retention', 'full')} · raw {kinds['raw']:.0f} MB · "
+                       f"그랩 표 {kinds['grabs']:.1f} MB · 세그먼트 {kinds['segments']:.1f} MB")
+all_players = info["players"]
 
 selected_players = st.sidebar.multiselect(
     "플레이어 선택", 
@@ -116,8 +163,9 @@ selected_players = st.sidebar.multiselect(
 )
 st.sidebar.write(f"선택 {len(selected_players)} / 전체 {len(all_players)}")
 
-segs_sel = (segs_all[segs_all["PlayerID"].isin(selected_players)] 
-            if selected_players else segs_all.iloc[0:0])
+# 이번 rerun의 모든 데이터 계산에 같은 키를 사용 (해시 대상은 문자열/정수/튜플뿐)
+key = data_key(info, selected_date, selected_players)
+segs_sel = select_segments(*key, backend)
 
 # KPI
 k1, k2 = st.columns([1,3])
@@ -131,28 +179,17 @@ metric_labels = {
     "mean_stage_play_time": "스테이지 플레이타임(초)",
     "mean_clear_time": "클리어타임(초)",
     "mean_first_clear_star": "첫 클리어 별(평균)",
-    "mean_retry": "리트라이 횟수",
     "exit_sum": "포기 횟수(합계)",
-    "mean_cam_total": "카메라 조작(통합)",
-    "mean_cam_move": "카메라 이동",
-    "mean_cam_rotate": "카메라 회전",
-    "mean_cam_pan": "카메라 패닝",
-    "mean_grab_pair": "그랩(세트)",
-    "mean_pushpull": "밀·당 횟수",
+    # 나머지는 segment_metrics 등록표에서 (새 지표를 등록하면 자동으로 추가됨)
+    **{m.mean: m.label for m in mean_metrics()},
 }
 
 metric_notes = {
     "mean_stage_play_time": "StageBegin ~ StageClear 시간(클리어된 시도만 평균).",
     "mean_clear_time": "마지막 StageRetry(있다면) ~ StageClear 시간(클리어된 시도만 평균).",
     "mean_first_clear_star": "플레이어×스테이지 단위로 '첫 클리어' 시 받은 별을 뽑아 스테이지별 평균.",
-    "mean_retry": "시도 내 StageRetry 발생 횟수 평균.",
     "exit_sum": "선택된 플레이어의 StageExit 시도 개수 합.",
-    "mean_cam_total": "줌/회전/패닝 이벤트 합의 평균.",
-    "mean_cam_move": "CameraZoom 횟수 평균.",
-    "mean_cam_rotate": "CameraRotate 횟수 평균.",
-    "mean_cam_pan": "CameraPanning 횟수 평균.",
-    "mean_grab_pair": "InputGrab~InputGrabBreak 한 쌍을 1회로 본 횟수 평균.",
-    "mean_pushpull": "InputPushPull 횟수 평균.",
+    **{m.mean: m.note for m in mean_metrics() if m.note},
 }
 
 def render_metric_help_inline(selected_key: str):
@@ -172,7 +209,7 @@ st.subheader("전체 지표(선택된 플레이어 기준)")
 if segs_sel.empty:
     st.info("표본이 없습니다. 선택한 날짜 폴더에 CSV를 넣고 Refresh 하세요.")
 else:
-    gstats = compute_global_stats(segs_sel, selected_players)
+    gstats = compute_global_stats(*key, backend)
     picked = st.selectbox(
         "지표 선택", 
         list(metric_labels.keys()), 
@@ -195,24 +232,20 @@ else:
     st.altair_chart(chart, use_container_width=True)
     render_metric_help_inline(picked)
 
-    kmap = {
-        "stage": "스테이지",
-        "n_players_used": "사용된 플레이어 수",
-        "mean_stage_play_time": "스테이지 플레이타임(초)",
-        "mean_clear_time": "클리어타임(초)",
-        "mean_first_clear_star": "첫 클리어 별(평균)",
-        "mean_retry": "리트라이 횟수",
-        "exit_sum": "포기 횟수(합계)",
-        "mean_cam_move": "카메라 이동",
-        "mean_cam_rotate": "카메라 회전",
-        "mean_cam_pan": "카메라 패닝",
-        "mean_cam_total": "카메라 조작(통합)",
-        "mean_grab_pair": "그랩(세트)",
-        "mean_pushpull": "밀·당 횟수",
-    }
+    kmap = {"stage": "스테이지", "n_players_used": "사용된 플레이어 수", **metric_labels}
     st.dataframe(gstats.rename(columns=kmap), use_container_width=True)
     render_metric_help_full()
 
+    with st.expander("분포: 중앙값 / p90", expanded=False):
+        quant = compute_stage_quantiles(*key, backend)
+        qmap = {"stage": "스테이지"}
+        for col, label in (("stage_play_time", "플레이타임(초)"), ("clear_time", "클리어타임(초)"),
+                           ("retry_cnt", "리트라이")):
+            qmap[f"{col}_p50"] = f"{label} 중앙값"
+            qmap[f"{col}_p90"] = f"{label} p90"
+        st.dataframe(quant.rename(columns=qmap), use_container_width=True)
+        st.caption("시도 단위 분포. 플레이어별 로그 버킷 스케치를 병합한 값이라 실제 값과 상대 오차 1% 이내로 다를 수 있습니다.")
+
 # =============== 스테이지별 첫 그랩 TOP3 ===============
 st.subheader("스테이지별 가장 먼저 집은 오브젝트")
 stages_fg = sorted(segs_sel["stage"].dropna().unique().tolist())
@@ -222,13 +255,12 @@ if not stages_fg:
 else:
     stage_fg = st.selectbox("Stage 선택(필수)", options=stages_fg, key="stage_fast3_policy")
     tabs = st.tabs(["가장 처음", "가장 최신", "최단 클리어"])
+    # span 시간 = st.cache_data 인자 해시 + (적중 실패 시) 계산
+    with profiler.span("dashboard.compute_first_grabs", rows=len(segs_sel)):
+        top3_all = compute_first_grabs(*key, backend)
 
     def _render_table(policy_key: str, tab_label: str):
-        df3 = compute_first_grabs(
-            raw_all, stage_fg, 
-            tuple(selected_players) if selected_players else None,
-            policy_key
-        )
+        df3 = top3_all[(top3_all["policy"] == policy_key) & (top3_all["stage"] == stage_fg)]
         if df3.empty:
             st.info(f"{tab_label}: 데이터가 없습니다.")
             return
@@ -280,8 +312,9 @@ if not selected_players:
     st.info("좌측에서 플레이어를 선택하세요.")
 else:
     tabs = st.tabs(selected_players)
-    pexit_all  = compute_personal_exits(segs_sel, tuple(selected_players))
-    pfirst_all = compute_personal_first_clear(segs_sel, tuple(selected_players))  # ★ 추가
+    with profiler.span("dashboard.compute_personal_exits", rows=len(segs_sel)):
+        pexit_all  = compute_personal_exits(*key, backend)
+    pfirst_all = compute_personal_first_clear(*key, backend)
 
     for tab, pid in zip(tabs, selected_players):
         with tab:
@@ -362,3 +395,15 @@ else:
                         .properties(height=260)
                     )
                     st.altair_chart(chart_p, use_container_width=True)
+
+# =============== 진단 ===============
+if profiler.is_enabled():
+    with st.expander("진단: 단계별 처리 시간", expanded=False):
+        if st.button("기록 초기화", key="profile_reset"):
+            profiler.reset()
+        st.caption(f"이 세션에서 실행한 파일별 파싱/분할, 캐시 로딩, 스냅샷 concat, 집계, st.cache_data 호출의 "
+                   f"최근 {profiler.MAX_RECORDS:,}개 기록 (백그라운드 파일 감시로 다시 읽은 파일은 제외).")
+        st.dataframe(profiler.summary(), use_container_width=True)
+        recs = pd.DataFrame(profiler.records())
+        if not recs.empty:
+            st.dataframe(recs.iloc[::-1].head(200), use_container_width=True)